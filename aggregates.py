@@ -0,0 +1,126 @@
+"""
+帳款資料查詢 / 銀行帳本查詢的匯總卡片：由資料庫計算總額（SUM ... FILTER），不載入資料列。
+查詢經 fetch_all 以 (SQL, 日期範圍, 搜尋字串) 為鍵快取，相關資料表寫入後才重新計算。
+沒有搜尋字串且已建立每日匯總表（migrations/0004）時，直接加總匯總表。
+"""
+import streamlit as st
+from db_config import fetch_all, get_cursor
+from pagination import summary_sql
+from queries import account_branches, ledger_branches, LEDGER_COLUMNS
+from search import search_condition, search_params
+
+# 匯總名稱 → 彙總運算式（欄位名稱為 queries 中各分支的輸出欄位）
+AR_METRICS = {
+    'count': "COUNT(*)",
+    'total_amount': "COALESCE(SUM(amount), 0)",
+    'total_fee': "COALESCE(SUM(fee), 0)",
+    # 實際未收金額 = SUM((金額 + 手續費) - 已收金額)，只計算繳費狀況不是「已收款」的帳款
+    'total_unpaid': """COALESCE(SUM(COALESCE(amount, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0))
+                       FILTER (WHERE payment_status != '已收款'), 0)""",
+    'unpaid_count': "COUNT(*) FILTER (WHERE payment_status != '已收款')",
+}
+PAYABLE_METRICS = {
+    'count': "COUNT(*)",
+    'total_amount': "COALESCE(SUM(amount), 0)",
+    'sales_amount': "COALESCE(SUM(amount) FILTER (WHERE payable_type = '業務'), 0)",
+    'service_amount': "COALESCE(SUM(amount) FILTER (WHERE payable_type = '維護'), 0)",
+}
+LEDGER_METRICS = {
+    'count': "COUNT(*)",
+    'total_income': "COALESCE(SUM(income), 0)",
+    'total_expense': "COALESCE(SUM(expense), 0)",
+    'net_amount': "COALESCE(SUM(income), 0) - COALESCE(SUM(expense), 0)",
+}
+
+# 每日匯總表的彙總運算式（名稱與上方相同；'' 為狀況是 NULL 的資料）
+AR_ROLLUP_METRICS = {
+    'count': "COALESCE(SUM(row_count), 0)::bigint",
+    'total_amount': "COALESCE(SUM(total_amount), 0)",
+    'total_fee': "COALESCE(SUM(total_fee), 0)",
+    'total_unpaid': """COALESCE(SUM(total_amount + total_fee - total_received)
+                       FILTER (WHERE payment_status NOT IN ('已收款', '')), 0)""",
+    'unpaid_count': "COALESCE(SUM(row_count) FILTER (WHERE payment_status NOT IN ('已收款', '')), 0)::bigint",
+}
+PAYABLE_ROLLUP_METRICS = {
+    'count': "COALESCE(SUM(row_count), 0)::bigint",
+    'total_amount': "COALESCE(SUM(total_amount), 0)",
+    'sales_amount': "COALESCE(SUM(total_amount) FILTER (WHERE payable_type = '業務'), 0)",
+    'service_amount': "COALESCE(SUM(total_amount) FILTER (WHERE payable_type = '維護'), 0)",
+}
+LEDGER_ROLLUP_METRICS = {
+    'count': "COALESCE(SUM(row_count), 0)::bigint",
+    'total_income': "COALESCE(SUM(total_income), 0)",
+    'total_expense': "COALESCE(SUM(total_expense), 0)",
+    'net_amount': "COALESCE(SUM(total_income), 0) - COALESCE(SUM(total_expense), 0)",
+}
+
+# 帳款類型 → 匯總表篩選條件（與 queries 中各分支的條件相同）
+ROLLUP_STATUS_CONDITIONS = {
+    "總應收帳款": None,
+    "總未收帳款": "payment_status NOT IN ('已收款', '')",
+    "未出帳款": "payment_status NOT IN ('已付款', '')",
+    "已出帳款": "payment_status = '已付款'",
+}
+
+@st.cache_resource(show_spinner=False, ttl=600)
+def has_rollups():
+    """資料庫是否已建立每日匯總表（每個行程檢查一次，10 分鐘後重新確認）"""
+    try:
+        with get_cursor() as cur:
+            cur.execute("""
+                SELECT to_regclass('ar_daily_rollup') IS NOT NULL
+                   AND to_regclass('payable_daily_rollup') IS NOT NULL
+                   AND to_regclass('bank_ledger_daily_rollup') IS NOT NULL
+            """)
+            return bool(cur.fetchone()[0])
+    except Exception:
+        return False
+
+def rollup_metrics(rollup, metrics, params, tables, condition=None):
+    """
+    加總每日匯總表（日期範圍內最多幾千列），回傳 {匯總名稱: 值}。
+    tables 為原始資料表：匯總表由觸發器更新，快取依原始資料表的寫入失效。
+    """
+    conditions = [c for c in [condition] if c]
+    if 'from_date' in params:
+        conditions.append("day BETWEEN %(from_date)s AND %(to_date)s")
+    sql = f"SELECT {', '.join(metrics.values())} FROM {rollup} WHERE {' AND '.join(conditions) or 'TRUE'}"
+    row = fetch_all(sql, params, tables=tables)[0]
+    return dict(zip(metrics, row))
+
+def with_search(branches, params, search_term):
+    """
+    在各查詢分支加上 pg_trgm 搜尋條件（與 search.ranked_search_sql 的比對相同，但不限筆數）。
+    呼叫前需確認 has_trgm_search()；沒有搜尋字串時原樣回傳。
+    """
+    if not search_term:
+        return branches, params
+    branches = [branch._replace(where=f"({branch.where}) AND {search_condition(branch.table)}")
+                for branch in branches]
+    return branches, {**params, **search_params(search_term)}
+
+def query_metrics(branches, columns, metrics, params):
+    """對查詢分支執行一次彙總查詢，回傳 {匯總名稱: 值}"""
+    row = fetch_all(summary_sql(branches, columns, ", ".join(metrics.values())), params)[0]
+    return dict(zip(metrics, row))
+
+def account_metrics(ar_type, params, search_term=None):
+    """帳款資料查詢的匯總（日期範圍與搜尋條件同頁面）"""
+    if not search_term and has_rollups():
+        if ar_type in ["未出帳款", "已出帳款"]:
+            return rollup_metrics('payable_daily_rollup', PAYABLE_ROLLUP_METRICS, params,
+                                  ['contracts_leasing', 'contracts_buyout'], ROLLUP_STATUS_CONDITIONS[ar_type])
+        return rollup_metrics('ar_daily_rollup', AR_ROLLUP_METRICS, params,
+                              ['ar_leasing', 'ar_buyout'], ROLLUP_STATUS_CONDITIONS[ar_type])
+
+    branches, columns = account_branches(ar_type, params)
+    branches, params = with_search(branches, params, search_term)
+    metrics = PAYABLE_METRICS if ar_type in ["未出帳款", "已出帳款"] else AR_METRICS
+    return query_metrics(branches, columns, metrics, params)
+
+def ledger_metrics(params, search_term=None):
+    """銀行帳本查詢的匯總（日期範圍與搜尋條件同頁面）"""
+    if not search_term and has_rollups():
+        return rollup_metrics('bank_ledger_daily_rollup', LEDGER_ROLLUP_METRICS, params, ['bank_ledger'])
+    branches, params = with_search(ledger_branches(params), params, search_term)
+    return query_metrics(branches, LEDGER_COLUMNS, LEDGER_METRICS, params)
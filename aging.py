@@ -0,0 +1,71 @@
+"""
+應收帳款帳齡分析：未收款帳款依帳齡（基準日 - 帳款日期）分組加總，全部在資料庫計算。
+帳款日期：租賃以期間起始日、買斷以成交日期計；日期為空的帳款只計入未收總額。
+"""
+from exports import write_workbook
+
+# 未收款的應收帳款（使用 0001 的部分索引 WHERE payment_status <> '已收款'）
+OPEN_AR_SQL = """
+    SELECT a.customer_code, a.customer_name, c.sales_company_code, a.start_date AS due_date,
+           COALESCE(a.total_rent, 0) + COALESCE(a.fee, 0) - COALESCE(a.received_amount, 0) AS balance
+    FROM ar_leasing a
+    LEFT JOIN contracts_leasing c ON c.contract_code = a.contract_code
+    WHERE a.payment_status != '已收款'
+    UNION ALL
+    SELECT a.customer_code, a.customer_name, c.sales_company_code, a.deal_date,
+           COALESCE(a.total_amount, 0) + COALESCE(a.fee, 0) - COALESCE(a.received_amount, 0)
+    FROM ar_buyout a
+    LEFT JOIN contracts_buyout c ON c.contract_code = a.contract_code
+    WHERE a.payment_status != '已收款'
+"""
+
+# 帳齡區間：(欄位名稱, 顯示名稱, 條件)；o.age = 基準日 - 帳款日期（天）
+AGING_BUCKETS = [
+    ('not_due', '未到期', "o.age < 0"),
+    ('days_0_30', '0–30 天', "o.age BETWEEN 0 AND 30"),
+    ('days_31_60', '31–60 天', "o.age BETWEEN 31 AND 60"),
+    ('days_61_90', '61–90 天', "o.age BETWEEN 61 AND 90"),
+    ('days_over_90', '90 天以上', "o.age > 90"),
+]
+
+# 分組方式 → (顯示名稱, 鍵欄位, 名稱欄位, 額外 JOIN, 欄位標題)
+AGING_GROUPS = {
+    'customer': ("依客戶", "o.customer_code", "MAX(o.customer_name)", "", ['客戶代碼', '客戶名稱']),
+    'sales_company': ("依業務公司", "o.sales_company_code", "MAX(m.name)",
+                      "LEFT JOIN companies m ON m.company_code = o.sales_company_code",
+                      ['業務公司代碼', '業務公司名稱']),
+}
+
+AGING_COLUMNS = ['code', 'name'] + [name for name, _, _ in AGING_BUCKETS] + ['total', 'row_count']
+
+def aging_header(group):
+    return AGING_GROUPS[group][4] + [label for _, label, _ in AGING_BUCKETS] + ['未收總額', '筆數']
+
+def aging_sql(group):
+    """帳齡分析查詢（參數：as_of 基準日），欄位順序同 AGING_COLUMNS，依未收總額由大到小排序"""
+    _, key, name, join, _ = AGING_GROUPS[group]
+    buckets = ",\n           ".join(
+        f"COALESCE(SUM(o.balance) FILTER (WHERE {condition}), 0) AS {column}"
+        for column, _, condition in AGING_BUCKETS
+    )
+    return f"""
+        SELECT {key}, {name},
+               {buckets},
+               SUM(o.balance) AS total, COUNT(*) AS row_count
+        FROM (
+            SELECT open_ar.*, %(as_of)s::date - open_ar.due_date AS age
+            FROM ({OPEN_AR_SQL}) AS open_ar
+        ) AS o
+        {join}
+        GROUP BY {key}
+        ORDER BY total DESC, {key}
+    """
+
+def build_aging_workbook(as_of, progress):
+    """匯出帳齡分析（依客戶、依業務公司兩個工作表）"""
+    params = {'as_of': as_of}
+    return write_workbook(
+        [(label, aging_header(group), aging_sql(group), params)
+         for group, (label, *_) in AGING_GROUPS.items()],
+        progress
+    )
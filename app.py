@@ -1,6 +1,115 @@
 import streamlit as st
+from query_panel import query_debug_panel
+from datetime import datetime
+from db_config import get_pool_stats, get_query_stats, SLOW_QUERY_MS
+from query_cache import get_query_cache
+from cache_listener import start_cache_listener
+from kpi import get_kpi_refresher
 
 st.set_page_config(page_title="印表機記帳平台", page_icon="📊", layout="wide")
+query_debug_panel("首頁")
 
 # 首頁
 st.title("📊 首頁")
+
+# ============================================
+# KPI（背景定期計算的快照，開啟首頁不需查詢資料庫）
+# ============================================
+kpi_refresher = get_kpi_refresher()
+kpi = kpi_refresher.snapshot
+
+if kpi is None:
+    if kpi_refresher.last_error:
+        st.error(f"❌ 無法計算 KPI：{kpi_refresher.last_error}")
+    else:
+        st.info("⏳ KPI 計算中，請稍後重新整理")
+else:
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("💰 未收帳款", f"NT$ {kpi['outstanding_ar']:,.0f}", f"{kpi['outstanding_ar_count']:,} 筆", delta_color="off")
+    col2.metric("⏰ 逾期未收", f"NT$ {kpi['overdue_ar']:,.0f}", f"{kpi['overdue_ar_count']:,} 筆", delta_color="off")
+    col3.metric("🧾 未出帳款（業務）", f"NT$ {kpi['unpaid_sales']:,.0f}")
+    col4.metric("🔧 未出帳款（維護）", f"NT$ {kpi['unpaid_service']:,.0f}")
+
+    col1, col2, col3, col4 = st.columns(4)
+    month_net = kpi['month_net']
+    col1.metric("🏦 本月銀行淨額", f"NT$ {month_net:,.0f}",
+                delta=f"{month_net:+,.0f}" if month_net != 0 else None)
+    col2.metric("📄 租賃合約", f"{kpi['leasing_contracts']:,}", f"進行中 {kpi['active_leasing_contracts']:,}", delta_color="off")
+    col3.metric("🤝 買斷合約", f"{kpi['buyout_contracts']:,}")
+
+    age_minutes = (datetime.now() - kpi_refresher.refreshed_at).total_seconds() / 60
+    col_age, col_refresh = st.columns([5, 1])
+    with col_age:
+        st.caption(
+            f"資料時間：{kpi_refresher.refreshed_at.strftime('%Y-%m-%d %H:%M:%S')}"
+            f"（{age_minutes:.0f} 分鐘前，每 {kpi_refresher.interval_seconds / 60:g} 分鐘自動更新）"
+            + (f"　⚠️ 最近一次更新失敗：{kpi_refresher.last_error}" if kpi_refresher.last_error else "")
+        )
+    with col_refresh:
+        if st.button("🔄 立即更新", use_container_width=True, key="refresh_kpi"):
+            kpi_refresher.refresh_now()
+            st.toast("已要求更新 KPI，稍後重新整理即可看到最新數字")
+
+st.divider()
+
+# ============================================
+# 連線池狀態（調整連線池大小用）
+# ============================================
+with st.expander("🔧 連線池狀態"):
+    try:
+        pool_stats = get_pool_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("使用中 / 上限", f"{pool_stats['in_use']} / {pool_stats['pool_max']}")
+        col2.metric("等待中", pool_stats['waiting'])
+        col3.metric("借用延遲 p95", f"{pool_stats['checkout_p95_ms']:.1f} ms")
+        col4.metric("借用延遲最大", f"{pool_stats['checkout_max_ms']:.1f} ms")
+        st.json(pool_stats, expanded=False)
+    except Exception as e:
+        st.error(f"❌ 無法取得連線池狀態：{e}")
+
+# ============================================
+# 查詢快取狀態
+# ============================================
+with st.expander("🗃️ 查詢快取狀態"):
+    cache_stats = get_query_cache().stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("快取筆數", cache_stats['entries'])
+    col2.metric("記憶體用量", f"{cache_stats['bytes'] / 1024 / 1024:.1f} / {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    total_lookups = cache_stats['hits'] + cache_stats['misses']
+    col3.metric("命中率", f"{cache_stats['hits'] / total_lookups:.0%}" if total_lookups else "-")
+    col4.metric("淘汰 / 失效", f"{cache_stats['evictions']} / {cache_stats['invalidations']}")
+
+    listener = start_cache_listener()
+    if listener is None:
+        st.caption("跨行程快取失效監聽：已停用")
+    else:
+        listener_status = listener.status()
+        state = "🟢 已連線" if listener_status['connected'] else f"🔴 未連線（{listener_status['last_error'] or '連線中'}）"
+        st.caption(f"跨行程快取失效監聽：{state}，已處理 {listener_status['notify_count']} 筆異動通知")
+
+# ============================================
+# 查詢統計（依累計時間排序；慢查詢的 JSON 與 EXPLAIN 記錄在 miracle.slow_query logger）
+# ============================================
+with st.expander("🐢 查詢統計"):
+    query_summary = get_query_stats().summary()
+    if not query_summary:
+        st.caption("尚無查詢記錄")
+    else:
+        st.caption(f"超過 {SLOW_QUERY_MS:,.0f} ms 的查詢會記錄在 miracle.slow_query（含 EXPLAIN）")
+        st.dataframe(
+            [
+                {
+                    '查詢': fp,
+                    '次數': totals['count'],
+                    '累計 (ms)': round(totals['total_ms'], 1),
+                    '平均 (ms)': round(totals['total_ms'] / totals['count'], 1),
+                    '最長 (ms)': round(totals['max_ms'], 1),
+                    '筆數': totals['rows'],
+                    '錯誤': totals['errors'],
+                    'SQL': totals['sql'][:200],
+                }
+                for fp, totals in query_summary
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
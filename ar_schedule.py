@@ -0,0 +1,247 @@
+"""
+租賃應收帳款排程：先在記憶體中算出各期帳款，再一次寫入資料庫
+
+    python ar_schedule.py --regenerate            # 重新產生全部租賃合約的應收帳款
+    python ar_schedule.py --regenerate L001 L002  # 只重新產生指定合約
+    python ar_schedule.py --regenerate --server   # 改用資料庫函式 generate_leasing_ar 產生
+    python ar_schedule.py --verify                # 比對 leasing_periods 與資料庫函式 leasing_ar_periods
+"""
+import argparse
+import calendar
+import random
+import sys
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+
+AR_LEASING_COLUMNS = ('contract_code', 'customer_code', 'customer_name', 'start_date', 'end_date',
+                      'total_rent', 'fee', 'received_amount', 'payment_status')
+
+INSERT_LEASING_AR = f"""
+    INSERT INTO ar_leasing ({', '.join(AR_LEASING_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(AR_LEASING_COLUMNS))})
+"""
+
+# 可重新產生的租賃帳款：未收款、沒有已收金額，也沒有被對帳紀錄引用（reconciliation_matches.ar_id 沒有外鍵）。
+# 其餘帳款保留，重新產生時不會重設收款資料或留下指向已刪除帳款的對帳紀錄
+DELETE_UNSETTLED_LEASING_AR = """
+    DELETE FROM ar_leasing a
+    WHERE a.contract_code = ANY(%s)
+      AND a.payment_status = '未收' AND COALESCE(a.received_amount, 0) = 0
+      AND NOT EXISTS (SELECT 1 FROM reconciliation_matches m WHERE m.ar_type = '租賃' AND m.ar_id = a.id)
+    RETURNING a.id, a.contract_code, a.start_date, a.fee
+"""
+
+RegenerateResult = namedtuple('RegenerateResult', ['contracts', 'rows', 'kept'])
+
+# 產生應收帳款需要的合約欄位（順序與 leasing_ar_rows 的參數相同）
+LEASING_CONTRACTS_SQL = """
+    SELECT contract_code, customer_code, customer_name, start_date,
+           monthly_rent, payment_cycle_months, contract_months
+    FROM contracts_leasing
+"""
+
+def leasing_periods(start_date, monthly_rent, payment_cycle_months, contract_months):
+    """
+    計算租賃合約各期的 (起始日, 結束日, 租金)。
+    每期為 payment_cycle_months 個月，不足一個週期的剩餘月數成為最後一期；
+    下一期的起始日 = 本期結束日 + 1天（與資料庫函式 leasing_ar_periods 相同）。
+    """
+    if not payment_cycle_months or not contract_months or contract_months < 0:
+        return []
+
+    periods = []
+    period_start = start_date
+    for month_from in range(0, contract_months, payment_cycle_months):
+        months = min(payment_cycle_months, contract_months - month_from)
+        # 結束日期 = 起始日 + 月數 - 1天
+        period_end = period_start + relativedelta(months=months, days=-1)
+        periods.append((
+            period_start,
+            period_end,
+            monthly_rent * months if monthly_rent is not None else None,
+        ))
+        period_start = period_end + relativedelta(days=1)
+    return periods
+
+def leasing_ar_rows(contract_code, customer_code, customer_name, start_date,
+                    monthly_rent, payment_cycle_months, contract_months):
+    """租賃合約的應收帳款資料列（欄位順序同 AR_LEASING_COLUMNS）"""
+    return [
+        (contract_code, customer_code, customer_name, period_start, period_end, rent, 0, 0, '未收')
+        for period_start, period_end, rent in leasing_periods(
+            start_date, monthly_rent, payment_cycle_months, contract_months
+        )
+    ]
+
+def clear_unsettled_ar(cur, contract_codes):
+    """
+    刪除合約中可重新產生的帳款（DELETE_UNSETTLED_LEASING_AR）。
+    回傳 (刪除的主鍵, {(合約編號, 起始日): 原手續費}, 保留帳款的 {(合約編號, 起始日)})
+    """
+    cur.execute(DELETE_UNSETTLED_LEASING_AR, (list(contract_codes),))
+    deleted, fees = set(), {}
+    for row_id, contract_code, start_date, fee in sorted(cur.fetchall()):
+        deleted.add(row_id)
+        fees.setdefault((contract_code, start_date), fee)
+    cur.execute("SELECT contract_code, start_date FROM ar_leasing WHERE contract_code = ANY(%s)",
+                (list(contract_codes),))
+    return deleted, fees, set(cur.fetchall())
+
+def pending_ar_rows(rows, fees, kept):
+    """排程中還沒有保留帳款的各期（起始日相同視為同一期），沿用同一期原本的手續費"""
+    return [row[:6] + (fees.get((row[0], row[3])) or 0,) + row[7:]
+            for row in rows if (row[0], row[3]) not in kept]
+
+def write_leasing_ar(cur, contract_code, rows):
+    """
+    依新的排程重新產生合約的應收帳款：已收款或已對帳的帳款保留，其餘各期刪除後重新寫入
+    （executemany 會以 pipeline 批次送出，不必逐筆等待回應）。
+    回傳刪除與新增的帳款主鍵（供 invalidate_rows 使用）。
+    """
+    changed, fees, kept = clear_unsettled_ar(cur, [contract_code])
+    rows = pending_ar_rows(rows, fees, kept)
+    if rows:
+        cur.executemany(INSERT_LEASING_AR, rows)
+        cur.execute("SELECT id FROM ar_leasing WHERE contract_code = %s", (contract_code,))
+        changed.update(row[0] for row in cur.fetchall())
+    return changed
+
+def regenerate_leasing_ar(conn, contract_codes=None, progress=None, progress_every=200):
+    """
+    重新產生租賃應收帳款（在呼叫端的交易中執行）：已收款或已對帳的帳款保留，
+    其餘帳款刪除後以 COPY 寫入排程中還沒有保留帳款的各期（沿用原本的手續費）。
+    contract_codes 為 None 時處理全部租賃合約；progress(已處理合約數, 合約總數) 用於回報進度。
+    回傳 RegenerateResult(合約數, 新寫入的應收帳款筆數, 保留的帳款筆數)。
+    """
+    with conn.cursor() as cur:
+        if contract_codes is None:
+            cur.execute(LEASING_CONTRACTS_SQL + " ORDER BY contract_code")
+        else:
+            cur.execute(LEASING_CONTRACTS_SQL + " WHERE contract_code = ANY(%s) ORDER BY contract_code",
+                        (list(contract_codes),))
+        contracts = cur.fetchall()
+        if not contracts:
+            return RegenerateResult(0, 0, 0)
+
+        _, fees, kept = clear_unsettled_ar(cur, [contract[0] for contract in contracts])
+
+        row_count = 0
+        with cur.copy(f"COPY ar_leasing ({', '.join(AR_LEASING_COLUMNS)}) FROM STDIN") as copy:
+            for done, contract in enumerate(contracts, 1):
+                for row in pending_ar_rows(leasing_ar_rows(*contract), fees, kept):
+                    copy.write_row(row)
+                    row_count += 1
+                if progress and (done % progress_every == 0 or done == len(contracts)):
+                    progress(done, len(contracts))
+
+    return RegenerateResult(len(contracts), row_count, len(kept))
+
+def regenerate_leasing_ar_server(conn, contract_codes=None):
+    """
+    在資料庫端重新產生租賃應收帳款（migrations/0011 的 generate_leasing_ar，保留已收款的帳款，規則同 regenerate_leasing_ar）。
+    contract_codes 為 None 時處理全部租賃合約；回傳應收帳款筆數。
+    """
+    with conn.cursor() as cur:
+        if contract_codes is None:
+            cur.execute("SELECT generate_leasing_ar(ARRAY(SELECT contract_code FROM contracts_leasing))")
+        else:
+            cur.execute("SELECT generate_leasing_ar(%s::varchar[])", (list(contract_codes),))
+        return cur.fetchone()[0]
+
+# ============================================
+# Python 與資料庫函式的一致性檢查
+# ============================================
+def random_cases(count, seed=None):
+    """
+    隨機產生 (起始日, 月租金, 繳費週期, 合約月數)，偏重月底、閏年、
+    週期不整除合約月數與空值等邊界情況
+    """
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        year, month = rng.randint(2000, 2040), rng.randint(1, 12)
+        last_day = calendar.monthrange(year, month)[1]
+        day = min(rng.choice([1, 15, 28, 29, 30, 31, rng.randint(1, 31)]), last_day)
+        monthly_rent = rng.choice([None, Decimal(rng.randint(0, 5000000)) / 100])
+        payment_cycle_months = rng.choice([None, 0, 1, 2, 3, 6, 12, rng.randint(1, 24)])
+        contract_months = rng.choice([None, 0, rng.randint(1, 24), rng.randint(1, 120)])
+        cases.append((date(year, month, day), monthly_rent, payment_cycle_months, contract_months))
+    return cases
+
+def contract_cases(conn):
+    """現有租賃合約的排程參數"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT start_date, monthly_rent, payment_cycle_months, contract_months
+            FROM contracts_leasing
+        """)
+        return cur.fetchall()
+
+def compare_with_database(conn, cases):
+    """以資料庫函式 leasing_ar_periods 計算每個案例，回傳與 leasing_periods 不一致的 [(案例, Python, SQL)]"""
+    if not cases:
+        return []
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT t.case_no, p.period_start, p.period_end, p.period_rent
+            FROM unnest(%s::int[], %s::date[], %s::numeric[], %s::int[], %s::int[])
+                 AS t(case_no, start_date, monthly_rent, payment_cycle_months, contract_months)
+            CROSS JOIN LATERAL leasing_ar_periods(t.start_date, t.monthly_rent,
+                                                  t.payment_cycle_months, t.contract_months) AS p
+            ORDER BY t.case_no, p.period_start
+        """, [list(range(len(cases))), *(list(column) for column in zip(*cases))])
+        sql_periods = defaultdict(list)
+        for case_no, *period in cur.fetchall():
+            sql_periods[case_no].append(tuple(period))
+
+    mismatches = []
+    for case_no, case in enumerate(cases):
+        expected = leasing_periods(*case)
+        if expected != sql_periods[case_no]:
+            mismatches.append((case, expected, sql_periods[case_no]))
+    return mismatches
+
+def main(argv=None):
+    import psycopg
+    from db_config import get_database_config
+
+    parser = argparse.ArgumentParser(description="租賃應收帳款排程")
+    parser.add_argument('--regenerate', nargs='*', metavar='CONTRACT_CODE',
+                        help="重新產生應收帳款（未指定合約編號時處理全部租賃合約）")
+    parser.add_argument('--server', action='store_true', help="使用資料庫函式 generate_leasing_ar 產生")
+    parser.add_argument('--verify', action='store_true', help="比對 Python 與資料庫函式的排程結果")
+    parser.add_argument('--cases', type=int, default=5000, help="--verify 隨機案例數")
+    parser.add_argument('--seed', type=int, default=None, help="--verify 隨機種子")
+    args = parser.parse_args(argv)
+
+    with psycopg.connect(**get_database_config()) as conn:
+        if args.verify:
+            seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+            cases = random_cases(args.cases, seed) + contract_cases(conn)
+            mismatches = compare_with_database(conn, cases)
+            for case, expected, actual in mismatches[:20]:
+                print(f"❌ {case}\n   Python: {expected}\n   SQL:    {actual}")
+            print(f"{'❌' if mismatches else '✅'} {len(cases)} 個案例（seed={seed}），{len(mismatches)} 個不一致")
+            return 1 if mismatches else 0
+
+        if args.regenerate is None:
+            parser.print_help()
+            return 1
+
+        if args.server:
+            rows = regenerate_leasing_ar_server(conn, args.regenerate or None)
+            print(f"✅ 已重新產生 {rows} 筆應收帳款")
+            return 0
+
+        def report(done, total):
+            print(f"\r已處理 {done}/{total} 份合約", end='', flush=True)
+
+        result = regenerate_leasing_ar(conn, args.regenerate or None, progress=report)
+    print(f"\n✅ 已重新產生 {result.contracts} 份合約、{result.rows} 筆應收帳款，保留 {result.kept} 筆已收款或已對帳的帳款")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
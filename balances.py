@@ -0,0 +1,58 @@
+"""
+銀行帳本餘額欄位：依 (txn_date, id) 順序累計 SUM(收入 - 支出) 的結果。
+
+每筆記錄的餘額 = 所在月份的期初餘額 + 當月 1 日至該筆為止的 SUM(income - expense) OVER (ORDER BY txn_date, id)。
+已建立 migrations/0007 時期初餘額取自 bank_ledger_balance_checkpoints（失效時由資料庫補算），
+只需讀取頁面資料列所在月份的資料；未建立時改為加總該月以前的所有記錄。
+"""
+import streamlit as st
+from db_config import fetch_all, get_cursor
+
+# 期初餘額運算式（m.month 為月份第一天）
+CHECKPOINT_OPENING = "bank_ledger_opening_balance(m.month)"
+SCAN_OPENING = """(SELECT COALESCE(SUM(COALESCE(income, 0) - COALESCE(expense, 0)), 0)
+                   FROM bank_ledger WHERE txn_date < m.month)"""
+
+def balance_sql(opening):
+    """
+    指定帳本記錄的餘額：[(id, balance)]（參數：ids）；每個月份只讀取月初到該月最後一筆指定記錄。
+    月份清單以 MATERIALIZED 先算好期初餘額：否則子查詢會被併入 JOIN，期初餘額改為每個資料列計算一次。
+    """
+    return f"""
+        WITH m AS MATERIALIZED (
+            SELECT m.month, m.last_date, {opening} AS opening
+            FROM (
+                SELECT date_trunc('month', txn_date)::date AS month, MAX(txn_date) AS last_date
+                FROM bank_ledger
+                WHERE id = ANY(%(ids)s)
+                GROUP BY 1
+            ) AS m
+        )
+        SELECT id, balance
+        FROM (
+            SELECT b.id,
+                   m.opening + SUM(COALESCE(b.income, 0) - COALESCE(b.expense, 0))
+                       OVER (PARTITION BY m.month ORDER BY b.txn_date, b.id) AS balance
+            FROM m
+            JOIN bank_ledger b ON b.txn_date BETWEEN m.month AND m.last_date
+        ) AS t
+        WHERE id = ANY(%(ids)s)
+    """
+
+@st.cache_resource(show_spinner=False, ttl=600)
+def has_balance_checkpoints():
+    """資料庫是否已建立每月期初餘額（每個行程檢查一次，10 分鐘後重新確認）"""
+    try:
+        with get_cursor() as cur:
+            cur.execute("SELECT to_regclass('bank_ledger_balance_checkpoints') IS NOT NULL")
+            return bool(cur.fetchone()[0])
+    except Exception:
+        return False
+
+def running_balances(ids):
+    """帳本記錄 id → 餘額（依 bank_ledger 快取，帳本寫入後重新計算）"""
+    ids = sorted({int(i) for i in ids})
+    if not ids:
+        return {}
+    opening = CHECKPOINT_OPENING if has_balance_checkpoints() else SCAN_OPENING
+    return dict(fetch_all(balance_sql(opening), {'ids': ids}, tables=['bank_ledger']))
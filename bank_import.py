@@ -0,0 +1,287 @@
+"""
+銀行對帳單（CSV / XLSX）批次匯入銀行帳本
+
+對帳單逐列讀取、解析後以 COPY 寫入暫存表，再以單一 INSERT ... SELECT 寫入 bank_ledger，
+數萬筆也只需幾秒。重複判斷依內容雜湊（0006 的 bank_ledger_content_hash）：
+同一天相同內容的交易以出現次數比對，帳本已有 n 筆時只寫入第 n+1 筆之後的部分，
+因此同一份對帳單重複匯入（或與手動新增的記錄重疊）不會產生重複資料。
+
+    python bank_import.py 對帳單.csv --encoding cp950
+    python bank_import.py 對帳單.xlsx --skip-rows 3 --column payer=摘要 --column note=附言
+    python bank_import.py 對帳單.csv --dry-run       # 只解析並顯示欄位對應，不寫入
+"""
+import argparse
+import csv
+import io
+import re
+import sys
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+# 帳本欄位 → (顯示名稱, 對帳單常見的欄位標題)
+IMPORT_FIELDS = {
+    'txn_date': ("日期", ['日期', '交易日期', '交易日', '記帳日', '帳務日期', '入帳日期']),
+    'payer': ("匯款人", ['匯款人', '戶名', '對方戶名', '摘要', '交易摘要']),
+    'expense': ("支出金額", ['支出金額', '支出', '提款', '提款金額', '轉出']),
+    'income': ("收入金額", ['收入金額', '收入', '存款', '存入', '存入金額', '轉入']),
+    'note': ("備註", ['備註', '附言', '說明', '備考']),
+}
+
+# 對帳單編碼 → 顯示名稱（台灣的銀行常提供 Big5 編碼的 CSV）
+ENCODINGS = {'utf-8-sig': "UTF-8", 'cp950': "Big5 (cp950)"}
+
+# 每寫入多少筆回報一次進度
+PROGRESS_ROWS = 5000
+
+ImportResult = namedtuple('ImportResult', ['parsed', 'inserted', 'duplicates', 'skipped', 'ids'])
+
+STAGING_SQL = """
+    CREATE TEMP TABLE bank_import_staging (
+        line_no INT NOT NULL,
+        txn_date DATE NOT NULL,
+        payer TEXT,
+        expense NUMERIC(12,2) NOT NULL,
+        income NUMERIC(12,2) NOT NULL,
+        note TEXT
+    ) ON COMMIT DROP
+"""
+
+# 對帳單中第 k 筆相同內容的交易，只有在帳本中相同內容少於 k 筆時才寫入
+IMPORT_SQL = """
+    WITH staged AS (
+        SELECT s.*, bank_ledger_content_hash(s.txn_date, s.payer, s.expense, s.income, s.note) AS content_hash
+        FROM bank_import_staging s
+    ), numbered AS (
+        SELECT staged.*, row_number() OVER (PARTITION BY content_hash ORDER BY line_no) AS occurrence
+        FROM staged
+    ), existing AS (
+        SELECT bank_ledger_content_hash(b.txn_date, b.payer, b.expense, b.income, b.note) AS content_hash,
+               COUNT(*) AS existing_count
+        FROM bank_ledger b
+        WHERE bank_ledger_content_hash(b.txn_date, b.payer, b.expense, b.income, b.note)
+              IN (SELECT content_hash FROM staged)
+        GROUP BY 1
+    )
+    INSERT INTO bank_ledger (txn_date, payer, expense, income, note)
+    SELECT n.txn_date, n.payer, n.expense, n.income, n.note
+    FROM numbered n
+    LEFT JOIN existing e USING (content_hash)
+    WHERE n.occurrence > COALESCE(e.existing_count, 0)
+    ORDER BY n.line_no
+    RETURNING id
+"""
+
+DATE_PATTERN = re.compile(r'^(\d{2,4})[-/.](\d{1,2})[-/.](\d{1,2})')
+
+def statement_kind(file_name):
+    """依副檔名判斷對帳單格式（csv / xlsx）"""
+    suffix = Path(file_name).suffix.lower()
+    if suffix in ('.csv', '.txt'):
+        return 'csv'
+    if suffix in ('.xlsx', '.xlsm'):
+        return 'xlsx'
+    raise ValueError(f"不支援的對帳單格式：{suffix or file_name}")
+
+def _iter_csv(file, encoding, skip_rows):
+    text = io.TextIOWrapper(file, encoding=encoding, newline='')
+    try:
+        reader = csv.reader(text)
+        for cells in reader:
+            if reader.line_num > skip_rows:
+                yield reader.line_num, cells
+    finally:
+        # 不關閉上傳的檔案物件（表頭預覽後還要重新讀取）
+        text.detach()
+
+def _iter_xlsx(file, skip_rows):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for line_no, cells in enumerate(workbook.active.iter_rows(values_only=True), start=1):
+            if line_no > skip_rows:
+                yield line_no, list(cells)
+    finally:
+        workbook.close()
+
+def iter_statement(file, kind, encoding='utf-8-sig', skip_rows=0):
+    """逐列讀取對帳單，回傳 (列號, 儲存格) 的 generator；第一列為表頭"""
+    file.seek(0)
+    if kind == 'csv':
+        return _iter_csv(file, encoding, skip_rows)
+    return _iter_xlsx(file, skip_rows)
+
+def read_header(file, kind, encoding='utf-8-sig', skip_rows=0):
+    rows = iter_statement(file, kind, encoding, skip_rows)
+    try:
+        _, header = next(rows, (None, []))
+    finally:
+        rows.close()
+    file.seek(0)
+    return [str(cell).strip() if cell is not None else '' for cell in header]
+
+def guess_mapping(header):
+    """依欄位標題猜測對應（完全相同優先，其次為包含），回傳 {帳本欄位: 欄位索引或 None}"""
+    mapping = {}
+    for field, (_, aliases) in IMPORT_FIELDS.items():
+        exact = [i for i, title in enumerate(header) if title in aliases]
+        partial = [i for i, title in enumerate(header) if any(alias in title for alias in aliases)]
+        candidates = [i for i in exact + partial if i not in mapping.values()]
+        mapping[field] = candidates[0] if candidates else None
+    return mapping
+
+def check_mapping(mapping):
+    if mapping.get('txn_date') is None:
+        raise ValueError("請指定「日期」欄位")
+    if mapping.get('expense') is None and mapping.get('income') is None:
+        raise ValueError("請至少指定「支出金額」或「收入金額」其中一個欄位")
+
+def parse_date(value):
+    """日期：date / datetime、YYYY-MM-DD、YYYY/MM/DD、YYYYMMDD 與民國年（113/01/05、1130105）"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    match = DATE_PATTERN.match(text)
+    if match:
+        year, month, day = map(int, match.groups())
+    elif text.isdigit() and len(text) in (7, 8):
+        year, month, day = int(text[:-4]), int(text[-4:-2]), int(text[-2:])
+    else:
+        raise ValueError(f"無法辨識的日期：{text}")
+    if year < 1911:
+        year += 1911  # 民國年
+    return date(year, month, day)
+
+def parse_amount(value):
+    """金額：去除千分位、貨幣符號；空白為 0；括號或負號一律取絕對值（有些銀行以負數表示支出）"""
+    if value is None:
+        return Decimal('0.00')
+    if isinstance(value, (int, float, Decimal)):
+        amount = Decimal(str(value))
+    else:
+        text = re.sub(r'[,\s$元]|NT', '', str(value)).strip('()')
+        if text in ('', '-'):
+            return Decimal('0.00')
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"無法辨識的金額：{value}")
+    return abs(amount).quantize(Decimal('0.01'))
+
+def _text(value):
+    text = str(value).strip() if value is not None else ''
+    return text or None
+
+def parse_row(cells, mapping):
+    """將一列對帳單轉為 (txn_date, payer, expense, income, note)；日期空白的列回傳 None（表尾合計等）"""
+    def cell(field):
+        index = mapping.get(field)
+        return cells[index] if index is not None and index < len(cells) else None
+
+    raw_date = cell('txn_date')
+    if _text(raw_date) is None:
+        return None
+    return (parse_date(raw_date), _text(cell('payer')), parse_amount(cell('expense')),
+            parse_amount(cell('income')), _text(cell('note')))
+
+def import_statement(conn, rows, mapping, progress=None):
+    """
+    匯入對帳單（rows 為不含表頭的 (列號, 儲存格)），全部在同一個交易中完成。
+    無法解析或收支皆為 0 的列略過並記錄在 ImportResult.skipped [(列號, 原因)]；ImportResult.ids 為新增的主鍵。
+    """
+    check_mapping(mapping)
+    parsed, skipped = 0, []
+    with conn.transaction(), conn.cursor() as cur:
+        # 同時只允許一個匯入（避免兩個匯入都判斷為不重複而各寫一次），一般新增 / 編輯只會短暫等待
+        cur.execute("LOCK TABLE bank_ledger IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute(STAGING_SQL)
+        with cur.copy("COPY bank_import_staging (line_no, txn_date, payer, expense, income, note) FROM STDIN") as copy:
+            for line_no, cells in rows:
+                try:
+                    row = parse_row(cells, mapping)
+                except ValueError as e:
+                    skipped.append((line_no, str(e)))
+                    continue
+                if row is None:
+                    continue
+                if not row[2] and not row[3]:
+                    skipped.append((line_no, "收入與支出皆為 0"))
+                    continue
+                copy.write_row((line_no, *row))
+                parsed += 1
+                if progress and parsed % PROGRESS_ROWS == 0:
+                    progress(parsed)
+        # 暫存表沒有統計資料，先 ANALYZE 讓重複判斷使用內容雜湊索引
+        cur.execute("ANALYZE bank_import_staging")
+        cur.execute(IMPORT_SQL)
+        ids = [row[0] for row in cur.fetchall()]
+    return ImportResult(parsed, len(ids), parsed - len(ids), skipped, ids)
+
+def _column_mapping(header, overrides):
+    mapping = guess_mapping(header)
+    for override in overrides:
+        field, _, title = override.partition('=')
+        if field not in IMPORT_FIELDS:
+            raise ValueError(f"未知的帳本欄位：{field}（可用：{', '.join(IMPORT_FIELDS)}）")
+        if title and title not in header:
+            raise ValueError(f"對帳單沒有「{title}」欄位")
+        mapping[field] = header.index(title) if title else None
+    return mapping
+
+def main(argv=None):
+    import psycopg
+    from db_config import get_database_config
+
+    parser = argparse.ArgumentParser(description="匯入銀行對帳單（CSV / XLSX）到銀行帳本")
+    parser.add_argument('statement', help="對帳單檔案")
+    parser.add_argument('--encoding', choices=list(ENCODINGS), default='utf-8-sig', help="CSV 編碼")
+    parser.add_argument('--skip-rows', type=int, default=0, help="表頭前要略過的列數")
+    parser.add_argument('--column', action='append', default=[], metavar='欄位=標題',
+                        help=f"指定欄位對應（{', '.join(IMPORT_FIELDS)}；標題留空表示不匯入）")
+    parser.add_argument('--dry-run', action='store_true', help="只解析並顯示欄位對應，不寫入")
+    args = parser.parse_args(argv)
+
+    kind = statement_kind(args.statement)
+    with open(args.statement, 'rb') as file:
+        header = read_header(file, kind, args.encoding, args.skip_rows)
+        try:
+            mapping = _column_mapping(header, args.column)
+            check_mapping(mapping)
+        except ValueError as e:
+            parser.error(str(e))
+        for field, (label, _) in IMPORT_FIELDS.items():
+            index = mapping[field]
+            print(f"{label}：{header[index] if index is not None else '（不匯入）'}", file=sys.stderr)
+
+        rows = iter_statement(file, kind, args.encoding, args.skip_rows)
+        next(rows, None)  # 表頭
+
+        if args.dry_run:
+            parsed, skipped = 0, 0
+            for line_no, cells in rows:
+                try:
+                    parsed += parse_row(cells, mapping) is not None
+                except ValueError as e:
+                    skipped += 1
+                    print(f"第 {line_no} 列：{e}", file=sys.stderr)
+            print(f"可匯入 {parsed:,} 筆，無法解析 {skipped:,} 筆")
+            return 0
+
+        def report(rows_written):
+            print(f"\r已讀取 {rows_written:,} 筆", end='', file=sys.stderr, flush=True)
+
+        with psycopg.connect(**get_database_config()) as conn:
+            result = import_statement(conn, rows, mapping, report)
+    print(file=sys.stderr)
+
+    for line_no, reason in result.skipped:
+        print(f"第 {line_no} 列略過：{reason}", file=sys.stderr)
+    print(f"新增 {result.inserted:,} 筆，重複 {result.duplicates:,} 筆，略過 {len(result.skipped):,} 筆")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
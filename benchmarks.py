@@ -0,0 +1,294 @@
+"""
+各資料規模下的頁面查詢與匯出效能測試，結果寫成 JSON（可跨 commit 比較）
+
+每個案例執行與頁面相同的查詢與轉換（fetch_frame / fetch_page / 匯總 / 顯示格式化），
+執行前讓查詢快取失效（等同資料寫入後的第一次重新執行），另外記錄緊接著的快取命中執行時間。
+資料庫來回次數取自 db_config 的查詢記錄。
+
+    python benchmarks.py --scale small medium large     # 依序載入各規模合成資料後測試（會清空資料表！）
+    python benchmarks.py --current                      # 不載入資料，測試資料庫目前的內容
+    python benchmarks.py --scale large --skip-exports --output before.json
+    python benchmarks.py --scale large --compare before.json   # 與先前的結果比較
+    python benchmarks.py --scale large --compare benchmark_results/large.json
+
+benchmark_results/<規模>.json 為各規模已提交的結果（單一 CPU、資料庫在同一台機器），作為比較基準；
+更新時以 --scale <規模> --output benchmark_results/<規模>.json 重新產生。
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from db_config import get_cursor, get_query_stats
+from query_cache import get_query_cache
+from frames import fetch_frame, frame_from_rows
+from display import format_columns, format_money, select_label
+from search import has_trgm_search, ranked_search_sql, search_params
+from search_index import filter_with_index, match_mask
+from pagination import union_sql, fetch_page
+from aggregates import account_metrics, ledger_metrics
+from balances import running_balances
+from queries import account_branches, ledger_branches, list_query, LEDGER_COLUMNS
+from aging import AGING_BUCKETS, AGING_COLUMNS, AGING_GROUPS, aging_sql, build_aging_workbook
+from exports import build_accounts_workbook, build_ledger_workbook
+from reconcile import load_deposits, load_open_items, propose_matches
+from synthetic_data import SCALES, TABLES, load_synthetic_data, scale_counts, table_counts
+
+# 與帳款 / 銀行帳本頁面的預設每頁筆數相同
+PAGE_SIZE = 50
+
+# 跳頁案例的頁碼（固定頁碼，各規模的結果可以互相比較）
+JUMP_PAGE = 100
+
+# 與先前結果比較時，中位數變慢超過此比例標示為退步
+COMPARE_THRESHOLD = 1.2
+
+def _list_frame(table, search_term=None):
+    """客戶 / 公司 / 合約頁面：全部資料或搜尋結果（依頁面的 pg_trgm / 記憶體索引分支）"""
+    use_sql_search = bool(search_term) and has_trgm_search()
+    sql, columns = list_query(table, search=use_sql_search)
+    df = fetch_frame(sql, search_params(search_term) if use_sql_search else None, columns)
+    if search_term and not use_sql_search:
+        df = filter_with_index(df, table, search_term)
+    return df
+
+def customers_page(ctx, search_term=None):
+    return len(_list_frame('customers', search_term))
+
+def companies_page(ctx, search_term=None):
+    df = _list_frame('companies', search_term)
+    display_df = df.copy()
+    is_sales = display_df['is_sales'].fillna(False).astype(bool)
+    is_service = display_df['is_service'].fillna(False).astype(bool)
+    display_df['公司類型'] = select_label([is_sales & is_service, is_sales, is_service], ["業務+維護", "業務", "維護"])
+    return len(df)
+
+def leasing_contracts_page(ctx, search_term=None):
+    df = _list_frame('contracts_leasing', search_term)
+    display_df = df.rename(columns={'start_date': '起始日', 'monthly_rent': '月租金',
+                                    'sales_amount': '業務金額', 'service_amount': '維護金額'})
+    format_columns(display_df, money=['月租金', '業務金額', '維護金額'], dates=['起始日'])
+    return len(df)
+
+def accounts_page(ctx, ar_type, page=1):
+    """帳款資料查詢：匯總 + 第 page 頁（keyset 分頁，跳頁時由第 1 頁往後找）+ 格式化"""
+    branches, columns = account_branches(ar_type, {})
+    account_metrics(ar_type, {})
+    df_paged = frame_from_rows(fetch_page(branches, {}, page, PAGE_SIZE, {1: None}), columns)
+    display_df = df_paged.rename(columns={'date': '日期', 'amount': '金額'})
+    format_columns(display_df, money=['金額'], dates=['日期'])
+    return len(df_paged)
+
+def accounts_search(ctx, ar_type):
+    """帳款資料查詢的搜尋（pg_trgm 或載入全部帳款後以記憶體索引篩選）"""
+    branches, columns = account_branches(ar_type, {})
+    term = ctx['search_term']
+    if has_trgm_search():
+        account_metrics(ar_type, {}, term)
+        return len(fetch_frame(ranked_search_sql(branches), search_params(term), columns))
+    df = fetch_frame(union_sql(branches), {}, columns).sort_values('contract_code')
+    mask = (((df['type'] == '租賃') & match_mask(df, 'ar_leasing', term)) |
+            ((df['type'] == '買斷') & match_mask(df, 'ar_buyout', term)))
+    return int(mask.sum())
+
+def ledger_page(ctx, page=1):
+    """銀行帳本查詢：匯總 + 第 page 頁 + 餘額欄位 + 格式化"""
+    branches = ledger_branches({})
+    ledger_metrics({})
+    df_paged = frame_from_rows(fetch_page(branches, {}, page, PAGE_SIZE, {1: None}, descending=True), LEDGER_COLUMNS)
+    display_df = df_paged.rename(columns={'txn_date': '日期', 'expense': '支出金額', 'income': '收入金額'})
+    display_df['餘額'] = df_paged['id'].map(running_balances(df_paged['id'].tolist()))
+    format_columns(display_df, money=['餘額'], dates=['日期'], positive_money=['支出金額', '收入金額'])
+    return len(df_paged)
+
+def ledger_search(ctx):
+    branches = ledger_branches({})
+    term = ctx['search_term']
+    if has_trgm_search():
+        ledger_metrics({}, term)
+        return len(fetch_frame(ranked_search_sql(branches, descending=True), search_params(term), LEDGER_COLUMNS))
+    df = fetch_frame(union_sql(branches), {}, LEDGER_COLUMNS).sort_values(['txn_date', 'id'], ascending=False)
+    return len(filter_with_index(df, 'bank_ledger', term))
+
+def aging_page(ctx, group):
+    df = fetch_frame(aging_sql(group), {'as_of': ctx['today']}, AGING_COLUMNS,
+                     kinds={column: 'money' for column, _, _ in AGING_BUCKETS})
+    display_df = df.copy()
+    for column in [column for column, _, _ in AGING_BUCKETS] + ['total']:
+        display_df[column] = format_money(display_df[column].to_numpy())
+    return len(df)
+
+def reconcile_proposals(ctx):
+    """自動對帳：近 90 天收入（頁面預設範圍）的配對建議"""
+    with get_cursor() as cur:
+        deposits = load_deposits(cur, ctx['today'] - timedelta(days=90), ctx['today'])
+        open_items = load_open_items(cur, deposits)
+    return len(propose_matches(deposits, open_items))
+
+def _workbook_size(build, *args):
+    output = build(*args, lambda fraction, message: None)
+    try:
+        output.seek(0, 2)
+        return output.tell()
+    finally:
+        output.close()
+
+# (名稱, 函式)；函式回傳結果筆數
+PAGE_BENCHMARKS = [
+    ("客戶資料查詢", customers_page),
+    ("客戶資料查詢（搜尋）", lambda ctx: customers_page(ctx, ctx['search_term'])),
+    ("公司資料查詢", companies_page),
+    ("合約資料查詢（租賃）", leasing_contracts_page),
+    ("合約資料查詢（租賃搜尋）", lambda ctx: leasing_contracts_page(ctx, ctx['search_term'])),
+    *[(f"帳款資料查詢（{ar_type}）", lambda ctx, ar_type=ar_type: accounts_page(ctx, ar_type))
+      for ar_type in ["總應收帳款", "總未收帳款", "未出帳款", "已出帳款"]],
+    (f"帳款資料查詢（總應收帳款第 {JUMP_PAGE} 頁）", lambda ctx: accounts_page(ctx, "總應收帳款", JUMP_PAGE)),
+    ("帳款資料查詢（總應收帳款搜尋）", lambda ctx: accounts_search(ctx, "總應收帳款")),
+    ("銀行帳本查詢", ledger_page),
+    (f"銀行帳本查詢（第 {JUMP_PAGE} 頁）", lambda ctx: ledger_page(ctx, JUMP_PAGE)),
+    ("銀行帳本查詢（搜尋）", ledger_search),
+    *[(f"帳齡分析（{label}）", lambda ctx, group=group: aging_page(ctx, group))
+      for group, (label, *_) in AGING_GROUPS.items()],
+    ("自動對帳（配對建議）", reconcile_proposals),
+]
+
+# 匯出回傳檔案大小（bytes）
+EXPORT_BENCHMARKS = [
+    ("匯出帳款 Excel", lambda ctx: _workbook_size(build_accounts_workbook, None, None)),
+    ("匯出銀行帳本 Excel", lambda ctx: _workbook_size(build_ledger_workbook, None, None)),
+    ("匯出帳齡分析 Excel", lambda ctx: _workbook_size(build_aging_workbook, ctx['today'])),
+]
+
+def run_benchmark(name, function, ctx, repeat):
+    """
+    執行 repeat 次（每次先讓查詢快取失效）後再執行一次快取命中的版本，
+    回傳 {'name', 'result', 'runs', 'min', 'median', 'queries', 'warm'}（時間單位為秒）
+    """
+    cache = get_query_cache()
+    stats = get_query_stats()
+    runs, queries = [], []
+    result = None
+    for _ in range(max(repeat, 1)):
+        cache.invalidate(*TABLES)
+        before = stats.query_count
+        started = time.perf_counter()
+        result = function(ctx)
+        runs.append(time.perf_counter() - started)
+        queries.append(stats.query_count - before)
+
+    started = time.perf_counter()
+    function(ctx)
+    warm = time.perf_counter() - started
+    return {
+        'name': name,
+        'result': result,
+        'runs': [round(run, 4) for run in runs],
+        'min': round(min(runs), 4),
+        'median': round(statistics.median(runs), 4),
+        'queries': max(queries),
+        'warm': round(warm, 4),
+    }
+
+def run_suite(ctx, repeat=3, export_repeat=1, skip_exports=False):
+    results = []
+    benchmarks = [(name, function, repeat) for name, function in PAGE_BENCHMARKS]
+    if not skip_exports:
+        benchmarks += [(name, function, export_repeat) for name, function in EXPORT_BENCHMARKS]
+    for name, function, times in benchmarks:
+        result = run_benchmark(name, function, ctx, times)
+        results.append(result)
+        print(f"   {name:<32}{result['median']:>9.3f} 秒{result['warm']:>9.3f} 秒（快取）"
+              f"{result['queries']:>5} 次查詢{result['result']:>12,}")
+    return results
+
+def git_revision():
+    """目前的 commit 與是否有未提交的修改（不是 git 目錄時為 None）"""
+    root = Path(__file__).parent
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(report, baseline):
+    """列出與 baseline 相同規模、相同案例的中位數比例，回傳退步的案例數"""
+    regressions = 0
+    for scale, current in report['scales'].items():
+        previous = {result['name']: result for result in baseline.get('scales', {}).get(scale, {}).get('results', [])}
+        if not previous:
+            continue
+        print(f"\n📊 {scale}：與 {(baseline.get('git') or {}).get('commit', '')[:10]} 比較")
+        for result in current['results']:
+            old = previous.get(result['name'])
+            if old is None or not old['median']:
+                continue
+            ratio = result['median'] / old['median']
+            regressed = ratio > COMPARE_THRESHOLD
+            regressions += regressed
+            print(f"   {'❌' if regressed else '✅'} {result['name']:<32}{old['median']:>9.3f} → {result['median']:.3f} 秒"
+                  f"（×{ratio:.2f}）查詢 {old['queries']} → {result['queries']}")
+    return regressions
+
+def main(argv=None):
+    import psycopg
+    from db_config import get_database_config
+
+    parser = argparse.ArgumentParser(description="頁面查詢與匯出的效能測試")
+    parser.add_argument('--scale', nargs='+', choices=SCALES, default=['small'],
+                        help="依序載入的資料規模（會清空資料表並載入合成資料）")
+    parser.add_argument('--current', action='store_true', help="不載入資料，測試資料庫目前的內容")
+    parser.add_argument('--seed', type=int, default=0, help="合成資料的隨機種子")
+    parser.add_argument('--repeat', type=int, default=3, help="每個頁面案例執行次數（取中位數）")
+    parser.add_argument('--export-repeat', type=int, default=1, help="每個匯出案例執行次數")
+    parser.add_argument('--skip-exports', action='store_true', help="不測試 Excel 匯出")
+    parser.add_argument('--search', default="宏達科技", help="搜尋案例使用的關鍵字")
+    parser.add_argument('--output', help="結果 JSON 檔（預設 benchmark-<commit>.json）")
+    parser.add_argument('--compare', metavar='BASELINE', help="與先前的結果 JSON 比較")
+    args = parser.parse_args(argv)
+
+    revision = git_revision()
+    report = {
+        'git': revision,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': {'repeat': args.repeat, 'export_repeat': args.export_repeat, 'page_size': PAGE_SIZE,
+                     'jump_page': JUMP_PAGE, 'search': args.search, 'seed': args.seed},
+        'scales': {},
+    }
+    ctx = {'today': date.today(), 'search_term': args.search}
+
+    with psycopg.connect(**get_database_config(), autocommit=True) as conn:
+        report['postgres'] = conn.info.server_version
+        for scale in ['current'] if args.current else args.scale:
+            load_seconds = None
+            if scale != 'current':
+                print(f"📦 載入 {scale} 規模資料...")
+                started = time.perf_counter()
+                load_synthetic_data(conn, scale_counts(scale), seed=args.seed, today=ctx['today'])
+                load_seconds = round(time.perf_counter() - started, 2)
+            counts = table_counts(conn)
+            print(f"⏱️  {scale}：" + "、".join(f"{table} {rows:,}" for table, rows in counts.items()))
+            report['scales'][scale] = {
+                'counts': counts,
+                'load_seconds': load_seconds,
+                'results': run_suite(ctx, args.repeat, args.export_repeat, args.skip_exports),
+            }
+
+    output = Path(args.output or f"benchmark-{(revision or {}).get('commit', 'local')[:10]}.json")
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding='utf-8')
+    print(f"\n✅ 結果已寫入 {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        return 1 if compare_results(report, baseline) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
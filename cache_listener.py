@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import threading
+import time
+import psycopg
+import streamlit as st
+from query_cache import get_query_cache
+
+logger = logging.getLogger(__name__)
+
+# 與 migrations/0000_table_change_notify.sql 的 notify_table_change()（逐列）、
+# 0010_truncate_notify.sql 的 notify_table_truncate()（TRUNCATE，不含主鍵）使用相同頻道
+NOTIFY_CHANNEL = 'table_changes'
+
+# 收集通知的時間窗（秒）；每個時間窗結束時統一清除快取，確保一秒內看到其他行程的寫入
+BATCH_SECONDS = 0.5
+
+# 斷線後重新連線的最長等待時間（秒）
+MAX_BACKOFF_SECONDS = 30
+
+class CacheInvalidationListener(threading.Thread):
+    """背景監聽資料表異動通知，清除本行程中引用該資料表的查詢快取"""
+
+    def __init__(self, cache, database_config, channel=NOTIFY_CHANNEL):
+        super().__init__(name="cache-invalidation-listener", daemon=True)
+        self.cache = cache
+        self.database_config = database_config
+        self.channel = channel
+        self.connected = False
+        self.notify_count = 0
+        self.last_notify_at = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        backoff = 1
+        while not self._stop_event.is_set():
+            try:
+                with psycopg.connect(**self.database_config, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {self.channel}")
+                    # 斷線期間可能漏掉通知，重新連線後整個快取失效
+                    self.cache.clear()
+                    self.connected = True
+                    backoff = 1
+                    while not self._stop_event.is_set():
+                        # 資料表 → 異動的主鍵（TRUNCATE 觸發程序等沒有主鍵的通知為 None，表示整個資料表）
+                        changed = {}
+                        count = 0
+                        for notify in conn.notifies(timeout=BATCH_SECONDS):
+                            table, row_id = self._parse(notify.payload)
+                            if not table:
+                                continue
+                            count += 1
+                            ids = changed.setdefault(table, set())
+                            if row_id is None:
+                                changed[table] = None
+                            elif ids is not None:
+                                ids.add(row_id)
+                        if changed:
+                            # 主鍵交給快取的異動記錄，記憶體搜尋索引只需重新讀取這些資料列
+                            self.cache.invalidate_rows(changed)
+                            self.notify_count += count
+                            self.last_notify_at = time.time()
+                            logger.debug("清除快取：%s", {table: len(ids) if ids is not None else '全部'
+                                                         for table, ids in changed.items()})
+            except Exception as e:
+                self.connected = False
+                self.last_error = str(e)
+                logger.warning("快取失效監聽中斷，%s 秒後重新連線：%s", backoff, e)
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+        self.connected = False
+
+    @staticmethod
+    def _parse(payload):
+        """解析通知內容，回傳 (資料表, 主鍵)；格式不符時回傳 (None, None)"""
+        try:
+            data = json.loads(payload)
+            return data['table'], data.get('id')
+        except (ValueError, KeyError, TypeError):
+            logger.warning("無法解析資料表異動通知：%s", payload)
+            return None, None
+
+    def status(self):
+        return {
+            'connected': self.connected,
+            'notify_count': self.notify_count,
+            'last_notify_at': self.last_notify_at,
+            'last_error': self.last_error,
+        }
+
+@st.cache_resource(show_spinner=False)
+def start_cache_listener():
+    """每個伺服器行程啟動一次監聽執行緒（CACHE_LISTENER_ENABLED=0 可停用）"""
+    if os.getenv('CACHE_LISTENER_ENABLED', '1') == '0':
+        return None
+
+    # 延後匯入，避免與 db_config 互相匯入
+    from db_config import get_database_config
+
+    listener = CacheInvalidationListener(get_query_cache(), get_database_config())
+    listener.start()
+    return listener
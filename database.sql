@@ -6,6 +6,10 @@ BEGIN
     IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'payment_status_enum') THEN
         CREATE TYPE payment_status_enum AS ENUM ('未收', '部分收款', '已收款');
     END IF;
+    -- 合約出帳狀況（業務 / 維護付款）
+    IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'buyout_payment_status_enum') THEN
+        CREATE TYPE buyout_payment_status_enum AS ENUM ('未付款', '部分付款', '已付款');
+    END IF;
 END$$;
 
 -- ===========================================
@@ -1,20 +1,44 @@
 import psycopg
+from psycopg_pool import ConnectionPool
 from contextlib import contextmanager
+from collections import deque, namedtuple, OrderedDict
+from functools import lru_cache
+from pathlib import Path
+import hashlib
+import json
+import logging
 import os
+import re
+import sys
+import threading
+import time
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from query_cache import get_query_cache, extract_tables, make_key
+from cache_listener import start_cache_listener
+
+def _secrets_section(name):
+    """讀取 Streamlit Secrets 的區段；沒有 secrets.toml 時（例如命令列工具）回傳 None"""
+    try:
+        if hasattr(st, 'secrets') and name in st.secrets:
+            return st.secrets[name]
+    except FileNotFoundError:
+        pass
+    return None
 
 def get_database_config():
     """取得資料庫連線設定 - 上線版本（使用環境變數或 Streamlit Secrets）"""
     try:
+        database = _secrets_section('database')
         # 優先使用 Streamlit Secrets（部署到 Streamlit Cloud 時）
-        if hasattr(st, 'secrets') and 'database' in st.secrets:
+        if database is not None:
             return {
-                'host': st.secrets['database']['host'],
-                'dbname': st.secrets['database']['dbname'],
-                'user': st.secrets['database']['user'],
-                'password': st.secrets['database']['password'],
-                'port': st.secrets['database']['port'],
-                'sslmode': st.secrets['database'].get('sslmode', 'require')
+                'host': database['host'],
+                'dbname': database['dbname'],
+                'user': database['user'],
+                'password': database['password'],
+                'port': database['port'],
+                'sslmode': database.get('sslmode', 'require')
             }
         # 其次使用環境變數（本地開發或其他部署環境）
         else:
@@ -29,24 +53,355 @@ def get_database_config():
     except Exception as e:
         raise RuntimeError(f"❌ 無法讀取資料庫設定：{e}")
 
+# 連線池預設值（秒）；可用 Secrets 的 [database_pool] 或 DB_POOL_* 環境變數覆寫
+POOL_DEFAULTS = {
+    'min_size': 2,          # 最少保留連線數
+    'max_size': 20,         # 最多連線數
+    'max_idle': 300.0,      # 閒置多久後關閉多餘連線
+    'max_lifetime': 1800.0, # 連線最長使用時間（到期後重建）
+    'timeout': 30.0,        # 借用連線最多等待時間
+}
+
+def get_pool_config():
+    """取得連線池設定（Streamlit Secrets 的 [database_pool] 或 DB_POOL_* 環境變數）"""
+    try:
+        source = dict(_secrets_section('database_pool') or {})
+
+        config = {}
+        for key, default in POOL_DEFAULTS.items():
+            value = source.get(key, os.getenv(f"DB_POOL_{key.upper()}", default))
+            config[key] = type(default)(value)
+        return config
+    except Exception as e:
+        raise RuntimeError(f"❌ 無法讀取連線池設定：{e}")
+
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    """建立整個伺服器行程共用的連線池（每個行程只建立一次）"""
+    try:
+        return ConnectionPool(
+            kwargs=get_database_config(),
+            configure=_configure_connection,
+            check=ConnectionPool.check_connection,  # 借出前檢查連線是否仍可用
+            name="miracle",
+            open=True,
+            **get_pool_config()
+        )
+    except Exception as e:
+        raise RuntimeError(f"❌ 建立資料庫連線池失敗：{e}")
+
+class _CheckoutStats:
+    """記錄借用連線的等待時間（毫秒）"""
+
+    def __init__(self, maxlen=1000):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=maxlen)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms):
+        with self._lock:
+            self._samples.append(elapsed_ms)
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total_ms, max_ms = self.count, self.total_ms, self.max_ms
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            'checkout_count': count,
+            'checkout_avg_ms': total_ms / count if count else 0.0,
+            'checkout_p50_ms': percentile(0.50),
+            'checkout_p95_ms': percentile(0.95),
+            'checkout_max_ms': max_ms,
+        }
+
+_checkout_stats = _CheckoutStats()
+
+# ============================================
+# 查詢記錄（每次 execute 的 fingerprint、參數型態、時間、筆數、呼叫頁面）
+# ============================================
+slow_query_logger = logging.getLogger('miracle.slow_query')
+
+# 超過此時間（毫秒）的查詢以 JSON 記錄在 miracle.slow_query（含 EXPLAIN）；可用 SLOW_QUERY_MS 環境變數覆寫
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 500))
+
+# 同一個查詢（fingerprint）最多每幾秒 EXPLAIN 一次
+EXPLAIN_INTERVAL_SECONDS = 300
+
+# 可以 EXPLAIN 的陳述式（EXPLAIN 不加 ANALYZE，不會實際執行）
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+# 字串 / 數字常數與參數佔位符一律視為 ?；IN (?, ?, ...) 視為 IN (?)
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+_PAGE_DIR = Path(__file__).resolve().parent / 'pages'
+_APP_FILE = Path(__file__).resolve().parent / 'app.py'
+
+QueryRecord = namedtuple('QueryRecord', ['fingerprint', 'sql', 'params_shape', 'elapsed_ms', 'rows', 'page', 'error'])
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """SQL 去掉常數與參數後的 (12 碼雜湊, 正規化文字)，相同形狀的查詢歸為同一類"""
+    normalized = ' '.join(_LIST_PATTERN.sub('(?)', _LITERAL_PATTERN.sub('?', sql)).split())
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:12], normalized
+
+def params_shape(params):
+    """參數的型態（不記錄數值）：{'from_date': 'date', 'ids': 'list[50]'}"""
+    def shape(value):
+        if isinstance(value, (list, tuple)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {name: shape(value) for name, value in params.items()}
+    return [shape(value) for value in params]
+
+def current_session_id():
+    """目前 Streamlit session 的 id（背景執行緒與命令列工具為 None）"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+def _calling_page():
+    """發出查詢的頁面與行號（pages/*.py 或 app.py）；不是由頁面發出時為執行緒名稱"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = Path(frame.f_code.co_filename)
+        if path.parent == _PAGE_DIR or path == _APP_FILE:
+            return f"{path.name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return threading.current_thread().name
+
+class QueryStats:
+    """查詢記錄：最近的查詢、各 fingerprint 的累計，以及各 session 每次重新執行的查詢（側邊欄除錯面板使用）"""
+
+    def __init__(self, recent=500, max_sessions=200, max_run_queries=1000):
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=recent)
+        self.by_fingerprint = {}
+        self.max_sessions = max_sessions
+        self.max_run_queries = max_run_queries
+        self._runs = OrderedDict()       # session_id → 目前這次重新執行 {'page', 'queries', 'cache_hits'}
+        self._last_runs = {}             # session_id → 上一次重新執行
+        self._explained_at = {}
+        self.query_count = 0             # 行程啟動以來的查詢數（效能測試以差值計算來回次數）
+
+    def record(self, record, session_id=None):
+        with self._lock:
+            self.query_count += 1
+            self.recent.append(record)
+            totals = self.by_fingerprint.setdefault(
+                record.fingerprint, {'sql': record.sql, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'errors': 0}
+            )
+            totals['count'] += 1
+            totals['total_ms'] += record.elapsed_ms
+            totals['max_ms'] = max(totals['max_ms'], record.elapsed_ms)
+            totals['rows'] += max(record.rows or 0, 0)
+            totals['errors'] += record.error is not None
+            run = self._runs.get(session_id)
+            if run is not None and len(run['queries']) < self.max_run_queries:
+                run['queries'].append(record)
+
+    def cache_hit(self, session_id=None):
+        """fetch_all / fetch_frame 命中快取（沒有查詢資料庫）"""
+        with self._lock:
+            run = self._runs.get(session_id)
+            if run is not None:
+                run['cache_hits'] += 1
+
+    def begin_rerun(self, session_id, page):
+        """session 開始新的一次重新執行，回傳上一次的記錄（第一次為 None）"""
+        with self._lock:
+            previous = self._runs.pop(session_id, None)
+            if previous is not None:
+                self._last_runs[session_id] = previous
+            self._runs[session_id] = {'page': page, 'queries': [], 'cache_hits': 0}
+            while len(self._runs) > self.max_sessions:
+                stale, _ = self._runs.popitem(last=False)
+                self._last_runs.pop(stale, None)
+            return self._last_runs.get(session_id)
+
+    def current_run(self, session_id):
+        """session 目前這次重新執行到目前為止的記錄（複本）"""
+        with self._lock:
+            run = self._runs.get(session_id)
+            return None if run is None else {**run, 'queries': list(run['queries'])}
+
+    def should_explain(self, fingerprint):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained_at.get(fingerprint, float('-inf')) < EXPLAIN_INTERVAL_SECONDS:
+                return False
+            self._explained_at[fingerprint] = now
+            return True
+
+    def summary(self, limit=20):
+        """依累計時間排序的 [(fingerprint, 累計)]"""
+        with self._lock:
+            items = [(fp, dict(totals)) for fp, totals in self.by_fingerprint.items()]
+        return sorted(items, key=lambda item: item[1]['total_ms'], reverse=True)[:limit]
+
+_query_stats = QueryStats()
+
+def get_query_stats():
+    return _query_stats
+
+def _log_slow_query(cur, sql, params, record):
+    """慢查詢以一行 JSON 記錄；同一個 fingerprint 每 EXPLAIN_INTERVAL_SECONDS 秒附上一次執行計畫"""
+    entry = {'event': 'slow_query', **record._asdict()}
+    if _EXPLAINABLE.match(sql) and _query_stats.should_explain(record.fingerprint):
+        try:
+            # 在 savepoint 中執行，EXPLAIN 失敗不會讓原本的交易中斷；ClientCursor 不會再被記錄
+            with cur.connection.transaction(), psycopg.ClientCursor(cur.connection) as explain_cur:
+                explain_cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                entry['explain'] = explain_cur.fetchone()[0]
+        except Exception as e:
+            entry['explain_error'] = str(e)
+    slow_query_logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+def _observe(cur, query, params, elapsed_ms, error=None):
+    if isinstance(query, bytes):
+        sql = query.decode('utf-8')
+    elif isinstance(query, str):
+        sql = query
+    else:
+        sql = query.as_string(cur)
+    if not sql.strip():
+        return  # 連線池的連線檢查
+    fp, normalized = fingerprint(sql)
+    record = QueryRecord(fp, normalized, params_shape(params), round(elapsed_ms, 2),
+                         cur.rowcount if error is None else None, _calling_page(), error)
+    _query_stats.record(record, current_session_id())
+    if error is None and elapsed_ms >= SLOW_QUERY_MS:
+        _log_slow_query(cur, sql, params, record)
+
+class _InstrumentedMixin:
+    """execute / executemany 結束時記錄到 QueryStats（失敗的查詢也會記錄例外類別）"""
+
+    def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        error = None
+        try:
+            return super().execute(query, params, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _observe(self, query, params, (time.perf_counter() - started) * 1000, error)
+
+    def executemany(self, query, params_seq, **kwargs):
+        started = time.perf_counter()
+        error = None
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _observe(self, query, None, (time.perf_counter() - started) * 1000, error)
+
+class InstrumentedCursor(_InstrumentedMixin, psycopg.Cursor):
+    pass
+
+class InstrumentedServerCursor(_InstrumentedMixin, psycopg.ServerCursor):
+    pass
+
+def _configure_connection(conn):
+    """連線池建立的連線改用會記錄查詢的游標"""
+    conn.cursor_factory = InstrumentedCursor
+    conn.server_cursor_factory = InstrumentedServerCursor
+
+@contextmanager
 def get_connection():
-    """建立資料庫連線"""
+    """從連線池借用連線（離開 with 區塊時自動 commit / rollback 並歸還）"""
+    pool = get_pool()
+    started = time.perf_counter()
     try:
-        config = get_database_config()
-        return psycopg.connect(**config)
+        conn = pool.getconn()
     except Exception as e:
         raise RuntimeError(f"❌ 資料庫連線失敗：{e}")
+    _checkout_stats.record((time.perf_counter() - started) * 1000)
+
+    try:
+        # 連線屬於連線池，with conn 只會結束交易，不會關閉連線
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn)
 
 @contextmanager
 def get_cursor():
-    """取得資料庫游標（自動處理連線與游標關閉）"""
-    conn = get_connection()
-    try:
+    """取得資料庫游標（自動處理連線借用與游標關閉）"""
+    with get_connection() as conn:
         with conn.cursor() as cur:
             yield cur
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
\ No newline at end of file
+
+def fetch_all(sql, params=None, tables=None):
+    """
+    執行 SELECT 並回傳所有資料列（list of tuple）。
+    結果以 SQL 文字 + 參數為鍵，跨 session 共用快取；
+    引用的資料表經 invalidate_tables() 失效後才會重新查詢。
+    回傳的 list 為共用物件，請勿直接修改。
+    其他行程的寫入由 cache_listener 透過 LISTEN / NOTIFY 清除。
+    """
+    start_cache_listener()
+    cache = get_query_cache()
+    key = make_key(sql, params)
+    hit, rows = cache.get(key)
+    if hit:
+        _query_stats.cache_hit(current_session_id())
+        return rows
+
+    tables = tables or extract_tables(sql)
+    versions = cache.version(*tables)
+    with get_cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    cache.put(key, rows, tables, versions)
+    return rows
+
+def invalidate_tables(*tables):
+    """
+    資料表寫入（INSERT / UPDATE / DELETE）後呼叫，讓相關查詢快取失效。
+    異動的主鍵不明，搜尋索引需整個重建；已知主鍵時改用 invalidate_rows()
+    """
+    get_query_cache().invalidate(*tables)
+
+def invalidate_rows(changes):
+    """
+    寫入後呼叫，changes 為 {資料表: 異動的主鍵集合}（可由 RETURNING id 取得）。
+    查詢快取同樣整個資料表失效，搜尋索引只重新讀取異動的資料列
+    """
+    get_query_cache().invalidate_rows(changes)
+
+def get_pool_stats():
+    """取得連線池統計（等待中、使用中、借用延遲），用於調整連線池大小"""
+    pool = get_pool()
+    stats = pool.get_stats()
+    pool_size = stats.get('pool_size', 0)
+    pool_available = stats.get('pool_available', 0)
+
+    return {
+        'pool_min': stats.get('pool_min', pool.min_size),
+        'pool_max': stats.get('pool_max', pool.max_size),
+        'pool_size': pool_size,
+        'in_use': pool_size - pool_available,
+        'available': pool_available,
+        'waiting': stats.get('requests_waiting', 0),
+        'requests_num': stats.get('requests_num', 0),
+        'requests_queued': stats.get('requests_queued', 0),
+        'requests_errors': stats.get('requests_errors', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+        **_checkout_stats.snapshot(),
+    }
@@ -0,0 +1,210 @@
+"""
+帳款 / 銀行帳本的 CSV（gzip）與 Parquet 匯出（給會計與其他程式使用）
+
+以 COPY (SELECT ...) TO STDOUT 直接串流查詢結果，記憶體用量固定；
+欄位標題與 Excel 匯出的工作表相同。
+
+    python dumps.py ar_leasing --from 2024-01-01 --to 2024-12-31 -o ar_leasing.csv.gz
+    python dumps.py bank_ledger --format parquet -o bank_ledger.parquet
+    python dumps.py payables > payables.csv.gz
+"""
+import argparse
+import gzip
+import sys
+import tempfile
+from collections import namedtuple
+from datetime import date, datetime
+from db_config import get_cursor
+from exports import (export_button, AR_EXPORT_HEADER, PAYABLE_EXPORT_HEADER,
+                     LEDGER_EXPORT_HEADER, SPOOL_MAX_BYTES)
+from pagination import union_sql
+from queries import (ar_branches, payable_branches, ledger_branches, date_params,
+                     AR_COLUMNS, PAYABLE_COLUMNS, LEDGER_COLUMNS)
+
+# 格式 → (顯示名稱, 副檔名, MIME)
+DUMP_FORMATS = {
+    'csv': ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    'parquet': ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+
+# gzip 壓縮等級（1 最快、9 最小）
+GZIP_LEVEL = 6
+
+# Parquet 每個 record batch 的筆數
+PARQUET_BATCH_ROWS = 50000
+
+# 欄位種類 → PostgreSQL 型別（查詢結果一律轉型）
+COLUMN_TYPES = {'text': 'text', 'date': 'date', 'money': 'numeric(14,2)'}
+
+# 欄位種類 → COPY BINARY 解碼型別（copy.set_types 只接受型別名稱，不含精度）
+COPY_TYPES = {'text': 'text', 'date': 'date', 'money': 'numeric'}
+
+# label: 顯示名稱；header: 欄位標題；columns: [(欄位運算式, 種類)]；
+# source(params) → (查詢分支, 分支欄位)；order_by: 排序；tables: 匯出快取依賴的資料表
+DumpDataset = namedtuple('DumpDataset', ['label', 'header', 'columns', 'source', 'order_by', 'tables'])
+
+AR_DUMP_COLUMNS = [
+    ('type', 'text'), ('contract_code', 'text'), ('customer_code', 'text'), ('customer_name', 'text'),
+    ('date', 'date'), ('end_date', 'date'), ('amount', 'money'), ('fee', 'money'),
+    ('received_amount', 'money'), ('payment_status', 'text'),
+    ('amount + fee', 'money'), ('amount + fee - received_amount', 'money'),
+]
+PAYABLE_DUMP_COLUMNS = [
+    ('contract_code', 'text'), ('contract_type', 'text'), ('customer_code', 'text'),
+    ('customer_name', 'text'), ('date', 'date'), ('payable_type', 'text'),
+    ('company_code', 'text'), ('amount', 'money'), ('payment_status', 'text'),
+]
+LEDGER_DUMP_COLUMNS = [
+    ('txn_date', 'date'), ('payer', 'text'), ('expense', 'money'), ('income', 'money'), ('note', 'text'),
+]
+
+def _ar_source(table):
+    def source(params):
+        return [b for b in ar_branches("總應收帳款", params) if b.table == table], AR_COLUMNS
+    return source
+
+def _payable_source(params):
+    # 未出與已出帳款一起匯出（付款狀況欄位可區分）
+    return payable_branches(None, params), PAYABLE_COLUMNS
+
+def _ledger_source(params):
+    return ledger_branches(params), LEDGER_COLUMNS
+
+DUMP_DATASETS = {
+    'ar_leasing': DumpDataset("租賃應收帳款", AR_EXPORT_HEADER, AR_DUMP_COLUMNS,
+                              _ar_source('ar_leasing'), "contract_code, id", ['ar_leasing']),
+    'ar_buyout': DumpDataset("買斷應收帳款", AR_EXPORT_HEADER, AR_DUMP_COLUMNS,
+                             _ar_source('ar_buyout'), "contract_code, id", ['ar_buyout']),
+    'payables': DumpDataset("應付帳款（業務 / 維護）", PAYABLE_EXPORT_HEADER, PAYABLE_DUMP_COLUMNS,
+                            _payable_source, "contract_code, contract_type, payable_type",
+                            ['contracts_leasing', 'contracts_buyout']),
+    'bank_ledger': DumpDataset("銀行帳本", LEDGER_EXPORT_HEADER, LEDGER_DUMP_COLUMNS,
+                               _ledger_source, "txn_date DESC, id DESC", ['bank_ledger']),
+}
+
+def dump_query(dataset, params):
+    """匯出資料集的 SELECT（欄位以中文標題命名並轉成固定型別）"""
+    spec = DUMP_DATASETS[dataset]
+    branches, columns = spec.source(params)
+    select = ", ".join(
+        f'({expression})::{COLUMN_TYPES[kind]} AS "{label}"'
+        for (expression, kind), label in zip(spec.columns, spec.header)
+    )
+    return f"""
+        SELECT {select}
+        FROM ({union_sql(branches)}) AS t({', '.join(columns)})
+        ORDER BY {spec.order_by}
+    """
+
+def _report(progress, rows):
+    # 不另外 COUNT(*) 總筆數（會多掃一次資料），只顯示已匯出筆數
+    if progress:
+        progress(0.0, f"已匯出 {rows:,} 筆")
+
+def write_csv(cur, sql, params, output, progress=None):
+    """COPY ... TO STDOUT (FORMAT csv) 的資料區塊直接寫入 gzip（開頭加 BOM，Excel 開啟中文不會亂碼）"""
+    rows = 0
+    with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=GZIP_LEVEL) as gz:
+        gz.write(b'\xef\xbb\xbf')
+        with cur.copy(f"COPY ({sql}) TO STDOUT (FORMAT csv, HEADER)", params) as copy:
+            for data in copy:
+                gz.write(data)
+                # 以換行數估計筆數（僅用於進度顯示，備註內含換行時會略多）
+                rows += bytes(data).count(b'\n')
+                _report(progress, rows)
+
+def write_parquet(cur, sql, params, spec, output, progress=None):
+    """COPY ... TO STDOUT (FORMAT binary) 逐列解碼，每 PARQUET_BATCH_ROWS 筆寫成一個 record batch"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {'text': pa.string(), 'date': pa.date32(), 'money': pa.decimal128(14, 2)}
+    schema = pa.schema([(label, arrow_types[kind]) for (_, kind), label in zip(spec.columns, spec.header)])
+
+    def record_batch(rows):
+        return pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+            schema=schema
+        )
+
+    written = 0
+    with pq.ParquetWriter(output, schema) as writer:
+        with cur.copy(f"COPY ({sql}) TO STDOUT (FORMAT binary)", params) as copy:
+            copy.set_types([COPY_TYPES[kind] for _, kind in spec.columns])
+            batch = []
+            for row in copy.rows():
+                batch.append(row)
+                if len(batch) == PARQUET_BATCH_ROWS:
+                    writer.write_batch(record_batch(batch))
+                    written += len(batch)
+                    batch = []
+                    _report(progress, written)
+            if batch:
+                writer.write_batch(record_batch(batch))
+                written += len(batch)
+    _report(progress, written)
+
+def write_dump(cur, dataset, fmt, params, output, progress=None):
+    """將資料集以指定格式寫入 output（二進位檔案物件）"""
+    spec = DUMP_DATASETS[dataset]
+    sql = dump_query(dataset, params)
+    if fmt == 'csv':
+        write_csv(cur, sql, params, output, progress)
+    elif fmt == 'parquet':
+        write_parquet(cur, sql, params, spec, output, progress)
+    else:
+        raise ValueError(f"不支援的匯出格式：{fmt}")
+
+def build_dump(dataset, fmt, from_date, to_date, progress):
+    """背景匯出工作使用：產生檔案並回傳（超過 SPOOL_MAX_BYTES 時存在磁碟）"""
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, suffix=DUMP_FORMATS[fmt][1])
+    with get_cursor() as cur:
+        write_dump(cur, dataset, fmt, date_params(from_date, to_date), output, progress)
+    output.seek(0)
+    return output
+
+def dump_button(dataset, fmt, from_date, to_date):
+    """CSV / Parquet 匯出按鈕（與 Excel 匯出共用背景工作與快取）"""
+    label, extension, mime = DUMP_FORMATS[fmt]
+    export_button(
+        f"dump_{dataset}_{fmt}",
+        build_dump,
+        (dataset, fmt, from_date, to_date),
+        tables=DUMP_DATASETS[dataset].tables,
+        file_name=f"{dataset}_{datetime.now().strftime('%Y%m%d')}{extension}",
+        mime=mime,
+        label=label
+    )
+
+def main(argv=None):
+    import psycopg
+    from db_config import get_database_config
+
+    parser = argparse.ArgumentParser(description="匯出帳款 / 銀行帳本（CSV gzip 或 Parquet）")
+    parser.add_argument('dataset', choices=list(DUMP_DATASETS))
+    parser.add_argument('--format', choices=list(DUMP_FORMATS), default='csv')
+    parser.add_argument('--from', dest='from_date', type=date.fromisoformat, help="起始日期 YYYY-MM-DD")
+    parser.add_argument('--to', dest='to_date', type=date.fromisoformat, help="結束日期 YYYY-MM-DD")
+    parser.add_argument('-o', '--output', help="輸出檔案（預設為標準輸出，Parquet 必須指定檔案）")
+    args = parser.parse_args(argv)
+
+    if (args.from_date is None) != (args.to_date is None):
+        parser.error("--from 與 --to 需同時指定")
+    if args.format == 'parquet' and not args.output:
+        parser.error("Parquet 需以 -o 指定輸出檔案")
+
+    def report(fraction, message):
+        print(f"\r{message}", end='', file=sys.stderr, flush=True)
+
+    params = date_params(args.from_date, args.to_date)
+    with psycopg.connect(**get_database_config()) as conn, conn.cursor() as cur:
+        if args.output:
+            with open(args.output, 'wb') as output:
+                write_dump(cur, args.dataset, args.format, params, output, report)
+        else:
+            write_dump(cur, args.dataset, args.format, params, sys.stdout.buffer, report)
+    print(file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
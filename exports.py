@@ -0,0 +1,277 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from datetime import date
+import streamlit as st
+from openpyxl import Workbook
+from db_config import get_connection, get_cursor
+from query_cache import get_query_cache
+from pagination import summary_sql, union_sql
+from queries import account_branches, ledger_branches, date_params, LEDGER_COLUMNS
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# 保留已完成的匯出檔案數量（超過時淘汰最久未使用的；檔案存在磁碟，不佔記憶體）
+MAX_CACHED_EXPORTS = 8
+
+# 產生中的匯出每隔幾秒更新一次進度
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+# 伺服器端游標每次讀取的筆數
+CHUNK_ROWS = 5000
+
+# 匯出檔案超過此大小（bytes）時改存到磁碟暫存檔
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+# 未套用日期篩選時匯出全部資料
+ALL_DATES = (date(1900, 1, 1), date(2100, 12, 31))
+
+# 工作表欄位標題
+AR_EXPORT_HEADER = ['類型', '合約編號', '客戶代碼', '客戶名稱', '日期', '結束日期',
+                    '金額', '手續費', '已收金額', '繳費狀況', '應收總額', '未收金額']
+PAYABLE_EXPORT_HEADER = ['合約編號', '類型', '客戶代碼', '客戶名稱', '日期',
+                         '付款對象', '公司代碼', '金額', '付款狀況']
+LEDGER_EXPORT_HEADER = ['日期', '匯款人', '支出金額', '收入金額', '備註']
+
+# ============================================
+# 匯出內容
+# ============================================
+def account_export_sheets(from_date, to_date):
+    """帳款匯出的工作表：[(工作表名稱, 欄位標題, SQL, 參數)]"""
+    params = date_params(from_date, to_date)
+    sheets = []
+    for ar_type in ["總應收帳款", "總未收帳款"]:
+        branches, columns = account_branches(ar_type, params)
+        sheets.append((ar_type, AR_EXPORT_HEADER, f"""
+            SELECT type, contract_code, customer_code, customer_name, date, end_date,
+                   amount, fee, received_amount, payment_status,
+                   amount + fee, amount + fee - received_amount
+            FROM ({union_sql(branches)}) AS t({', '.join(columns)})
+            ORDER BY contract_code, type, id
+        """, params))
+    for ar_type in ["未出帳款", "已出帳款"]:
+        branches, columns = account_branches(ar_type, params)
+        sheets.append((ar_type, PAYABLE_EXPORT_HEADER, f"""
+            SELECT * FROM ({union_sql(branches)}) AS t({', '.join(columns)})
+            ORDER BY contract_code, contract_type, payable_type
+        """, params))
+    return sheets
+
+def ledger_export_sheet(from_date, to_date):
+    """銀行帳本匯出的工作表 (工作表名稱, 欄位標題, SQL, 參數)"""
+    params = date_params(from_date, to_date)
+    return ('銀行帳本', LEDGER_EXPORT_HEADER, f"""
+        SELECT txn_date, payer, expense, income, note
+        FROM ({union_sql(ledger_branches(params))}) AS t({', '.join(LEDGER_COLUMNS)})
+        ORDER BY txn_date DESC, id DESC
+    """, params)
+
+def stream_rows(sql, params=None, chunk_size=CHUNK_ROWS):
+    """
+    以伺服器端（具名）游標分批讀取查詢結果，一次只在記憶體中保留 chunk_size 筆。
+    結果不經過查詢快取（匯出檔案本身會被快取）。
+    """
+    with get_connection() as conn:
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = chunk_size
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+
+def write_workbook(sheets, progress, extra_sheets=()):
+    """
+    以 openpyxl 唯寫模式逐列寫入 xlsx（各工作表先寫到暫存檔，記憶體用量固定），
+    完成的檔案放在 SpooledTemporaryFile（超過 SPOOL_MAX_BYTES 時存在磁碟）。
+    sheets 為 [(工作表名稱, 欄位標題, SQL, 參數)]；extra_sheets 為已在記憶體中的小工作表 [(名稱, 欄位標題, 資料列)]。
+    不另外 COUNT(*) 總筆數（會多掃一次資料）：進度以完成的工作表數計算，並顯示已寫入筆數。
+    """
+    written = 0
+
+    workbook = Workbook(write_only=True)
+    for index, (sheet_name, header, sql, params) in enumerate(sheets):
+        fraction = 0.9 * index / len(sheets)
+        progress(fraction, f"{sheet_name}：查詢中...")
+        sheet = workbook.create_sheet(title=sheet_name)
+        sheet.append(header)
+        for row in stream_rows(sql, params):
+            sheet.append(row)
+            written += 1
+            if written % CHUNK_ROWS == 0:
+                progress(fraction, f"{sheet_name}：已寫入 {written:,} 筆")
+
+    for sheet_name, header, rows in extra_sheets:
+        sheet = workbook.create_sheet(title=sheet_name)
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+
+    progress(0.95, "產生 Excel 檔案...")
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, suffix='.xlsx')
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+def build_accounts_workbook(from_date, to_date, progress):
+    """匯出所有四種帳款類型到 Excel（不同工作表），回傳檔案"""
+    return write_workbook(account_export_sheets(from_date, to_date), progress)
+
+def build_ledger_workbook(from_date, to_date, progress):
+    """匯出銀行帳本資料到 Excel（含匯總工作表），回傳檔案"""
+    params = date_params(from_date, to_date)
+    with get_cursor() as cur:
+        cur.execute(summary_sql(ledger_branches(params), LEDGER_COLUMNS,
+                                "COALESCE(SUM(income), 0), COALESCE(SUM(expense), 0)"), params)
+        total_income, total_expense = cur.fetchone()
+
+    # 添加匯總資料
+    summary_rows = [('總收入', total_income), ('總支出', total_expense), ('淨額', total_income - total_expense)]
+    return write_workbook([ledger_export_sheet(from_date, to_date)], progress,
+                          extra_sheets=[('匯總', ['項目', '金額'], summary_rows)])
+
+# ============================================
+# 背景匯出工作
+# ============================================
+class ExportJob:
+    """在背景執行緒產生匯出檔案，記錄進度與結果；完成的檔案存在磁碟暫存檔（path），工作不再被參照時刪除"""
+
+    def __init__(self, key, build, args):
+        self.key = key
+        self.status = 'running'  # running / done / failed
+        self.progress = 0.0
+        self.message = "準備中..."
+        self.path = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._thread = threading.Thread(
+            target=self._run, args=(build, args), name=f"export-{key[0]}", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def report(self, fraction, message):
+        self.progress = min(max(fraction, 0.0), 1.0)
+        self.message = message
+
+    def _run(self, build, args):
+        try:
+            with build(*args, self.report) as data, \
+                    tempfile.NamedTemporaryFile(prefix='export_', delete=False) as output:
+                weakref.finalize(self, _remove_file, output.name)
+                data.seek(0)
+                shutil.copyfileobj(data, output)
+            self.path = output.name
+            self.progress = 1.0
+            self.status = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+        finally:
+            self.finished_at = time.time()
+
+    def open(self):
+        """開啟完成的檔案（每次呼叫各自一個檔案物件，不同 session 可同時讀取；呼叫端負責關閉）"""
+        return open(self.path, 'rb')
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+@st.cache_resource(show_spinner=False)
+def _get_export_registry():
+    """整個伺服器行程共用的匯出工作（鍵 → ExportJob），相同條件的匯出只產生一次"""
+    return {'lock': threading.Lock(), 'jobs': OrderedDict()}
+
+def export_key(name, args, tables):
+    """匯出鍵：(匯出名稱, 參數, 資料版本)；資料表寫入後版本改變，舊檔案不再使用"""
+    return (name, tuple(args), get_query_cache().version(*tables))
+
+def get_export(key):
+    registry = _get_export_registry()
+    with registry['lock']:
+        job = registry['jobs'].get(key)
+        if job is not None:
+            registry['jobs'].move_to_end(key)
+        return job
+
+def start_export(key, build, args):
+    """開始匯出（相同鍵已在產生或已完成時直接沿用，失敗時重新產生）"""
+    registry = _get_export_registry()
+    with registry['lock']:
+        jobs = registry['jobs']
+        job = jobs.get(key)
+        if job is None or job.status == 'failed':
+            job = jobs[key] = ExportJob(key, build, args).start()
+        jobs.move_to_end(key)
+
+        # 淘汰最久未使用的已完成工作（產生中的工作保留）；只移出登錄表，不刪除檔案：
+        # 其他 session 可能仍持有此工作，暫存檔在工作不再被參照時才刪除
+        finished = [k for k, j in jobs.items() if j.status != 'running']
+        for stale in finished[:max(0, len(finished) - MAX_CACHED_EXPORTS)]:
+            del jobs[stale]
+        return job
+
+def export_date_range(name, apply_filter, from_date, to_date):
+    """
+    匯出使用的日期範圍。查詢按鈕只在按下的那次 rerun 為 True，按「產生」時已是另一次 rerun，
+    所以按下查詢時把範圍記在 session_state，之後的匯出沿用，直到 clear_export_date_range()
+    """
+    state_key = f"{name}_export_range"
+    if apply_filter:
+        st.session_state[state_key] = (from_date, to_date)
+    return st.session_state.get(state_key, ALL_DATES)
+
+def clear_export_date_range(name):
+    """清除按下查詢時記錄的匯出日期範圍（恢復匯出全部）"""
+    st.session_state.pop(f"{name}_export_range", None)
+
+def export_button(name, build, args, tables, file_name, mime=XLSX_MIME, label="Excel"):
+    """
+    匯出按鈕：按下後才在背景產生檔案並顯示進度，完成後顯示下載按鈕。
+    檔案依 (名稱, 參數, 資料版本) 快取，重複下載不會重新查詢。
+    """
+    key = export_key(name, args, tables)
+    job = get_export(key)
+
+    if job is None or job.status == 'failed':
+        if job is not None:
+            st.error(f"❌ 匯出失敗：{job.error}")
+        if st.button(f"📦 產生 {label}", use_container_width=True, key=f"{name}_export_start"):
+            job = start_export(key, build, args)
+        else:
+            return
+
+    if job.status == 'running':
+        _export_progress(job)
+    else:
+        with job.open() as data:
+            st.download_button(
+                label=f"📥 下載 {label}",
+                data=data,
+                file_name=file_name,
+                mime=mime,
+                use_container_width=True,
+                key=f"{name}_export_download"
+            )
+
+@st.fragment(run_every=PROGRESS_INTERVAL_SECONDS)
+def _export_progress(job):
+    """只重新執行此區塊來更新進度；完成後重新執行整頁以顯示下載按鈕"""
+    st.progress(job.progress, text=job.message)
+    if job.status != 'running':
+        st.rerun()
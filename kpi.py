@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+import psycopg
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# KPI 快照更新間隔（分鐘）；可用 KPI_REFRESH_MINUTES 環境變數覆寫
+DEFAULT_REFRESH_MINUTES = 5
+
+# 首頁 KPI：一次查詢算出所有數字（逾期 = 未收款且帳款日期早於今天；租賃以期間起始日、買斷以成交日期計）
+KPI_SQL = """
+    WITH ar AS (
+        SELECT start_date AS due_date, payment_status,
+               COALESCE(total_rent, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0) AS unpaid
+        FROM ar_leasing
+        UNION ALL
+        SELECT deal_date, payment_status,
+               COALESCE(total_amount, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0)
+        FROM ar_buyout
+    ),
+    payables AS (
+        SELECT p.payable_type, p.amount, p.payment_status
+        FROM contracts_leasing
+        CROSS JOIN LATERAL (VALUES ('業務', sales_amount, sales_payment_status),
+                                   ('維護', service_amount, service_payment_status)) AS p(payable_type, amount, payment_status)
+        UNION ALL
+        SELECT p.payable_type, p.amount, p.payment_status
+        FROM contracts_buyout
+        CROSS JOIN LATERAL (VALUES ('業務', sales_amount, sales_payment_status),
+                                   ('維護', service_amount, service_payment_status)) AS p(payable_type, amount, payment_status)
+    )
+    SELECT
+        (SELECT COALESCE(SUM(unpaid), 0) FROM ar WHERE payment_status != '已收款'),
+        (SELECT COUNT(*) FROM ar WHERE payment_status != '已收款'),
+        (SELECT COALESCE(SUM(unpaid), 0) FROM ar WHERE payment_status != '已收款' AND due_date < CURRENT_DATE),
+        (SELECT COUNT(*) FROM ar WHERE payment_status != '已收款' AND due_date < CURRENT_DATE),
+        (SELECT COALESCE(SUM(amount), 0) FROM payables
+         WHERE payable_type = '業務' AND payment_status != '已付款' AND amount > 0),
+        (SELECT COALESCE(SUM(amount), 0) FROM payables
+         WHERE payable_type = '維護' AND payment_status != '已付款' AND amount > 0),
+        (SELECT COALESCE(SUM(income), 0) - COALESCE(SUM(expense), 0) FROM bank_ledger
+         WHERE txn_date >= date_trunc('month', CURRENT_DATE)),
+        (SELECT COUNT(*) FROM contracts_leasing),
+        (SELECT COUNT(*) FROM contracts_leasing
+         WHERE start_date <= CURRENT_DATE
+           AND start_date + make_interval(months => COALESCE(contract_months, 0)) > CURRENT_DATE),
+        (SELECT COUNT(*) FROM contracts_buyout)
+"""
+
+KPI_NAMES = [
+    'outstanding_ar', 'outstanding_ar_count', 'overdue_ar', 'overdue_ar_count',
+    'unpaid_sales', 'unpaid_service', 'month_net',
+    'leasing_contracts', 'active_leasing_contracts', 'buyout_contracts',
+]
+
+class KpiRefresher(threading.Thread):
+    """背景定期計算 KPI 快照，整個伺服器行程的 session 共用同一份快照"""
+
+    def __init__(self, database_config, interval_seconds):
+        super().__init__(name="kpi-refresher", daemon=True)
+        self.database_config = database_config
+        self.interval_seconds = interval_seconds
+        self.snapshot = None
+        self.refreshed_at = None
+        self.duration_ms = None
+        self.last_error = None
+        self._wake = threading.Event()
+
+    def refresh_now(self):
+        """要求立即重新計算（不等待完成）"""
+        self._wake.set()
+
+    def run(self):
+        while True:
+            try:
+                started = time.perf_counter()
+                with psycopg.connect(**self.database_config, autocommit=True) as conn:
+                    row = conn.execute(KPI_SQL).fetchone()
+                # 先記錄時間再替換整份快照，頁面讀到快照時一定有對應的時間
+                self.refreshed_at = datetime.now()
+                self.snapshot = dict(zip(KPI_NAMES, row))
+                self.duration_ms = (time.perf_counter() - started) * 1000
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("KPI 快照更新失敗：%s", e)
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+
+@st.cache_resource(show_spinner=False)
+def get_kpi_refresher():
+    """每個伺服器行程啟動一次 KPI 更新執行緒"""
+    from db_config import get_database_config
+
+    minutes = float(os.getenv('KPI_REFRESH_MINUTES', DEFAULT_REFRESH_MINUTES))
+    refresher = KpiRefresher(get_database_config(), minutes * 60)
+    refresher.start()
+    return refresher
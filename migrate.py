@@ -0,0 +1,113 @@
+"""
+資料庫 migration 工具
+
+database.sql 為基礎結構，migrations/ 內依編號（NNNN_說明.sql）套用後續異動，
+已套用的版本記錄在 schema_migrations。
+
+    python migrate.py                 # 套用尚未執行的 migration
+    python migrate.py --status        # 列出各 migration 狀態
+
+頁面查詢是否使用索引由 tests/test_query_plans.py 檢查。
+"""
+import argparse
+import hashlib
+import re
+import sys
+from pathlib import Path
+import psycopg
+from db_config import get_database_config
+
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+
+# 避免多個部署同時執行 migration
+ADVISORY_LOCK_KEY = 'miracle_schema_migrations'
+
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """讀取 migration 檔案，回傳 [(版本, 名稱, SQL, checksum)]（依版本排序）"""
+    migrations = []
+    for path in sorted(directory.glob('*.sql')):
+        match = MIGRATION_FILE.match(path.name)
+        if not match:
+            continue
+        sql = path.read_text(encoding='utf-8')
+        checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+        migrations.append((int(match.group(1)), match.group(2), sql, checksum))
+    return migrations
+
+def ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            checksum VARCHAR(64) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def applied_migrations(cur):
+    """已套用的版本 → checksum"""
+    ensure_migrations_table(cur)
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cur.fetchall())
+
+def pending_migrations(cur, migrations):
+    applied = applied_migrations(cur)
+    for version, name, _, checksum in migrations:
+        if version in applied and applied[version] != checksum:
+            print(f"⚠️ {version:04d}_{name} 已套用，但檔案內容已變更（請新增 migration，不要修改已套用的檔案）")
+    return [m for m in migrations if m[0] not in applied]
+
+def apply_migration(cur, migration):
+    version, name, sql, checksum = migration
+    cur.execute(sql)
+    cur.execute(
+        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+        (version, name, checksum)
+    )
+
+def migrate(conn, migrations):
+    """依序套用尚未執行的 migration（每個 migration 一個交易），回傳套用數量"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (ADVISORY_LOCK_KEY,))
+        try:
+            with conn.transaction():
+                pending = pending_migrations(cur, migrations)
+            for migration in pending:
+                with conn.transaction():
+                    apply_migration(cur, migration)
+                print(f"✅ 已套用 {migration[0]:04d}_{migration[1]}")
+            return len(pending)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (ADVISORY_LOCK_KEY,))
+
+def print_status(conn, migrations):
+    with conn.cursor() as cur, conn.transaction():
+        applied = applied_migrations(cur)
+    for version, name, _, checksum in migrations:
+        if version not in applied:
+            state = "未套用"
+        elif applied[version] != checksum:
+            state = "已套用（檔案已變更）"
+        else:
+            state = "已套用"
+        print(f"{version:04d}_{name}: {state}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="資料庫 migration 工具")
+    parser.add_argument('--status', action='store_true', help="列出各 migration 狀態")
+    args = parser.parse_args(argv)
+
+    migrations = load_migrations()
+    with psycopg.connect(**get_database_config()) as conn:
+        if args.status:
+            print_status(conn, migrations)
+        else:
+            conn.autocommit = True
+            if migrate(conn, migrations) == 0:
+                print("資料庫已是最新版本")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
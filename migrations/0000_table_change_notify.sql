@@ -0,0 +1,62 @@
+-- ===========================================
+-- 0000 資料異動通知（LISTEN / NOTIFY，讓各應用程式行程清除查詢快取，見 cache_listener.py）
+-- ===========================================
+-- 編號 0000：之後的 migration（例如 0005 對帳紀錄）會在新資料表加上同一個觸發程序，需先建立函式。
+-- 已有此函式與觸發程序的資料庫重新套用也不會出錯。
+CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+DECLARE
+    row_id INT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_id := OLD.id;
+    ELSE
+        row_id := NEW.id;
+    END IF;
+    -- payload：{"table": 資料表名稱, "op": INSERT/UPDATE/DELETE, "id": 主鍵}
+    PERFORM pg_notify(
+        'table_changes',
+        json_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'id', row_id)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS customers_notify_change ON customers;
+CREATE TRIGGER customers_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON customers
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS companies_notify_change ON companies;
+CREATE TRIGGER companies_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON companies
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS contracts_leasing_notify_change ON contracts_leasing;
+CREATE TRIGGER contracts_leasing_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON contracts_leasing
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS contracts_buyout_notify_change ON contracts_buyout;
+CREATE TRIGGER contracts_buyout_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON contracts_buyout
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS ar_leasing_notify_change ON ar_leasing;
+CREATE TRIGGER ar_leasing_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON ar_leasing
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS ar_buyout_notify_change ON ar_buyout;
+CREATE TRIGGER ar_buyout_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON ar_buyout
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS service_expense_notify_change ON service_expense;
+CREATE TRIGGER service_expense_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON service_expense
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS bank_ledger_notify_change ON bank_ledger;
+CREATE TRIGGER bank_ledger_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON bank_ledger
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
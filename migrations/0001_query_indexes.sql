@@ -0,0 +1,55 @@
+-- ===========================================
+-- 0001 查詢用索引（頁面篩選、keyset 分頁、外鍵）
+-- ===========================================
+
+-- 租賃應收帳款：依合約編號分頁、依起始日篩選；總未收帳款使用部分索引
+CREATE INDEX IF NOT EXISTS ar_leasing_contract_code_id_idx ON ar_leasing (contract_code, id);
+CREATE INDEX IF NOT EXISTS ar_leasing_start_date_idx ON ar_leasing (start_date);
+CREATE INDEX IF NOT EXISTS ar_leasing_unpaid_contract_code_id_idx ON ar_leasing (contract_code, id)
+    WHERE payment_status <> '已收款';
+CREATE INDEX IF NOT EXISTS ar_leasing_unpaid_start_date_idx ON ar_leasing (start_date)
+    WHERE payment_status <> '已收款';
+CREATE INDEX IF NOT EXISTS ar_leasing_customer_code_idx ON ar_leasing (customer_code);
+
+-- 買斷應收帳款
+CREATE INDEX IF NOT EXISTS ar_buyout_contract_code_id_idx ON ar_buyout (contract_code, id);
+CREATE INDEX IF NOT EXISTS ar_buyout_deal_date_idx ON ar_buyout (deal_date);
+CREATE INDEX IF NOT EXISTS ar_buyout_unpaid_contract_code_id_idx ON ar_buyout (contract_code, id)
+    WHERE payment_status <> '已收款';
+CREATE INDEX IF NOT EXISTS ar_buyout_unpaid_deal_date_idx ON ar_buyout (deal_date)
+    WHERE payment_status <> '已收款';
+CREATE INDEX IF NOT EXISTS ar_buyout_customer_code_idx ON ar_buyout (customer_code);
+
+-- 租賃合約：未出 / 已出帳款（業務、維護）依合約編號分頁；contract_code 已有 UNIQUE 索引
+CREATE INDEX IF NOT EXISTS contracts_leasing_start_date_idx ON contracts_leasing (start_date);
+CREATE INDEX IF NOT EXISTS contracts_leasing_sales_unpaid_idx ON contracts_leasing (contract_code)
+    WHERE sales_payment_status <> '已付款' AND sales_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_leasing_sales_paid_idx ON contracts_leasing (contract_code)
+    WHERE sales_payment_status = '已付款' AND sales_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_leasing_service_unpaid_idx ON contracts_leasing (contract_code)
+    WHERE service_payment_status <> '已付款' AND service_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_leasing_service_paid_idx ON contracts_leasing (contract_code)
+    WHERE service_payment_status = '已付款' AND service_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_leasing_customer_code_idx ON contracts_leasing (customer_code);
+CREATE INDEX IF NOT EXISTS contracts_leasing_sales_company_code_idx ON contracts_leasing (sales_company_code);
+CREATE INDEX IF NOT EXISTS contracts_leasing_service_company_code_idx ON contracts_leasing (service_company_code);
+
+-- 買斷合約
+CREATE INDEX IF NOT EXISTS contracts_buyout_deal_date_idx ON contracts_buyout (deal_date);
+CREATE INDEX IF NOT EXISTS contracts_buyout_sales_unpaid_idx ON contracts_buyout (contract_code)
+    WHERE sales_payment_status <> '已付款' AND sales_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_buyout_sales_paid_idx ON contracts_buyout (contract_code)
+    WHERE sales_payment_status = '已付款' AND sales_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_buyout_service_unpaid_idx ON contracts_buyout (contract_code)
+    WHERE service_payment_status <> '已付款' AND service_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_buyout_service_paid_idx ON contracts_buyout (contract_code)
+    WHERE service_payment_status = '已付款' AND service_amount > 0;
+CREATE INDEX IF NOT EXISTS contracts_buyout_customer_code_idx ON contracts_buyout (customer_code);
+CREATE INDEX IF NOT EXISTS contracts_buyout_sales_company_code_idx ON contracts_buyout (sales_company_code);
+CREATE INDEX IF NOT EXISTS contracts_buyout_service_company_code_idx ON contracts_buyout (service_company_code);
+
+-- 服務費用（刪除公司前檢查是否仍被引用）
+CREATE INDEX IF NOT EXISTS service_expense_repair_company_code_idx ON service_expense (repair_company_code);
+
+-- 銀行帳本：依日期篩選，並依 (txn_date, id) 由新到舊分頁
+CREATE INDEX IF NOT EXISTS bank_ledger_txn_date_id_idx ON bank_ledger (txn_date, id);
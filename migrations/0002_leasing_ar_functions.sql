@@ -0,0 +1,54 @@
+-- ===========================================
+-- 0002 租賃應收帳款排程函式（與 ar_schedule.leasing_periods 相同規則）
+-- ===========================================
+
+-- 各期 (起始日, 結束日, 租金)：每期 payment_cycle_months 個月，不足一個週期的剩餘月數成為最後一期。
+-- 日期皆由合約起始日加上月數計算（月底自動調整，例如 1/31 + 1 個月 = 2/28 或 2/29）。
+CREATE OR REPLACE FUNCTION leasing_ar_periods(
+    p_start_date DATE,
+    p_monthly_rent NUMERIC,
+    p_payment_cycle_months INT,
+    p_contract_months INT
+) RETURNS TABLE (period_start DATE, period_end DATE, period_rent NUMERIC)
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT (p_start_date + make_interval(months => m.month_from))::date,
+           (p_start_date + make_interval(months => m.month_to))::date - 1,
+           p_monthly_rent * (m.month_to - m.month_from)
+    -- 週期為 0 或 NULL 時 generate_series 不回傳任何列
+    FROM generate_series(0, p_contract_months - 1, NULLIF(p_payment_cycle_months, 0)) AS g(month_from)
+    CROSS JOIN LATERAL (
+        SELECT g.month_from,
+               LEAST(g.month_from + p_payment_cycle_months, p_contract_months) AS month_to
+    ) AS m
+    ORDER BY m.month_from
+$$;
+
+-- 重新產生指定合約的租賃應收帳款（刪除舊帳款後以單一 INSERT ... SELECT 寫入），回傳寫入筆數
+--   SELECT generate_leasing_ar(ARRAY['L001', 'L002']);
+--   SELECT generate_leasing_ar(ARRAY(SELECT contract_code FROM contracts_leasing));  -- 全部合約
+CREATE OR REPLACE FUNCTION generate_leasing_ar(p_contract_codes VARCHAR[]) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    DELETE FROM ar_leasing WHERE contract_code = ANY(p_contract_codes);
+
+    INSERT INTO ar_leasing (contract_code, customer_code, customer_name, start_date, end_date,
+                            total_rent, fee, received_amount, payment_status)
+    SELECT c.contract_code, c.customer_code, c.customer_name,
+           p.period_start, p.period_end, p.period_rent, 0, 0, '未收'
+    FROM contracts_leasing c
+    CROSS JOIN LATERAL leasing_ar_periods(c.start_date, c.monthly_rent,
+                                          c.payment_cycle_months, c.contract_months) AS p
+    WHERE c.contract_code = ANY(p_contract_codes)
+    ORDER BY c.contract_code, p.period_start;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION generate_leasing_ar(p_contract_code VARCHAR) RETURNS INTEGER
+LANGUAGE sql AS $$
+    SELECT generate_leasing_ar(ARRAY[p_contract_code]);
+$$;
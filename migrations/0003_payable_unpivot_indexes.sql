@@ -0,0 +1,27 @@
+-- ===========================================
+-- 0003 未出 / 已出帳款改為單次掃描（queries.payable_branches 以 LATERAL VALUES 展開業務、維護）
+-- ===========================================
+
+-- 每個合約資料表只需要「有未出 / 已出應付」的部分索引（條件與 payable_branches 的合約層級條件一致）
+CREATE INDEX IF NOT EXISTS contracts_leasing_unpaid_payables_idx ON contracts_leasing (contract_code)
+    WHERE (sales_payment_status <> '已付款' AND sales_amount > 0)
+       OR (service_payment_status <> '已付款' AND service_amount > 0);
+CREATE INDEX IF NOT EXISTS contracts_leasing_paid_payables_idx ON contracts_leasing (contract_code)
+    WHERE (sales_payment_status = '已付款' AND sales_amount > 0)
+       OR (service_payment_status = '已付款' AND service_amount > 0);
+CREATE INDEX IF NOT EXISTS contracts_buyout_unpaid_payables_idx ON contracts_buyout (contract_code)
+    WHERE (sales_payment_status <> '已付款' AND sales_amount > 0)
+       OR (service_payment_status <> '已付款' AND service_amount > 0);
+CREATE INDEX IF NOT EXISTS contracts_buyout_paid_payables_idx ON contracts_buyout (contract_code)
+    WHERE (sales_payment_status = '已付款' AND sales_amount > 0)
+       OR (service_payment_status = '已付款' AND service_amount > 0);
+
+-- 0001 中依業務 / 維護分開的部分索引不再使用
+DROP INDEX IF EXISTS contracts_leasing_sales_unpaid_idx;
+DROP INDEX IF EXISTS contracts_leasing_sales_paid_idx;
+DROP INDEX IF EXISTS contracts_leasing_service_unpaid_idx;
+DROP INDEX IF EXISTS contracts_leasing_service_paid_idx;
+DROP INDEX IF EXISTS contracts_buyout_sales_unpaid_idx;
+DROP INDEX IF EXISTS contracts_buyout_sales_paid_idx;
+DROP INDEX IF EXISTS contracts_buyout_service_unpaid_idx;
+DROP INDEX IF EXISTS contracts_buyout_service_paid_idx;
@@ -0,0 +1,243 @@
+-- ===========================================
+-- 0004 每日匯總表（由觸發器維護），日期範圍的匯總金額只需加總匯總表
+-- ===========================================
+-- 日期為 NULL 的資料記在 '-infinity'（不會落在任何日期範圍內，但計入「全部」）；
+-- 繳費 / 付款狀況為 NULL 時記為 ''。rollups.py --check 比對匯總表與原始資料，--repair 重建。
+
+-- 應收帳款：日期 × 類型（租賃 / 買斷）× 繳費狀況
+CREATE TABLE IF NOT EXISTS ar_daily_rollup (
+    day DATE NOT NULL,
+    ar_type VARCHAR(10) NOT NULL,
+    payment_status VARCHAR(20) NOT NULL,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    total_amount NUMERIC NOT NULL DEFAULT 0,
+    total_fee NUMERIC NOT NULL DEFAULT 0,
+    total_received NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, ar_type, payment_status)
+);
+
+-- 應付帳款（合約的業務 / 維護金額 > 0）：日期 × 合約類型 × 付款對象 × 付款狀況
+CREATE TABLE IF NOT EXISTS payable_daily_rollup (
+    day DATE NOT NULL,
+    contract_type VARCHAR(10) NOT NULL,
+    payable_type VARCHAR(10) NOT NULL,
+    payment_status VARCHAR(20) NOT NULL,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    total_amount NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, contract_type, payable_type, payment_status)
+);
+
+-- 銀行帳本：每日收入 / 支出
+CREATE TABLE IF NOT EXISTS bank_ledger_daily_rollup (
+    day DATE PRIMARY KEY,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    total_income NUMERIC NOT NULL DEFAULT 0,
+    total_expense NUMERIC NOT NULL DEFAULT 0
+);
+
+-- ===========================================
+-- 由原始資料計算的匯總（回填與一致性檢查使用）
+-- ===========================================
+CREATE OR REPLACE VIEW ar_daily_rollup_source AS
+SELECT COALESCE(start_date, '-infinity'::date) AS day, '租賃'::varchar AS ar_type,
+       COALESCE(payment_status::text, '')::varchar AS payment_status,
+       COUNT(*) AS row_count, COALESCE(SUM(total_rent), 0) AS total_amount,
+       COALESCE(SUM(fee), 0) AS total_fee, COALESCE(SUM(received_amount), 0) AS total_received
+FROM ar_leasing
+GROUP BY 1, 3
+UNION ALL
+SELECT COALESCE(deal_date, '-infinity'::date), '買斷', COALESCE(payment_status::text, ''),
+       COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(SUM(fee), 0), COALESCE(SUM(received_amount), 0)
+FROM ar_buyout
+GROUP BY 1, 3;
+
+CREATE OR REPLACE VIEW payable_daily_rollup_source AS
+SELECT c.start_date AS day, '租賃'::varchar AS contract_type, p.payable_type::varchar AS payable_type,
+       COALESCE(p.payment_status::text, '')::varchar AS payment_status,
+       COUNT(*) AS row_count, SUM(p.amount) AS total_amount
+FROM contracts_leasing c
+CROSS JOIN LATERAL (VALUES ('業務', c.sales_amount, c.sales_payment_status),
+                           ('維護', c.service_amount, c.service_payment_status)) AS p(payable_type, amount, payment_status)
+WHERE p.amount > 0
+GROUP BY 1, 3, 4
+UNION ALL
+SELECT c.deal_date, '買斷', p.payable_type, COALESCE(p.payment_status::text, ''), COUNT(*), SUM(p.amount)
+FROM contracts_buyout c
+CROSS JOIN LATERAL (VALUES ('業務', c.sales_amount, c.sales_payment_status),
+                           ('維護', c.service_amount, c.service_payment_status)) AS p(payable_type, amount, payment_status)
+WHERE p.amount > 0
+GROUP BY 1, 3, 4;
+
+CREATE OR REPLACE VIEW bank_ledger_daily_rollup_source AS
+SELECT txn_date AS day, COUNT(*) AS row_count,
+       COALESCE(SUM(income), 0) AS total_income, COALESCE(SUM(expense), 0) AS total_expense
+FROM bank_ledger
+GROUP BY txn_date;
+
+-- ===========================================
+-- 觸發器：每列異動時把差額加到匯總表（UPDATE = 減去舊值 + 加上新值）
+-- ===========================================
+CREATE OR REPLACE FUNCTION ar_rollup_apply(p_day DATE, p_ar_type VARCHAR, p_status TEXT, p_amount NUMERIC,
+                                           p_fee NUMERIC, p_received NUMERIC, p_sign INT)
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO ar_daily_rollup AS r (day, ar_type, payment_status, row_count, total_amount, total_fee, total_received)
+    VALUES (COALESCE(p_day, '-infinity'::date), p_ar_type, COALESCE(p_status, ''), p_sign,
+            p_sign * COALESCE(p_amount, 0), p_sign * COALESCE(p_fee, 0), p_sign * COALESCE(p_received, 0))
+    ON CONFLICT (day, ar_type, payment_status) DO UPDATE SET
+        row_count = r.row_count + EXCLUDED.row_count,
+        total_amount = r.total_amount + EXCLUDED.total_amount,
+        total_fee = r.total_fee + EXCLUDED.total_fee,
+        total_received = r.total_received + EXCLUDED.total_received;
+$$;
+
+CREATE OR REPLACE FUNCTION ar_leasing_rollup_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.start_date, OLD.payment_status, OLD.total_rent, OLD.fee, OLD.received_amount)
+            IS NOT DISTINCT FROM (NEW.start_date, NEW.payment_status, NEW.total_rent, NEW.fee, NEW.received_amount) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM ar_rollup_apply(OLD.start_date, '租賃', OLD.payment_status::text,
+                                OLD.total_rent, OLD.fee, OLD.received_amount, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM ar_rollup_apply(NEW.start_date, '租賃', NEW.payment_status::text,
+                                NEW.total_rent, NEW.fee, NEW.received_amount, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION ar_buyout_rollup_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.deal_date, OLD.payment_status, OLD.total_amount, OLD.fee, OLD.received_amount)
+            IS NOT DISTINCT FROM (NEW.deal_date, NEW.payment_status, NEW.total_amount, NEW.fee, NEW.received_amount) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM ar_rollup_apply(OLD.deal_date, '買斷', OLD.payment_status::text,
+                                OLD.total_amount, OLD.fee, OLD.received_amount, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM ar_rollup_apply(NEW.deal_date, '買斷', NEW.payment_status::text,
+                                NEW.total_amount, NEW.fee, NEW.received_amount, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- 合約的一筆應付（金額 > 0 才計入，與 queries.payable_branches 相同）
+CREATE OR REPLACE FUNCTION payable_rollup_apply(p_day DATE, p_contract_type VARCHAR, p_payable_type VARCHAR,
+                                                p_status TEXT, p_amount NUMERIC, p_sign INT)
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO payable_daily_rollup AS r (day, contract_type, payable_type, payment_status, row_count, total_amount)
+    SELECT COALESCE(p_day, '-infinity'::date), p_contract_type, p_payable_type, COALESCE(p_status, ''),
+           p_sign, p_sign * p_amount
+    WHERE p_amount > 0
+    ON CONFLICT (day, contract_type, payable_type, payment_status) DO UPDATE SET
+        row_count = r.row_count + EXCLUDED.row_count,
+        total_amount = r.total_amount + EXCLUDED.total_amount;
+$$;
+
+CREATE OR REPLACE FUNCTION contracts_leasing_rollup_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.start_date, OLD.sales_amount, OLD.sales_payment_status,
+                             OLD.service_amount, OLD.service_payment_status)
+            IS NOT DISTINCT FROM (NEW.start_date, NEW.sales_amount, NEW.sales_payment_status,
+                                  NEW.service_amount, NEW.service_payment_status) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM payable_rollup_apply(OLD.start_date, '租賃', '業務', OLD.sales_payment_status::text, OLD.sales_amount, -1);
+        PERFORM payable_rollup_apply(OLD.start_date, '租賃', '維護', OLD.service_payment_status::text, OLD.service_amount, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM payable_rollup_apply(NEW.start_date, '租賃', '業務', NEW.sales_payment_status::text, NEW.sales_amount, 1);
+        PERFORM payable_rollup_apply(NEW.start_date, '租賃', '維護', NEW.service_payment_status::text, NEW.service_amount, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION contracts_buyout_rollup_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.deal_date, OLD.sales_amount, OLD.sales_payment_status,
+                             OLD.service_amount, OLD.service_payment_status)
+            IS NOT DISTINCT FROM (NEW.deal_date, NEW.sales_amount, NEW.sales_payment_status,
+                                  NEW.service_amount, NEW.service_payment_status) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM payable_rollup_apply(OLD.deal_date, '買斷', '業務', OLD.sales_payment_status::text, OLD.sales_amount, -1);
+        PERFORM payable_rollup_apply(OLD.deal_date, '買斷', '維護', OLD.service_payment_status::text, OLD.service_amount, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM payable_rollup_apply(NEW.deal_date, '買斷', '業務', NEW.sales_payment_status::text, NEW.sales_amount, 1);
+        PERFORM payable_rollup_apply(NEW.deal_date, '買斷', '維護', NEW.service_payment_status::text, NEW.service_amount, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION bank_ledger_rollup_apply(p_day DATE, p_income NUMERIC, p_expense NUMERIC, p_sign INT)
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO bank_ledger_daily_rollup AS r (day, row_count, total_income, total_expense)
+    VALUES (p_day, p_sign, p_sign * COALESCE(p_income, 0), p_sign * COALESCE(p_expense, 0))
+    ON CONFLICT (day) DO UPDATE SET
+        row_count = r.row_count + EXCLUDED.row_count,
+        total_income = r.total_income + EXCLUDED.total_income,
+        total_expense = r.total_expense + EXCLUDED.total_expense;
+$$;
+
+CREATE OR REPLACE FUNCTION bank_ledger_rollup_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.txn_date, OLD.income, OLD.expense)
+            IS NOT DISTINCT FROM (NEW.txn_date, NEW.income, NEW.expense) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bank_ledger_rollup_apply(OLD.txn_date, OLD.income, OLD.expense, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bank_ledger_rollup_apply(NEW.txn_date, NEW.income, NEW.expense, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ar_leasing_rollup ON ar_leasing;
+CREATE TRIGGER ar_leasing_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON ar_leasing
+    FOR EACH ROW EXECUTE FUNCTION ar_leasing_rollup_trigger();
+
+DROP TRIGGER IF EXISTS ar_buyout_rollup ON ar_buyout;
+CREATE TRIGGER ar_buyout_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON ar_buyout
+    FOR EACH ROW EXECUTE FUNCTION ar_buyout_rollup_trigger();
+
+DROP TRIGGER IF EXISTS contracts_leasing_rollup ON contracts_leasing;
+CREATE TRIGGER contracts_leasing_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON contracts_leasing
+    FOR EACH ROW EXECUTE FUNCTION contracts_leasing_rollup_trigger();
+
+DROP TRIGGER IF EXISTS contracts_buyout_rollup ON contracts_buyout;
+CREATE TRIGGER contracts_buyout_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON contracts_buyout
+    FOR EACH ROW EXECUTE FUNCTION contracts_buyout_rollup_trigger();
+
+DROP TRIGGER IF EXISTS bank_ledger_rollup ON bank_ledger;
+CREATE TRIGGER bank_ledger_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON bank_ledger
+    FOR EACH ROW EXECUTE FUNCTION bank_ledger_rollup_trigger();
+
+-- ===========================================
+-- 回填既有資料（migration 在交易中執行；先鎖定原始資料表避免回填期間的寫入遺漏）
+-- ===========================================
+LOCK TABLE ar_leasing, ar_buyout, contracts_leasing, contracts_buyout, bank_ledger IN SHARE MODE;
+
+DELETE FROM ar_daily_rollup;
+INSERT INTO ar_daily_rollup SELECT * FROM ar_daily_rollup_source;
+DELETE FROM payable_daily_rollup;
+INSERT INTO payable_daily_rollup SELECT * FROM payable_daily_rollup_source;
+DELETE FROM bank_ledger_daily_rollup;
+INSERT INTO bank_ledger_daily_rollup SELECT * FROM bank_ledger_daily_rollup_source;
@@ -0,0 +1,19 @@
+-- ===========================================
+-- 0005 銀行帳本與應收帳款的對帳紀錄（reconcile.py）
+-- ===========================================
+-- 每筆銀行收入最多對應一筆應收帳款；已對帳的收入不會再出現在配對建議中
+CREATE TABLE IF NOT EXISTS reconciliation_matches (
+    id SERIAL PRIMARY KEY,
+    bank_ledger_id INT NOT NULL UNIQUE REFERENCES bank_ledger(id) ON DELETE CASCADE,
+    ar_type VARCHAR(10) NOT NULL,                  -- 租賃 / 買斷
+    ar_id INT NOT NULL,                            -- ar_leasing.id 或 ar_buyout.id
+    amount NUMERIC(12,2) NOT NULL,                 -- 沖銷金額
+    similarity NUMERIC(4,3),                       -- 匯款人與客戶名稱相似度
+    matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS reconciliation_matches_ar_idx ON reconciliation_matches (ar_type, ar_id);
+
+DROP TRIGGER IF EXISTS reconciliation_matches_notify_change ON reconciliation_matches;
+CREATE TRIGGER reconciliation_matches_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON reconciliation_matches
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change();
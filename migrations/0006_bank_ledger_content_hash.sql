@@ -0,0 +1,24 @@
+-- ===========================================
+-- 0006 銀行帳本內容雜湊（bank_import.py 匯入對帳單時判斷重複）
+-- ===========================================
+-- 雜湊依 日期 / 匯款人 / 支出 / 收入 / 備註 計算；空白匯款人、備註視同 NULL，金額 NULL 視同 0，
+-- 與 bank_import.py 寫入前的正規化一致。同一天相同內容的多筆交易以出現次數區分（見 bank_import.IMPORT_SQL）。
+CREATE OR REPLACE FUNCTION bank_ledger_content_hash(
+    p_txn_date DATE,
+    p_payer TEXT,
+    p_expense NUMERIC,
+    p_income NUMERIC,
+    p_note TEXT
+) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT md5(concat_ws(chr(31),
+        to_char(p_txn_date, 'YYYY-MM-DD'),
+        COALESCE(NULLIF(btrim(p_payer), ''), ''),
+        round(COALESCE(p_expense, 0), 2)::text,
+        round(COALESCE(p_income, 0), 2)::text,
+        COALESCE(NULLIF(btrim(p_note), ''), '')
+    ))
+$$;
+
+CREATE INDEX IF NOT EXISTS bank_ledger_content_hash_idx
+    ON bank_ledger (bank_ledger_content_hash(txn_date, payer, expense, income, note));
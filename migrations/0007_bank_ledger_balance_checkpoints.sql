@@ -0,0 +1,90 @@
+-- ===========================================
+-- 0007 銀行帳本每月期初餘額（balances.py 計算餘額欄位使用）
+-- ===========================================
+-- 某月的期初餘額 = 該月 1 日以前所有帳本記錄的 SUM(收入 - 支出)。
+-- 顯示任一頁的餘額只需「該月期初餘額 + 當月資料列」，不必從第一筆開始加總。
+-- 期初餘額在第一次被查詢時才計算並保存；帳本新增 / 修改 / 刪除日期 d 的記錄時，
+-- 觸發器刪除 d 之後各月的期初餘額，下次查詢時再由最近一個仍有效的月份往後重算。
+CREATE TABLE IF NOT EXISTS bank_ledger_balance_checkpoints (
+    month DATE PRIMARY KEY,                 -- 月份第一天
+    opening_balance NUMERIC NOT NULL,       -- 該月 1 日以前的累計餘額
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 觸發器（寫入者）持有排他鎖、補算期初餘額（讀取者）持有共享鎖：
+-- 避免補算時依舊快照寫入的期初餘額，在寫入者刪除過期資料之後才被存入
+CREATE OR REPLACE FUNCTION bank_ledger_balance_lock_key() RETURNS BIGINT
+LANGUAGE sql IMMUTABLE AS $$ SELECT hashtext('bank_ledger_balance_checkpoints')::bigint $$;
+
+-- 指定月份的期初餘額（沒有有效的期初餘額時，由最近一個有效月份往後補算並保存各月）
+CREATE OR REPLACE FUNCTION bank_ledger_opening_balance(p_month DATE) RETURNS NUMERIC
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_month DATE := date_trunc('month', p_month)::date;
+    v_start DATE;
+    v_balance NUMERIC;
+BEGIN
+    SELECT month, opening_balance INTO v_start, v_balance
+    FROM bank_ledger_balance_checkpoints
+    WHERE month <= v_month
+    ORDER BY month DESC
+    LIMIT 1;
+    IF v_start = v_month THEN
+        RETURN v_balance;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock_shared(bank_ledger_balance_lock_key());
+
+    IF v_start IS NULL THEN
+        -- 還沒有任何期初餘額：由第一筆記錄的月份開始（期初為 0）
+        SELECT date_trunc('month', MIN(txn_date))::date INTO v_start FROM bank_ledger;
+        IF v_start IS NULL OR v_start >= v_month THEN
+            RETURN 0;
+        END IF;
+        v_balance := 0;
+    END IF;
+
+    INSERT INTO bank_ledger_balance_checkpoints AS c (month, opening_balance)
+    SELECT m.month::date,
+           v_balance + COALESCE(SUM(t.net) OVER (ORDER BY m.month ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0)
+    FROM generate_series(v_start, v_month, interval '1 month') AS m(month)
+    LEFT JOIN (
+        SELECT date_trunc('month', txn_date)::date AS month,
+               SUM(COALESCE(income, 0) - COALESCE(expense, 0)) AS net
+        FROM bank_ledger
+        WHERE txn_date >= v_start AND txn_date < v_month
+        GROUP BY 1
+    ) AS t ON t.month = m.month::date
+    ON CONFLICT (month) DO UPDATE SET opening_balance = EXCLUDED.opening_balance, computed_at = CURRENT_TIMESTAMP;
+
+    SELECT opening_balance INTO v_balance FROM bank_ledger_balance_checkpoints WHERE month = v_month;
+    RETURN v_balance;
+END;
+$$;
+
+-- 帳本異動時刪除受影響月份之後的期初餘額（日期與金額都沒變的 UPDATE 不處理）
+CREATE OR REPLACE FUNCTION bank_ledger_balance_invalidate() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    v_date DATE;
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.txn_date, OLD.income, OLD.expense)
+            IS NOT DISTINCT FROM (NEW.txn_date, NEW.income, NEW.expense) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        v_date := NEW.txn_date;
+    ELSIF TG_OP = 'DELETE' THEN
+        v_date := OLD.txn_date;
+    ELSE
+        v_date := LEAST(OLD.txn_date, NEW.txn_date);
+    END IF;
+    PERFORM pg_advisory_xact_lock(bank_ledger_balance_lock_key());
+    DELETE FROM bank_ledger_balance_checkpoints WHERE month > v_date;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS bank_ledger_balance_invalidate ON bank_ledger;
+CREATE TRIGGER bank_ledger_balance_invalidate
+    AFTER INSERT OR UPDATE OR DELETE ON bank_ledger
+    FOR EACH ROW EXECUTE FUNCTION bank_ledger_balance_invalidate();
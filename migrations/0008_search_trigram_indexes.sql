@@ -0,0 +1,76 @@
+-- ===========================================
+-- 0008 全文搜尋（pg_trgm 三元組 GIN 索引，search.py）
+-- ===========================================
+-- 搜尋文字函式一律建立；pg_trgm 只在資料庫提供時安裝並建立索引。
+-- 無法安裝 pg_trgm 的環境頁面會改用記憶體索引（search_index.py）；之後才安裝 pg_trgm 時，
+-- 需手動執行本檔（可重複執行）。
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    END IF;
+END$$;
+
+-- 日期轉固定格式文字（YYYY-MM-DD，不受 DateStyle 影響，可用於索引）
+CREATE OR REPLACE FUNCTION search_date_text(d DATE) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT to_char(d, 'YYYY-MM-DD') $$;
+
+-- 各資料表的搜尋文字（小寫、以空白串接所有可搜尋欄位）
+-- 以 public.search_date_text 呼叫：PostgreSQL 17 起建立索引時 search_path 只有 pg_catalog，
+-- 展開（inline）函式時找不到未指定 schema 的函式
+CREATE OR REPLACE FUNCTION customers_search_text(c customers) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(concat_ws(' ', c.customer_code, c.name, c.contact_name, c.mobile, c.phone,
+                                  c.address, c.email, c.tax_id, c.sales_rep_name, c.remark)) $$;
+
+CREATE OR REPLACE FUNCTION companies_search_text(c companies) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(concat_ws(' ', c.company_code, c.name, c.contact_name, c.mobile, c.phone,
+                                  c.address, c.email, c.tax_id, c.sales_rep)) $$;
+
+CREATE OR REPLACE FUNCTION contracts_leasing_search_text(c contracts_leasing) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(concat_ws(' ', '租賃', c.contract_code, c.customer_code, c.customer_name,
+                                  public.search_date_text(c.start_date), c.model, c.quantity::text,
+                                  c.monthly_rent::text, c.payment_cycle_months::text, c.overprint,
+                                  c.contract_months::text, c.sales_company_code, c.sales_amount::text,
+                                  c.service_company_code, c.service_amount::text)) $$;
+
+CREATE OR REPLACE FUNCTION contracts_buyout_search_text(c contracts_buyout) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(concat_ws(' ', '買斷', c.contract_code, c.customer_code, c.customer_name,
+                                  public.search_date_text(c.deal_date), c.deal_amount::text,
+                                  c.sales_company_code, c.sales_amount::text,
+                                  c.service_company_code, c.service_amount::text)) $$;
+
+CREATE OR REPLACE FUNCTION ar_leasing_search_text(a ar_leasing) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(concat_ws(' ', '租賃', a.contract_code, a.customer_code, a.customer_name,
+                                  public.search_date_text(a.start_date), public.search_date_text(a.end_date),
+                                  a.total_rent::text, a.fee::text, a.received_amount::text,
+                                  a.payment_status::text)) $$;
+
+CREATE OR REPLACE FUNCTION ar_buyout_search_text(a ar_buyout) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(concat_ws(' ', '買斷', a.contract_code, a.customer_code, a.customer_name,
+                                  public.search_date_text(a.deal_date), a.total_amount::text, a.fee::text,
+                                  a.received_amount::text, a.payment_status::text)) $$;
+
+CREATE OR REPLACE FUNCTION bank_ledger_search_text(b bank_ledger) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(concat_ws(' ', public.search_date_text(b.txn_date), b.payer,
+                                  b.expense::text, b.income::text, b.note)) $$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS customers_search_trgm_idx ON customers USING gin (customers_search_text(customers) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS companies_search_trgm_idx ON companies USING gin (companies_search_text(companies) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS contracts_leasing_search_trgm_idx ON contracts_leasing USING gin (contracts_leasing_search_text(contracts_leasing) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS contracts_buyout_search_trgm_idx ON contracts_buyout USING gin (contracts_buyout_search_text(contracts_buyout) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ar_leasing_search_trgm_idx ON ar_leasing USING gin (ar_leasing_search_text(ar_leasing) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ar_buyout_search_trgm_idx ON ar_buyout USING gin (ar_buyout_search_text(ar_buyout) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS bank_ledger_search_trgm_idx ON bank_ledger USING gin (bank_ledger_search_text(bank_ledger) gin_trgm_ops);
+    END IF;
+END$$;
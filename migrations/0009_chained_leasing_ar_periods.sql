@@ -0,0 +1,34 @@
+-- ===========================================
+-- 0009 租賃應收帳款排程改回逐期推算（與 ar_schedule.leasing_periods 相同規則）
+-- ===========================================
+
+-- 0002 的各期日期由合約起始日加月數計算，與原本頁面產生的帳款不同：
+-- 起始日為 1/31、月繳時原本第三期為 3/29（1/31 → 2/29 → 3/29），0002 會算成 3/31。
+-- 改回原規則：結束日期 = 起始日 + 月數 - 1天，下一期的起始日 = 本期結束日 + 1天。
+CREATE OR REPLACE FUNCTION leasing_ar_periods(
+    p_start_date DATE,
+    p_monthly_rent NUMERIC,
+    p_payment_cycle_months INT,
+    p_contract_months INT
+) RETURNS TABLE (period_start DATE, period_end DATE, period_rent NUMERIC)
+LANGUAGE sql IMMUTABLE AS $$
+    WITH RECURSIVE p(month_from, period_start) AS (
+        -- 週期或合約月數為 0、負數或 NULL 時不回傳任何列
+        SELECT 0, p_start_date
+        WHERE p_payment_cycle_months > 0 AND p_contract_months > 0
+        UNION ALL
+        -- 本期結束日 + 1天 = 本期起始日 + 週期月數（月底自動調整，例如 1/31 + 1 個月 = 2/28 或 2/29）
+        SELECT p.month_from + p_payment_cycle_months,
+               (p.period_start + make_interval(months => p_payment_cycle_months))::date
+        FROM p
+        WHERE p.month_from + p_payment_cycle_months < p_contract_months
+    )
+    SELECT p.period_start,
+           (p.period_start + make_interval(months => m.months))::date - 1,
+           p_monthly_rent * m.months
+    FROM p
+    CROSS JOIN LATERAL (
+        SELECT LEAST(p_payment_cycle_months, p_contract_months - p.month_from) AS months
+    ) AS m
+    ORDER BY p.month_from
+$$;
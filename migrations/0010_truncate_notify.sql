@@ -0,0 +1,60 @@
+-- ===========================================
+-- 0010 TRUNCATE 的資料異動通知
+-- ===========================================
+-- 0000 的觸發程序為 FOR EACH ROW，TRUNCATE 不會觸發，各應用程式行程的查詢快取與搜尋索引不會失效。
+-- 另建 FOR EACH STATEMENT 的 TRUNCATE 觸發程序，payload 不含 id（cache_listener 視為整個資料表異動）。
+CREATE OR REPLACE FUNCTION notify_table_truncate() RETURNS trigger AS $$
+BEGIN
+    -- payload：{"table": 資料表名稱, "op": "TRUNCATE"}
+    PERFORM pg_notify(
+        'table_changes',
+        json_build_object('table', TG_TABLE_NAME, 'op', TG_OP)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS customers_notify_truncate ON customers;
+CREATE TRIGGER customers_notify_truncate
+    AFTER TRUNCATE ON customers
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS companies_notify_truncate ON companies;
+CREATE TRIGGER companies_notify_truncate
+    AFTER TRUNCATE ON companies
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS contracts_leasing_notify_truncate ON contracts_leasing;
+CREATE TRIGGER contracts_leasing_notify_truncate
+    AFTER TRUNCATE ON contracts_leasing
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS contracts_buyout_notify_truncate ON contracts_buyout;
+CREATE TRIGGER contracts_buyout_notify_truncate
+    AFTER TRUNCATE ON contracts_buyout
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS ar_leasing_notify_truncate ON ar_leasing;
+CREATE TRIGGER ar_leasing_notify_truncate
+    AFTER TRUNCATE ON ar_leasing
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS ar_buyout_notify_truncate ON ar_buyout;
+CREATE TRIGGER ar_buyout_notify_truncate
+    AFTER TRUNCATE ON ar_buyout
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS service_expense_notify_truncate ON service_expense;
+CREATE TRIGGER service_expense_notify_truncate
+    AFTER TRUNCATE ON service_expense
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS bank_ledger_notify_truncate ON bank_ledger;
+CREATE TRIGGER bank_ledger_notify_truncate
+    AFTER TRUNCATE ON bank_ledger
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
+
+DROP TRIGGER IF EXISTS reconciliation_matches_notify_truncate ON reconciliation_matches;
+CREATE TRIGGER reconciliation_matches_notify_truncate
+    AFTER TRUNCATE ON reconciliation_matches
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate();
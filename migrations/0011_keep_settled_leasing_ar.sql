@@ -0,0 +1,42 @@
+-- ===========================================
+-- 0011 重新產生租賃應收帳款時保留已收款的帳款
+-- ===========================================
+-- 0002 的 generate_leasing_ar 會刪除合約的全部帳款再重新寫入：已收金額與繳費狀況被重設，
+-- reconciliation_matches.ar_id（沒有外鍵）也會指向已刪除的帳款。
+-- 改為只刪除未收款、沒有已收金額也沒有對帳紀錄的帳款，排程中已有保留帳款的期間（起始日相同）不再寫入，
+-- 重新寫入的期間沿用原本的手續費（規則同 ar_schedule.regenerate_leasing_ar）。
+CREATE OR REPLACE FUNCTION generate_leasing_ar(p_contract_codes VARCHAR[]) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    -- 同一個陳述式中 ar_leasing 仍是刪除前的快照：排除 cleared 的主鍵即為保留的帳款
+    WITH cleared AS (
+        DELETE FROM ar_leasing a
+        WHERE a.contract_code = ANY(p_contract_codes)
+          AND a.payment_status = '未收' AND COALESCE(a.received_amount, 0) = 0
+          AND NOT EXISTS (SELECT 1 FROM reconciliation_matches m WHERE m.ar_type = '租賃' AND m.ar_id = a.id)
+        RETURNING a.id, a.contract_code, a.start_date, a.fee
+    ), cleared_fees AS (
+        SELECT DISTINCT ON (contract_code, start_date) contract_code, start_date, fee
+        FROM cleared
+        ORDER BY contract_code, start_date, id
+    )
+    INSERT INTO ar_leasing (contract_code, customer_code, customer_name, start_date, end_date,
+                            total_rent, fee, received_amount, payment_status)
+    SELECT c.contract_code, c.customer_code, c.customer_name,
+           p.period_start, p.period_end, p.period_rent, COALESCE(d.fee, 0), 0, '未收'
+    FROM contracts_leasing c
+    CROSS JOIN LATERAL leasing_ar_periods(c.start_date, c.monthly_rent,
+                                          c.payment_cycle_months, c.contract_months) AS p
+    LEFT JOIN cleared_fees d ON d.contract_code = c.contract_code AND d.start_date = p.period_start
+    WHERE c.contract_code = ANY(p_contract_codes)
+      AND NOT EXISTS (SELECT 1 FROM ar_leasing k
+                      WHERE k.contract_code = c.contract_code AND k.start_date = p.period_start
+                        AND k.id NOT IN (SELECT id FROM cleared))
+    ORDER BY c.contract_code, p.period_start;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
@@ -1,8 +1,13 @@
 import streamlit as st
-from db_config import get_connection
-import pandas as pd
+from query_panel import query_debug_panel
+from db_config import get_connection, invalidate_rows
+from frames import fetch_frame, frame_record
+from search import has_trgm_search, search_params, SEARCH_LIMIT
+from queries import list_query
+from search_index import filter_with_index
 
 st.set_page_config(page_title="客戶資料查詢", page_icon="👥", layout="wide")
+query_debug_panel("客戶資料查詢")
 
 st.title("👥 客戶資料查詢")
 
@@ -47,9 +52,12 @@ def add_customer_dialog():
                                 (customer_code, name, contact_name, mobile, phone, address, 
                                  email, tax_id, sales_rep_name, remark)
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                RETURNING id
                             """, (customer_code, name, contact_name, mobile, phone, address,
                                   email, tax_id, sales_rep_name, remark))
+                            changed = {row[0] for row in cur.fetchall()}
                             conn.commit()
+                    invalidate_rows({'customers': changed})
                     st.success("✅ 客戶新增成功！")
                     st.rerun()
                 except Exception as e:
@@ -101,9 +109,12 @@ def edit_customer_dialog(customer_data):
                                     sales_rep_name = %s, remark = %s,
                                     updated_at = CURRENT_TIMESTAMP
                                 WHERE customer_code = %s
+                                RETURNING id
                             """, (name, contact_name, mobile, phone, address, email,
                                   tax_id, sales_rep_name, remark, customer_code))
+                            changed = {row[0] for row in cur.fetchall()}
                             conn.commit()
+                    invalidate_rows({'customers': changed})
                     st.success("✅ 客戶更新成功！")
                     st.rerun()
                 except Exception as e:
@@ -123,34 +134,27 @@ st.divider()
 # 載入並顯示客戶資料
 # ============================================
 try:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            # 查詢所有客戶資料，按客戶代碼排序
-            cur.execute("""
-                SELECT id, customer_code, name, contact_name, mobile, phone, 
-                       address, email, tax_id, sales_rep_name, remark
-                FROM customers
-                ORDER BY customer_code
-            """)
-            customers = cur.fetchall()
+    # 有搜尋字串且資料庫已安裝 pg_trgm 時，直接在資料庫搜尋（依相關度排序）
+    use_sql_search = bool(search_term) and has_trgm_search()
     
-    if not customers:
+    sql, columns = list_query('customers', search=use_sql_search)
+    customers = fetch_frame(sql, search_params(search_term) if use_sql_search else None, columns)
+    
+    if customers.empty and not search_term:
         st.info("📝 目前沒有客戶資料")
     else:
-        # 轉換為 DataFrame
-        columns = ['id', 'customer_code', 'name', 'contact_name', 'mobile', 'phone', 
-                   'address', 'email', 'tax_id', 'sales_rep_name', 'remark']
-        df = pd.DataFrame(customers, columns=columns)
+        df = customers
         
-        # 搜尋功能
-        if search_term:
-            mask = df.astype(str).apply(lambda row: row.str.contains(search_term, case=False, na=False).any(), axis=1)
-            df = df[mask]
+        # 搜尋功能（未安裝 pg_trgm 時使用記憶體索引）
+        if search_term and not use_sql_search:
+            df = filter_with_index(df, 'customers', search_term)
         
         if len(df) == 0:
             st.warning(f"🔍 找不到符合 '{search_term}' 的客戶資料")
         else:
             st.write(f"共 {len(df)} 筆客戶資料")
+            if use_sql_search and len(df) >= SEARCH_LIMIT:
+                st.caption(f"僅顯示最相關的 {SEARCH_LIMIT} 筆，請輸入更精確的關鍵字")
             
             # 三個按鈕在同一行（表格上方）
             col_add, col_edit, col_delete, col_space = st.columns([1, 1, 1, 7])
@@ -166,7 +170,7 @@ try:
                         selected_id = st.session_state['selected_customer_id']
                         if selected_id in df['id'].values:
                             selected_row = df[df['id'] == selected_id].iloc[0]
-                            edit_customer_dialog(selected_row.to_dict())
+                            edit_customer_dialog(frame_record(selected_row))
                         else:
                             st.warning("⚠️ 請先點選要編輯的客戶資料")
                     else:
@@ -236,8 +240,10 @@ try:
                                 try:
                                     with get_connection() as conn:
                                         with conn.cursor() as cur:
-                                            cur.execute("DELETE FROM customers WHERE id = %s", (selected_id,))
+                                            cur.execute("DELETE FROM customers WHERE id = %s RETURNING id", (selected_id,))
+                                            changed = {row[0] for row in cur.fetchall()}
                                             conn.commit()
+                                    invalidate_rows({'customers': changed})
                                     st.success("✅ 刪除成功！")
                                     if 'confirm_delete_selected' in st.session_state:
                                         del st.session_state['confirm_delete_selected']
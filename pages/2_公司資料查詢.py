@@ -1,8 +1,14 @@
 import streamlit as st
-from db_config import get_connection
-import pandas as pd
+from query_panel import query_debug_panel
+from db_config import get_connection, invalidate_rows
+from frames import fetch_frame, frame_record
+from search import has_trgm_search, search_params, SEARCH_LIMIT
+from queries import list_query
+from search_index import filter_with_index
+from display import select_label
 
 st.set_page_config(page_title="公司資料查詢", page_icon="🏢", layout="wide")
+query_debug_panel("公司資料查詢")
 
 st.title("🏢 公司資料查詢")
 
@@ -53,9 +59,12 @@ def add_company_dialog():
                                 (company_code, name, contact_name, mobile, phone, address, 
                                  email, tax_id, sales_rep, is_sales, is_service)
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                RETURNING id
                             """, (company_code, name, contact_name, mobile, phone, address,
                                   email, tax_id, sales_rep, is_sales, is_service))
+                            changed = {row[0] for row in cur.fetchall()}
                             conn.commit()
+                    invalidate_rows({'companies': changed})
                     st.success("✅ 公司新增成功！")
                     st.rerun()
                 except Exception as e:
@@ -113,9 +122,12 @@ def edit_company_dialog(company_data):
                                     sales_rep = %s, is_sales = %s, is_service = %s,
                                     updated_at = CURRENT_TIMESTAMP
                                 WHERE company_code = %s
+                                RETURNING id
                             """, (name, contact_name, mobile, phone, address, email,
                                   tax_id, sales_rep, is_sales, is_service, company_code))
+                            changed = {row[0] for row in cur.fetchall()}
                             conn.commit()
+                    invalidate_rows({'companies': changed})
                     st.success("✅ 公司更新成功！")
                     st.rerun()
                 except Exception as e:
@@ -148,24 +160,16 @@ st.divider()
 # 載入並顯示公司資料
 # ============================================
 try:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            # 查詢所有公司資料，按公司代碼排序
-            cur.execute("""
-                SELECT id, company_code, name, contact_name, mobile, phone, 
-                       address, email, tax_id, sales_rep, is_sales, is_service
-                FROM companies
-                ORDER BY company_code
-            """)
-            companies = cur.fetchall()
+    # 有搜尋字串且資料庫已安裝 pg_trgm 時，直接在資料庫搜尋（依相關度排序）
+    use_sql_search = bool(search_term) and has_trgm_search()
     
-    if not companies:
+    sql, columns = list_query('companies', search=use_sql_search)
+    companies = fetch_frame(sql, search_params(search_term) if use_sql_search else None, columns)
+    
+    if companies.empty and not search_term:
         st.info("📝 目前沒有公司資料")
     else:
-        # 轉換為 DataFrame
-        columns = ['id', 'company_code', 'name', 'contact_name', 'mobile', 'phone', 
-                   'address', 'email', 'tax_id', 'sales_rep', 'is_sales', 'is_service']
-        df = pd.DataFrame(companies, columns=columns)
+        df = companies
         
         # 根據篩選條件過濾資料
         if company_type_filter == "業務公司":
@@ -178,15 +182,16 @@ try:
             df = df[(df['is_sales'] == False) & (df['is_service'] == False)]
         # "全部" 則不需要過濾
         
-        # 搜尋功能
-        if search_term:
-            mask = df.astype(str).apply(lambda row: row.str.contains(search_term, case=False, na=False).any(), axis=1)
-            df = df[mask]
+        # 搜尋功能（未安裝 pg_trgm 時使用記憶體索引）
+        if search_term and not use_sql_search:
+            df = filter_with_index(df, 'companies', search_term)
         
         if len(df) == 0:
             st.warning(f"🔍 找不到符合條件的公司資料")
         else:
             st.write(f"共 {len(df)} 筆公司資料")
+            if use_sql_search and len(companies) >= SEARCH_LIMIT:
+                st.caption(f"僅顯示最相關的 {SEARCH_LIMIT} 筆，請輸入更精確的關鍵字")
             
             # 三個按鈕在同一行（表格上方）
             col_add, col_edit, col_delete, col_space = st.columns([1, 1, 1, 7])
@@ -202,7 +207,7 @@ try:
                         selected_id = st.session_state['selected_company_id']
                         if selected_id in df['id'].values:
                             selected_row = df[df['id'] == selected_id].iloc[0]
-                            edit_company_dialog(selected_row.to_dict())
+                            edit_company_dialog(frame_record(selected_row))
                         else:
                             st.warning("⚠️ 請先點選要編輯的公司資料")
                     else:
@@ -225,18 +230,13 @@ try:
             # 準備顯示用的 DataFrame（隱藏 id，重新命名欄位，添加公司類型標籤）
             display_df = df.copy()
             
-            # 創建公司類型標籤欄位
-            def get_company_type_label(row):
-                if row['is_sales'] and row['is_service']:
-                    return "業務+維護"
-                elif row['is_sales']:
-                    return "業務"
-                elif row['is_service']:
-                    return "維護"
-                else:
-                    return "-"
-            
-            display_df['公司類型'] = display_df.apply(get_company_type_label, axis=1)
+            # 創建公司類型標籤欄位（整欄一次判斷）
+            is_sales = display_df['is_sales'].fillna(False).astype(bool)
+            is_service = display_df['is_service'].fillna(False).astype(bool)
+            display_df['公司類型'] = select_label(
+                [is_sales & is_service, is_sales, is_service],
+                ["業務+維護", "業務", "維護"]
+            )
             
             display_df = display_df.rename(columns={
                 'company_code': '公司代碼',
@@ -310,8 +310,10 @@ try:
                                                 st.error(f"❌ 無法刪除！此公司有 {total_refs} 筆相關合約或服務記錄，請先處理相關資料。")
                                             else:
                                                 # 刪除公司
-                                                cur.execute("DELETE FROM companies WHERE id = %s", (selected_id,))
+                                                cur.execute("DELETE FROM companies WHERE id = %s RETURNING id", (selected_id,))
+                                                changed = {row[0] for row in cur.fetchall()}
                                                 conn.commit()
+                                                invalidate_rows({'companies': changed})
                                                 st.success("✅ 刪除成功！")
                                                 if 'confirm_delete_selected' in st.session_state:
                                                     del st.session_state['confirm_delete_selected']
@@ -1,9 +1,17 @@
 import streamlit as st
-from db_config import get_connection
+from query_panel import query_debug_panel
+from db_config import get_connection, fetch_all, invalidate_rows, invalidate_tables
+from frames import fetch_frame, frame_record
 import pandas as pd
+from search import has_trgm_search, search_params, SEARCH_LIMIT
+from queries import list_query
+from search_index import filter_with_index
 from datetime import date
+from ar_schedule import leasing_ar_rows, write_leasing_ar, regenerate_leasing_ar
+from display import format_columns
 
 st.set_page_config(page_title="合約資料查詢", page_icon="📄", layout="wide")
+query_debug_panel("合約資料查詢")
 
 st.title("📄 合約資料查詢")
 
@@ -13,25 +21,21 @@ st.title("📄 合約資料查詢")
 def load_companies():
     """載入公司資料並建立映射"""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # 載入業務公司
-                cur.execute("""
-                    SELECT company_code, name 
-                    FROM companies 
-                    WHERE is_sales = TRUE
-                    ORDER BY name
-                """)
-                sales_companies = cur.fetchall()
-                
-                # 載入維護公司
-                cur.execute("""
-                    SELECT company_code, name 
-                    FROM companies 
-                    WHERE is_service = TRUE
-                    ORDER BY name
-                """)
-                service_companies = cur.fetchall()
+        # 載入業務公司
+        sales_companies = fetch_all("""
+            SELECT company_code, name 
+            FROM companies 
+            WHERE is_sales = TRUE
+            ORDER BY name
+        """)
+        
+        # 載入維護公司
+        service_companies = fetch_all("""
+            SELECT company_code, name 
+            FROM companies 
+            WHERE is_service = TRUE
+            ORDER BY name
+        """)
         
         # 建立映射字典
         sales_name_to_code = {name: code for code, name in sales_companies}
@@ -66,14 +70,11 @@ if companies_data is None:
 def load_customers():
     """載入客戶資料並建立映射"""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT customer_code, name 
-                    FROM customers 
-                    ORDER BY name
-                """)
-                customers = cur.fetchall()
+        customers = fetch_all("""
+            SELECT customer_code, name 
+            FROM customers 
+            ORDER BY name
+        """)
         
         # 建立映射字典
         customer_name_to_code = {name: code for code, name in customers}
@@ -102,66 +103,27 @@ if customers_data is None:
 def generate_leasing_ar(contract_code, customer_code, customer_name, start_date, 
                         monthly_rent, payment_cycle_months, contract_months, conn):
     """
-    根據租賃合約自動生成多筆租賃應收帳款
+    根據租賃合約自動生成多筆租賃應收帳款（先算出各期，再一次批次寫入），回傳異動的帳款主鍵
     """
-    from dateutil.relativedelta import relativedelta
-    
     try:
+        rows = leasing_ar_rows(contract_code, customer_code, customer_name, start_date,
+                               monthly_rent, payment_cycle_months, contract_months)
         with conn.cursor() as cur:
-            # 先刪除該合約的舊應收帳款（用於編輯時）
-            cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (contract_code,))
-            
-            # 計算需要生成多少筆
-            total_periods = contract_months // payment_cycle_months  # 完整期數
-            remaining_months = contract_months % payment_cycle_months  # 剩餘月數
-            
-            current_start = start_date
-            
-            # 生成完整期數的應收帳款
-            for i in range(total_periods):
-                # 計算結束日期（起始日 + 繳費週期月數 - 1天）
-                current_end = current_start + relativedelta(months=payment_cycle_months, days=-1)
-                # 計算該期總租金
-                period_rent = monthly_rent * payment_cycle_months
-                
-                # 插入應收帳款
-                cur.execute("""
-                    INSERT INTO ar_leasing 
-                    (contract_code, customer_code, customer_name, start_date, end_date, 
-                     total_rent, fee, received_amount, payment_status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (contract_code, customer_code, customer_name, current_start, current_end,
-                      period_rent, 0, 0, '未收'))
-                
-                # 下一期的起始日 = 本期結束日 + 1天
-                current_start = current_end + relativedelta(days=1)
-            
-            # 如果有剩餘月數，生成最後一筆
-            if remaining_months > 0:
-                current_end = current_start + relativedelta(months=remaining_months, days=-1)
-                period_rent = monthly_rent * remaining_months
-                
-                cur.execute("""
-                    INSERT INTO ar_leasing 
-                    (contract_code, customer_code, customer_name, start_date, end_date, 
-                     total_rent, fee, received_amount, payment_status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (contract_code, customer_code, customer_name, current_start, current_end,
-                      period_rent, 0, 0, '未收'))
-            
-            return True
+            # 先刪除該合約的舊應收帳款（用於編輯時），再寫入新的各期帳款
+            return write_leasing_ar(cur, contract_code, rows)
     except Exception as e:
         raise Exception(f"生成租賃應收帳款失敗：{e}")
 
 def generate_buyout_ar(contract_code, customer_code, customer_name, deal_date, 
                        deal_amount, conn):
     """
-    根據買斷合約自動生成買斷應收帳款（1筆）
+    根據買斷合約自動生成買斷應收帳款（1筆），回傳異動的帳款主鍵
     """
     try:
         with conn.cursor() as cur:
             # 先刪除該合約的舊應收帳款（用於編輯時）
-            cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s", (contract_code,))
+            cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s RETURNING id", (contract_code,))
+            changed = {row[0] for row in cur.fetchall()}
             
             # 插入買斷應收帳款
             cur.execute("""
@@ -169,10 +131,11 @@ def generate_buyout_ar(contract_code, customer_code, customer_name, deal_date,
                 (contract_code, customer_code, customer_name, deal_date, 
                  total_amount, fee, received_amount, payment_status)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
             """, (contract_code, customer_code, customer_name, deal_date,
                   deal_amount, 0, 0, '未收'))
-            
-            return True
+            changed.update(row[0] for row in cur.fetchall())
+            return changed
     except Exception as e:
         raise Exception(f"生成買斷應收帳款失敗：{e}")
 
@@ -247,17 +210,20 @@ def add_leasing_dialog():
                                  quantity, monthly_rent, payment_cycle_months, overprint, contract_months,
                                  sales_company_code, sales_amount, service_company_code, service_amount)
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                RETURNING id
                             """, (contract_code, customer_code, customer_name, start_date, model,
                                   quantity, monthly_rent, payment_cycle_months, overprint, contract_months,
                                   sales_company_code, sales_amount, service_company_code, service_amount))
+                            contract_ids = {row[0] for row in cur.fetchall()}
                         
                         # 自動生成租賃應收帳款
-                        generate_leasing_ar(
+                        ar_ids = generate_leasing_ar(
                             contract_code, customer_code, customer_name, start_date,
                             monthly_rent, payment_cycle_months, contract_months, conn
                         )
                         
                         conn.commit()
+                    invalidate_rows({'contracts_leasing': contract_ids, 'ar_leasing': ar_ids})
                     st.success("✅ 租賃合約新增成功！已自動生成應收帳款。")
                     st.rerun()
                 except Exception as e:
@@ -364,17 +330,20 @@ def edit_leasing_dialog(contract_data):
                                     sales_amount = %s, service_company_code = %s, service_amount = %s,
                                     updated_at = CURRENT_TIMESTAMP
                                 WHERE contract_code = %s
+                                RETURNING id
                             """, (customer_code, customer_name, start_date, model, quantity, monthly_rent,
                                   payment_cycle_months, overprint, contract_months, sales_company_code,
                                   sales_amount, service_company_code, service_amount, contract_code))
+                            contract_ids = {row[0] for row in cur.fetchall()}
                         
                         # 重新生成租賃應收帳款
-                        generate_leasing_ar(
+                        ar_ids = generate_leasing_ar(
                             contract_code, customer_code, customer_name, start_date,
                             monthly_rent, payment_cycle_months, contract_months, conn
                         )
                         
                         conn.commit()
+                    invalidate_rows({'contracts_leasing': contract_ids, 'ar_leasing': ar_ids})
                     st.success("✅ 租賃合約更新成功！已重新生成應收帳款。")
                     st.rerun()
                 except Exception as e:
@@ -447,16 +416,19 @@ def add_buyout_dialog():
                                 (contract_code, customer_code, customer_name, deal_date, deal_amount,
                                  sales_company_code, sales_amount, service_company_code, service_amount)
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                RETURNING id
                             """, (contract_code, customer_code, customer_name, deal_date, deal_amount,
                                   sales_company_code, sales_amount, service_company_code, service_amount))
+                            contract_ids = {row[0] for row in cur.fetchall()}
                         
                         # 自動生成買斷應收帳款
-                        generate_buyout_ar(
+                        ar_ids = generate_buyout_ar(
                             contract_code, customer_code, customer_name, deal_date,
                             deal_amount, conn
                         )
                         
                         conn.commit()
+                    invalidate_rows({'contracts_buyout': contract_ids, 'ar_buyout': ar_ids})
                     st.success("✅ 買斷合約新增成功！已自動生成應收帳款。")
                     st.rerun()
                 except Exception as e:
@@ -557,17 +529,20 @@ def edit_buyout_dialog(contract_data):
                                     service_company_code = %s, service_amount = %s,
                                     updated_at = CURRENT_TIMESTAMP
                                 WHERE contract_code = %s
+                                RETURNING id
                             """, (customer_code, customer_name, deal_date, deal_amount,
                                   sales_company_code, sales_amount, service_company_code, 
                                   service_amount, contract_code))
+                            contract_ids = {row[0] for row in cur.fetchall()}
                         
                         # 重新生成買斷應收帳款
-                        generate_buyout_ar(
+                        ar_ids = generate_buyout_ar(
                             contract_code, customer_code, customer_name, deal_date,
                             deal_amount, conn
                         )
                         
                         conn.commit()
+                    invalidate_rows({'contracts_buyout': contract_ids, 'ar_buyout': ar_ids})
                     st.success("✅ 買斷合約更新成功！已重新生成應收帳款。")
                     st.rerun()
                 except Exception as e:
@@ -576,6 +551,40 @@ def edit_buyout_dialog(contract_data):
         if cancelled:
             st.rerun()
 
+# ============================================
+# 重新產生全部租賃應收帳款 Dialog
+# ============================================
+@st.dialog("重新產生租賃應收帳款", width="large")
+def regenerate_leasing_ar_dialog():
+    st.warning("⚠️ 將依目前的租賃合約重新產生所有未收款的租賃應收帳款（沿用原本的手續費）；"
+               "已有收款或對帳紀錄的帳款會保留，不會重設。")
+    
+    col_submit, col_cancel = st.columns([1, 5])
+    with col_submit:
+        submitted = st.button("✅ 確定", use_container_width=True, key="regenerate_ar_yes")
+    with col_cancel:
+        cancelled = st.button("❌ 取消", use_container_width=True, key="regenerate_ar_no")
+    
+    if submitted:
+        progress_bar = st.progress(0.0, text="準備中...")
+        
+        def report(done, total):
+            progress_bar.progress(done / total, text=f"已處理 {done}/{total} 份合約")
+        
+        try:
+            # 所有合約在同一個交易中處理，失敗時全部還原
+            with get_connection() as conn:
+                result = regenerate_leasing_ar(conn, progress=report)
+            # 全部合約的帳款都重新產生，主鍵不另外收集（搜尋索引整個重建）
+            invalidate_tables('ar_leasing')
+            st.success(f"✅ 已重新產生 {result.contracts} 份合約、{result.rows} 筆應收帳款，"
+                       f"保留 {result.kept} 筆已收款或已對帳的帳款")
+        except Exception as e:
+            st.error(f"❌ 重新產生失敗：{e}")
+    
+    if cancelled:
+        st.rerun()
+
 # ============================================
 # 搜尋功能（最上方）
 # ============================================
@@ -597,40 +606,30 @@ contract_type = st.selectbox(
 # ============================================
 if contract_type == "租賃合約":
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, contract_code, customer_code, customer_name, start_date, 
-                           model, quantity, monthly_rent, payment_cycle_months, overprint, 
-                           contract_months, sales_company_code, sales_amount, 
-                           service_company_code, service_amount
-                    FROM contracts_leasing
-                    ORDER BY contract_code
-                """)
-                contracts = cur.fetchall()
-        
-        if not contracts:
+        # 有搜尋字串且資料庫已安裝 pg_trgm 時，直接在資料庫搜尋（依相關度排序）
+        use_sql_search = bool(search_term) and has_trgm_search()
+        
+        sql, columns = list_query('contracts_leasing', search=use_sql_search)
+        contracts = fetch_frame(sql, search_params(search_term) if use_sql_search else None, columns)
+        
+        if contracts.empty and not search_term:
             st.info("📝 目前沒有租賃合約資料")
         else:
-            # 轉換為 DataFrame
-            columns = ['id', 'contract_code', 'customer_code', 'customer_name', 'start_date',
-                      'model', 'quantity', 'monthly_rent', 'payment_cycle_months', 'overprint',
-                      'contract_months', 'sales_company_code', 'sales_amount',
-                      'service_company_code', 'service_amount']
-            df = pd.DataFrame(contracts, columns=columns)
+            df = contracts
             
-            # 搜尋功能
-            if search_term:
-                mask = df.astype(str).apply(lambda row: row.str.contains(search_term, case=False, na=False).any(), axis=1)
-                df = df[mask]
+            # 搜尋功能（未安裝 pg_trgm 時使用記憶體索引）
+            if search_term and not use_sql_search:
+                df = filter_with_index(df, 'contracts_leasing', search_term)
             
             if len(df) == 0:
                 st.warning(f"🔍 找不到符合 '{search_term}' 的租賃合約")
             else:
                 st.write(f"共 {len(df)} 筆租賃合約")
+                if use_sql_search and len(df) >= SEARCH_LIMIT:
+                    st.caption(f"僅顯示最相關的 {SEARCH_LIMIT} 筆，請輸入更精確的關鍵字")
                 
-                # 三個按鈕在同一行（表格上方）
-                col_add, col_edit, col_delete, col_space = st.columns([1, 1, 1, 7])
+                # 按鈕在同一行（表格上方）
+                col_add, col_edit, col_delete, col_regenerate, col_space = st.columns([1, 1, 1, 1.5, 5.5])
                 
                 with col_add:
                     if st.button("➕ 新增租賃合約", use_container_width=True, type="primary", key="add_leasing_btn"):
@@ -643,7 +642,7 @@ if contract_type == "租賃合約":
                             selected_id = st.session_state['selected_leasing_id']
                             if selected_id in df['id'].values:
                                 selected_row = df[df['id'] == selected_id].iloc[0]
-                                edit_leasing_dialog(selected_row.to_dict())
+                                edit_leasing_dialog(frame_record(selected_row))
                             else:
                                 st.warning("⚠️ 請先點選要編輯的合約資料")
                         else:
@@ -661,6 +660,10 @@ if contract_type == "租賃合約":
                         else:
                             st.warning("⚠️ 請先點選要刪除的合約資料")
                 
+                with col_regenerate:
+                    if st.button("🔄 重新產生應收帳款", use_container_width=True, key="regenerate_leasing_ar_btn"):
+                        regenerate_leasing_ar_dialog()
+                
                 st.divider()
                 
                 # 準備顯示用的 DataFrame
@@ -683,10 +686,7 @@ if contract_type == "租賃合約":
                 })
                 
                 # 格式化日期和金額
-                display_df['起始日'] = display_df['起始日'].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else '-')
-                display_df['月租金'] = display_df['月租金'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['業務金額'] = display_df['業務金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['維護金額'] = display_df['維護金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
+                column_config = format_columns(display_df, money=['月租金', '業務金額', '維護金額'], dates=['起始日'])
                 
                 # 顯示表格
                 selection = st.dataframe(
@@ -695,6 +695,7 @@ if contract_type == "租賃合約":
                                '維護公司代碼', '維護金額']],
                     use_container_width=True,
                     hide_index=True,
+                    column_config=column_config,
                     on_select="rerun",
                     selection_mode="single-row",
                     key="leasing_table"
@@ -726,10 +727,13 @@ if contract_type == "租賃合約":
                                         with get_connection() as conn:
                                             with conn.cursor() as cur:
                                                 # 先刪除相關應收帳款（子表）
-                                                cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s", (selected_row['contract_code'],))
+                                                cur.execute("DELETE FROM ar_leasing WHERE contract_code = %s RETURNING id", (selected_row['contract_code'],))
+                                                ar_ids = {row[0] for row in cur.fetchall()}
                                                 # 再刪除租賃合約（父表）
-                                                cur.execute("DELETE FROM contracts_leasing WHERE id = %s", (selected_id,))
+                                                cur.execute("DELETE FROM contracts_leasing WHERE id = %s RETURNING id", (selected_id,))
+                                                contract_ids = {row[0] for row in cur.fetchall()}
                                                 conn.commit()
+                                        invalidate_rows({'contracts_leasing': contract_ids, 'ar_leasing': ar_ids})
                                         st.success("✅ 刪除成功！")
                                         if 'confirm_delete_leasing' in st.session_state:
                                             del st.session_state['confirm_delete_leasing']
@@ -753,35 +757,27 @@ if contract_type == "租賃合約":
 # ============================================
 else:  # 買斷合約
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, contract_code, customer_code, customer_name, deal_date, 
-                           deal_amount, sales_company_code, sales_amount, 
-                           service_company_code, service_amount
-                    FROM contracts_buyout
-                    ORDER BY contract_code
-                """)
-                contracts = cur.fetchall()
-        
-        if not contracts:
+        # 有搜尋字串且資料庫已安裝 pg_trgm 時，直接在資料庫搜尋（依相關度排序）
+        use_sql_search = bool(search_term) and has_trgm_search()
+        
+        sql, columns = list_query('contracts_buyout', search=use_sql_search)
+        contracts = fetch_frame(sql, search_params(search_term) if use_sql_search else None, columns)
+        
+        if contracts.empty and not search_term:
             st.info("📝 目前沒有買斷合約資料")
         else:
-            # 轉換為 DataFrame
-            columns = ['id', 'contract_code', 'customer_code', 'customer_name', 'deal_date',
-                      'deal_amount', 'sales_company_code', 'sales_amount',
-                      'service_company_code', 'service_amount']
-            df = pd.DataFrame(contracts, columns=columns)
+            df = contracts
             
-            # 搜尋功能
-            if search_term:
-                mask = df.astype(str).apply(lambda row: row.str.contains(search_term, case=False, na=False).any(), axis=1)
-                df = df[mask]
+            # 搜尋功能（未安裝 pg_trgm 時使用記憶體索引）
+            if search_term and not use_sql_search:
+                df = filter_with_index(df, 'contracts_buyout', search_term)
             
             if len(df) == 0:
                 st.warning(f"🔍 找不到符合 '{search_term}' 的買斷合約")
             else:
                 st.write(f"共 {len(df)} 筆買斷合約")
+                if use_sql_search and len(df) >= SEARCH_LIMIT:
+                    st.caption(f"僅顯示最相關的 {SEARCH_LIMIT} 筆，請輸入更精確的關鍵字")
                 
                 # 三個按鈕在同一行（表格上方）
                 col_add, col_edit, col_delete, col_space = st.columns([1, 1, 1, 7])
@@ -797,7 +793,7 @@ else:  # 買斷合約
                             selected_id = st.session_state['selected_buyout_id']
                             if selected_id in df['id'].values:
                                 selected_row = df[df['id'] == selected_id].iloc[0]
-                                edit_buyout_dialog(selected_row.to_dict())
+                                edit_buyout_dialog(frame_record(selected_row))
                             else:
                                 st.warning("⚠️ 請先點選要編輯的合約資料")
                         else:
@@ -832,10 +828,7 @@ else:  # 買斷合約
                 })
                 
                 # 格式化日期和金額
-                display_df['成交日期'] = display_df['成交日期'].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else '-')
-                display_df['成交金額'] = display_df['成交金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['業務金額'] = display_df['業務金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['維護金額'] = display_df['維護金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
+                column_config = format_columns(display_df, money=['成交金額', '業務金額', '維護金額'], dates=['成交日期'])
                 
                 # 顯示表格
                 selection = st.dataframe(
@@ -843,6 +836,7 @@ else:  # 買斷合約
                                '業務公司代碼', '業務金額', '維護公司代碼', '維護金額']],
                     use_container_width=True,
                     hide_index=True,
+                    column_config=column_config,
                     on_select="rerun",
                     selection_mode="single-row",
                     key="buyout_table"
@@ -874,10 +868,13 @@ else:  # 買斷合約
                                         with get_connection() as conn:
                                             with conn.cursor() as cur:
                                                 # 先刪除相關應收帳款（子表）
-                                                cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s", (selected_row['contract_code'],))
+                                                cur.execute("DELETE FROM ar_buyout WHERE contract_code = %s RETURNING id", (selected_row['contract_code'],))
+                                                ar_ids = {row[0] for row in cur.fetchall()}
                                                 # 再刪除買斷合約（父表）
-                                                cur.execute("DELETE FROM contracts_buyout WHERE id = %s", (selected_id,))
+                                                cur.execute("DELETE FROM contracts_buyout WHERE id = %s RETURNING id", (selected_id,))
+                                                contract_ids = {row[0] for row in cur.fetchall()}
                                                 conn.commit()
+                                        invalidate_rows({'contracts_buyout': contract_ids, 'ar_buyout': ar_ids})
                                         st.success("✅ 刪除成功！")
                                         if 'confirm_delete_buyout' in st.session_state:
                                             del st.session_state['confirm_delete_buyout']
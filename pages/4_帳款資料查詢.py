@@ -1,146 +1,22 @@
 import streamlit as st
-from db_config import get_connection
-import pandas as pd
+from query_panel import query_debug_panel
+from db_config import get_connection, invalidate_rows
 from datetime import date, datetime
-from io import BytesIO
+from exports import ALL_DATES, clear_export_date_range, export_button, export_date_range, build_accounts_workbook
+from dumps import dump_button, DUMP_DATASETS, DUMP_FORMATS
+from search import has_trgm_search, ranked_search_sql, search_params, SEARCH_LIMIT
+from search_index import match_mask
+from pagination import union_sql, get_page_boundaries, fetch_page
+from aggregates import account_metrics
+from queries import account_branches, date_params
+from display import format_columns
+from frames import fetch_frame, frame_from_rows, frame_record
 
 st.set_page_config(page_title="帳款資料查詢", page_icon="💰", layout="wide")
+query_debug_panel("帳款資料查詢")
 
 st.title("💰 帳款資料查詢")
 
-# ============================================
-# 匯出 Excel 功能
-# ============================================
-def export_to_excel(from_date, to_date):
-    """匯出所有四種帳款類型到 Excel（不同工作表）"""
-    try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # ========== 查詢總應收帳款 ==========
-                # 租賃應收
-                cur.execute("""
-                    SELECT '租賃' as type, contract_code, customer_code, customer_name,
-                           start_date as date, end_date, total_rent as amount, fee,
-                           received_amount, payment_status
-                    FROM ar_leasing
-                    WHERE start_date BETWEEN %s AND %s
-                """, (from_date, to_date))
-                ar_leasing = cur.fetchall()
-                
-                # 買斷應收
-                cur.execute("""
-                    SELECT '買斷' as type, contract_code, customer_code, customer_name,
-                           deal_date as date, NULL as end_date, total_amount as amount, fee,
-                           received_amount, payment_status
-                    FROM ar_buyout
-                    WHERE deal_date BETWEEN %s AND %s
-                """, (from_date, to_date))
-                ar_buyout = cur.fetchall()
-                
-                # 合併總應收帳款
-                ar_columns = ['類型', '合約編號', '客戶代碼', '客戶名稱', '日期', '結束日期', 
-                             '金額', '手續費', '已收金額', '繳費狀況']
-                df_total_ar = pd.DataFrame(ar_leasing + ar_buyout, columns=ar_columns)
-                df_total_ar['應收總額'] = df_total_ar['金額'] + df_total_ar['手續費']
-                df_total_ar['未收金額'] = df_total_ar['應收總額'] - df_total_ar['已收金額']
-                
-                # 總未收帳款（篩選未收款）
-                df_unpaid_ar = df_total_ar[df_total_ar['繳費狀況'] != '已收款'].copy()
-                
-                # ========== 查詢未出帳款 ==========
-                # 租賃未出（業務+維護）
-                cur.execute("""
-                    SELECT contract_code, '租賃' as contract_type, customer_code, customer_name,
-                           start_date as date, '業務' as payable_type, sales_company_code as company_code,
-                           sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_leasing
-                    WHERE start_date BETWEEN %s AND %s
-                      AND sales_payment_status != '已付款' AND sales_amount > 0
-                    UNION ALL
-                    SELECT contract_code, '租賃', customer_code, customer_name,
-                           start_date, '維護', service_company_code,
-                           service_amount, service_payment_status
-                    FROM contracts_leasing
-                    WHERE start_date BETWEEN %s AND %s
-                      AND service_payment_status != '已付款' AND service_amount > 0
-                """, (from_date, to_date, from_date, to_date))
-                unpaid_leasing = cur.fetchall()
-                
-                # 買斷未出（業務+維護）
-                cur.execute("""
-                    SELECT contract_code, '買斷' as contract_type, customer_code, customer_name,
-                           deal_date as date, '業務' as payable_type, sales_company_code as company_code,
-                           sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_buyout
-                    WHERE deal_date BETWEEN %s AND %s
-                      AND sales_payment_status != '已付款' AND sales_amount > 0
-                    UNION ALL
-                    SELECT contract_code, '買斷', customer_code, customer_name,
-                           deal_date, '維護', service_company_code,
-                           service_amount, service_payment_status
-                    FROM contracts_buyout
-                    WHERE deal_date BETWEEN %s AND %s
-                      AND service_payment_status != '已付款' AND service_amount > 0
-                """, (from_date, to_date, from_date, to_date))
-                unpaid_buyout = cur.fetchall()
-                
-                payable_columns = ['合約編號', '類型', '客戶代碼', '客戶名稱', '日期', 
-                                  '付款對象', '公司代碼', '金額', '付款狀況']
-                df_unpaid_payable = pd.DataFrame(unpaid_leasing + unpaid_buyout, columns=payable_columns)
-                
-                # ========== 查詢已出帳款 ==========
-                # 租賃已出（業務+維護）
-                cur.execute("""
-                    SELECT contract_code, '租賃' as contract_type, customer_code, customer_name,
-                           start_date as date, '業務' as payable_type, sales_company_code as company_code,
-                           sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_leasing
-                    WHERE start_date BETWEEN %s AND %s
-                      AND sales_payment_status = '已付款' AND sales_amount > 0
-                    UNION ALL
-                    SELECT contract_code, '租賃', customer_code, customer_name,
-                           start_date, '維護', service_company_code,
-                           service_amount, service_payment_status
-                    FROM contracts_leasing
-                    WHERE start_date BETWEEN %s AND %s
-                      AND service_payment_status = '已付款' AND service_amount > 0
-                """, (from_date, to_date, from_date, to_date))
-                paid_leasing = cur.fetchall()
-                
-                # 買斷已出（業務+維護）
-                cur.execute("""
-                    SELECT contract_code, '買斷' as contract_type, customer_code, customer_name,
-                           deal_date as date, '業務' as payable_type, sales_company_code as company_code,
-                           sales_amount as amount, sales_payment_status as payment_status
-                    FROM contracts_buyout
-                    WHERE deal_date BETWEEN %s AND %s
-                      AND sales_payment_status = '已付款' AND sales_amount > 0
-                    UNION ALL
-                    SELECT contract_code, '買斷', customer_code, customer_name,
-                           deal_date, '維護', service_company_code,
-                           service_amount, service_payment_status
-                    FROM contracts_buyout
-                    WHERE deal_date BETWEEN %s AND %s
-                      AND service_payment_status = '已付款' AND service_amount > 0
-                """, (from_date, to_date, from_date, to_date))
-                paid_buyout = cur.fetchall()
-                
-                df_paid_payable = pd.DataFrame(paid_leasing + paid_buyout, columns=payable_columns)
-        
-        # 創建 Excel 檔案
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_total_ar.to_excel(writer, sheet_name='總應收帳款', index=False)
-            df_unpaid_ar.to_excel(writer, sheet_name='總未收帳款', index=False)
-            df_unpaid_payable.to_excel(writer, sheet_name='未出帳款', index=False)
-            df_paid_payable.to_excel(writer, sheet_name='已出帳款', index=False)
-        
-        return output.getvalue()
-    
-    except Exception as e:
-        st.error(f"❌ 匯出失敗：{e}")
-        return None
-
 # ============================================
 # 編輯應收帳款 Dialog
 # ============================================
@@ -193,6 +69,7 @@ def edit_ar_dialog(ar_data):
                                 SET fee = %s, received_amount = %s, payment_status = %s,
                                     updated_at = CURRENT_TIMESTAMP
                                 WHERE id = %s
+                                RETURNING id
                             """, (fee, received_amount, payment_status, ar_data['id']))
                         else:  # 買斷
                             cur.execute("""
@@ -200,9 +77,11 @@ def edit_ar_dialog(ar_data):
                                 SET fee = %s, received_amount = %s, payment_status = %s,
                                     updated_at = CURRENT_TIMESTAMP
                                 WHERE id = %s
+                                RETURNING id
                             """, (fee, received_amount, payment_status, ar_data['id']))
-                        
+                        changed = {row[0] for row in cur.fetchall()}
                         conn.commit()
+                invalidate_rows({'ar_leasing' if ar_data['type'] == '租賃' else 'ar_buyout': changed})
                 st.success("✅ 應收帳款更新成功！")
                 st.rerun()
             except Exception as e:
@@ -253,6 +132,7 @@ def edit_payable_dialog(payable_data):
                                     SET sales_payment_status = %s,
                                         updated_at = CURRENT_TIMESTAMP
                                     WHERE contract_code = %s
+                                    RETURNING id
                                 """, (payment_status, payable_data['contract_code']))
                             else:  # 維護
                                 cur.execute("""
@@ -260,6 +140,7 @@ def edit_payable_dialog(payable_data):
                                     SET service_payment_status = %s,
                                         updated_at = CURRENT_TIMESTAMP
                                     WHERE contract_code = %s
+                                    RETURNING id
                                 """, (payment_status, payable_data['contract_code']))
                         else:  # 買斷
                             if payable_data['payable_type'] == '業務':
@@ -268,6 +149,7 @@ def edit_payable_dialog(payable_data):
                                     SET sales_payment_status = %s,
                                         updated_at = CURRENT_TIMESTAMP
                                     WHERE contract_code = %s
+                                    RETURNING id
                                 """, (payment_status, payable_data['contract_code']))
                             else:  # 維護
                                 cur.execute("""
@@ -275,9 +157,11 @@ def edit_payable_dialog(payable_data):
                                     SET service_payment_status = %s,
                                         updated_at = CURRENT_TIMESTAMP
                                     WHERE contract_code = %s
+                                    RETURNING id
                                 """, (payment_status, payable_data['contract_code']))
-                        
+                        changed = {row[0] for row in cur.fetchall()}
                         conn.commit()
+                invalidate_rows({'contracts_leasing' if payable_data['contract_type'] == '租賃' else 'contracts_buyout': changed})
                 st.success("✅ 付款狀態更新成功！")
                 st.rerun()
             except Exception as e:
@@ -336,25 +220,43 @@ col_query, col_export = st.columns([1, 1])
 
 with col_query:
     apply_date_filter = st.button("🔍 查詢", use_container_width=True, type="primary", key="apply_date_filter")
+    if f"accounts_export_range" in st.session_state and not apply_date_filter:
+        if st.button("✖ 清除篩選", use_container_width=True, key="clear_date_filter"):
+            clear_export_date_range("accounts")
+            st.rerun()
 
 with col_export:
     st.write("")  # 空行對齊
     st.write("")  # 空行對齊
-    # 匯出 Excel 按鈕（使用當前的日期範圍，如果沒有套用日期篩選則匯出全部）
-    export_from_date = from_date if apply_date_filter else date(1900, 1, 1)
-    export_to_date = to_date if apply_date_filter else date(2100, 12, 31)
-    excel_data = export_to_excel(export_from_date, export_to_date)
-    
-    if excel_data:
-        export_filename = f"帳款資料_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        st.download_button(
-            label="📥 匯出 Excel",
-            data=excel_data,
-            file_name=export_filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True,
-            key="download_excel"
+    # 匯出 Excel 按鈕（使用最後一次按下查詢的日期範圍，沒有套用日期篩選則匯出全部）
+    # 按下後才在背景產生檔案，相同日期範圍與資料版本的檔案會重複使用
+    export_from_date, export_to_date = export_date_range("accounts", apply_date_filter, from_date, to_date)
+    if (export_from_date, export_to_date) != ALL_DATES:
+        st.caption(f"匯出範圍：{export_from_date.strftime('%Y/%m/%d')} ~ {export_to_date.strftime('%Y/%m/%d')}")
+    export_format = st.radio(
+        "匯出格式",
+        options=["xlsx", *DUMP_FORMATS],
+        format_func=lambda fmt: DUMP_FORMATS[fmt][0] if fmt in DUMP_FORMATS else "Excel",
+        horizontal=True,
+        key="accounts_export_format"
+    )
+    if export_format == "xlsx":
+        export_button(
+            "accounts",
+            build_accounts_workbook,
+            (export_from_date, export_to_date),
+            tables=['ar_leasing', 'ar_buyout', 'contracts_leasing', 'contracts_buyout'],
+            file_name=f"帳款資料_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        )
+    else:
+        # CSV / Parquet 一次匯出一個資料集（給會計與其他程式使用）
+        dump_dataset = st.selectbox(
+            "匯出資料",
+            options=['ar_leasing', 'ar_buyout', 'payables'],
+            format_func=lambda dataset: DUMP_DATASETS[dataset].label,
+            key="accounts_dump_dataset"
         )
+        dump_button(dump_dataset, export_format, export_from_date, export_to_date)
 
 st.divider()
 
@@ -376,405 +278,27 @@ try:
         st.session_state['current_page'] = 1
         st.session_state['prev_ar_type'] = ar_type
     
-    # 根據選擇的帳款類型查詢不同的資料
-    if ar_type == "未出帳款":
-        # 查詢未出帳款（應付帳款 - 未付款）
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # 查詢租賃合約的未出帳款（業務）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE start_date BETWEEN %s AND %s
-                          AND sales_payment_status != '已付款'
-                          AND sales_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE sales_payment_status != '已付款'
-                          AND sales_amount > 0
-                    """)
-                leasing_sales_data = cur.fetchall()
-                
-                # 查詢租賃合約的未出帳款（維護）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE start_date BETWEEN %s AND %s
-                          AND service_payment_status != '已付款'
-                          AND service_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE service_payment_status != '已付款'
-                          AND service_amount > 0
-                    """)
-                leasing_service_data = cur.fetchall()
-                
-                # 查詢買斷合約的未出帳款（業務）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE deal_date BETWEEN %s AND %s
-                          AND sales_payment_status != '已付款'
-                          AND sales_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE sales_payment_status != '已付款'
-                          AND sales_amount > 0
-                    """)
-                buyout_sales_data = cur.fetchall()
-                
-                # 查詢買斷合約的未出帳款（維護）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE deal_date BETWEEN %s AND %s
-                          AND service_payment_status != '已付款'
-                          AND service_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE service_payment_status != '已付款'
-                          AND service_amount > 0
-                    """)
-                buyout_service_data = cur.fetchall()
-        
-        # 合併所有未出帳款資料
-        all_data = leasing_sales_data + leasing_service_data + buyout_sales_data + buyout_service_data
+    # 根據選擇的帳款類型取得查詢分支（未出/已出帳款來自合約資料表，其餘來自應收帳款資料表）
+    params = date_params(from_date, to_date) if apply_date_filter else {}
+    branches, columns = account_branches(ar_type, params)
     
-    elif ar_type == "已出帳款":
-        # 查詢已出帳款（應付帳款 - 已付款）
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # 查詢租賃合約的已出帳款（業務）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE start_date BETWEEN %s AND %s
-                          AND sales_payment_status = '已付款'
-                          AND sales_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE sales_payment_status = '已付款'
-                          AND sales_amount > 0
-                    """)
-                leasing_sales_data = cur.fetchall()
-                
-                # 查詢租賃合約的已出帳款（維護）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE start_date BETWEEN %s AND %s
-                          AND service_payment_status = '已付款'
-                          AND service_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '租賃' as contract_type,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_leasing
-                        WHERE service_payment_status = '已付款'
-                          AND service_amount > 0
-                    """)
-                leasing_service_data = cur.fetchall()
-                
-                # 查詢買斷合約的已出帳款（業務）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE deal_date BETWEEN %s AND %s
-                          AND sales_payment_status = '已付款'
-                          AND sales_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '業務' as payable_type,
-                            sales_company_code as company_code,
-                            sales_amount as amount,
-                            sales_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE sales_payment_status = '已付款'
-                          AND sales_amount > 0
-                    """)
-                buyout_sales_data = cur.fetchall()
-                
-                # 查詢買斷合約的已出帳款（維護）
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE deal_date BETWEEN %s AND %s
-                          AND service_payment_status = '已付款'
-                          AND service_amount > 0
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            contract_code,
-                            '買斷' as contract_type,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            '維護' as payable_type,
-                            service_company_code as company_code,
-                            service_amount as amount,
-                            service_payment_status as payment_status
-                        FROM contracts_buyout
-                        WHERE service_payment_status = '已付款'
-                          AND service_amount > 0
-                    """)
-                buyout_service_data = cur.fetchall()
-        
-        # 合併所有已出帳款資料
-        all_data = leasing_sales_data + leasing_service_data + buyout_sales_data + buyout_service_data
-    else:
-        # 查詢應收帳款
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # 查詢租賃應收帳款
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            id,
-                            '租賃' as type,
-                            contract_code,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            end_date,
-                            total_rent as amount,
-                            fee,
-                            received_amount,
-                            payment_status
-                        FROM ar_leasing
-                        WHERE start_date BETWEEN %s AND %s
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            id,
-                            '租賃' as type,
-                            contract_code,
-                            customer_code,
-                            customer_name,
-                            start_date as date,
-                            end_date,
-                            total_rent as amount,
-                            fee,
-                            received_amount,
-                            payment_status
-                        FROM ar_leasing
-                    """)
-                leasing_data = cur.fetchall()
-                
-                # 查詢買斷應收帳款
-                if apply_date_filter:
-                    cur.execute("""
-                        SELECT 
-                            id,
-                            '買斷' as type,
-                            contract_code,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            NULL as end_date,
-                            total_amount as amount,
-                            fee,
-                            received_amount,
-                            payment_status
-                        FROM ar_buyout
-                        WHERE deal_date BETWEEN %s AND %s
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT 
-                            id,
-                            '買斷' as type,
-                            contract_code,
-                            customer_code,
-                            customer_name,
-                            deal_date as date,
-                            NULL as end_date,
-                            total_amount as amount,
-                            fee,
-                            received_amount,
-                            payment_status
-                        FROM ar_buyout
-                    """)
-                buyout_data = cur.fetchall()
-        
-        # 合併資料
-        all_data = leasing_data + buyout_data
+    # 有搜尋字串且資料庫已安裝 pg_trgm 時，直接在資料庫搜尋（依相關度排序）
+    use_sql_search = bool(search_term) and has_trgm_search()
+    
+    # 總筆數與匯總金額由資料庫計算，不需載入所有資料列；在資料庫搜尋時匯總搜尋到的全部帳款
+    summary = account_metrics(ar_type, params)
+    metrics = account_metrics(ar_type, params, search_term) if use_sql_search else summary
     
-    if not all_data:
+    if summary['count'] == 0:
         if apply_date_filter:
             st.info(f"📝 {from_date.strftime('%Y-%m-%d')} ~ {to_date.strftime('%Y-%m-%d')} 沒有帳款資料")
         else:
             st.info(f"📝 目前沒有 {ar_type} 資料")
     else:
-        # 根據帳款類型處理不同的資料結構
+        # 根據帳款類型顯示不同的匯總資訊
         if ar_type == "未出帳款" or ar_type == "已出帳款":
-            # 未出/已出帳款資料結構
-            columns = ['contract_code', 'contract_type', 'customer_code', 'customer_name', 'date',
-                      'payable_type', 'company_code', 'amount', 'payment_status']
-            df = pd.DataFrame(all_data, columns=columns)
-            
-            # 按合約編號排序
-            df = df.sort_values('contract_code')
-            
             # 計算總金額
-            total_payable = df['amount'].sum()
+            total_payable = metrics['total_amount']
             
             # 顯示匯總資訊
             if ar_type == "未出帳款":
@@ -796,24 +320,11 @@ try:
                     value=f"NT$ {total_payable:,.0f}"
                 )
         else:
-            # 應收帳款資料結構
-            columns = ['id', 'type', 'contract_code', 'customer_code', 'customer_name', 'date', 
-                       'end_date', 'amount', 'fee', 'received_amount', 'payment_status']
-            df = pd.DataFrame(all_data, columns=columns)
-            
-            # 按合約編號排序
-            df = df.sort_values('contract_code')
-            
-            # 根據選擇的帳款類型篩選資料
-            if ar_type == "總未收帳款":
-                # 篩選繳費狀況不是「已收款」的資料
-                df = df[df['payment_status'] != '已收款']
-            
             # 計算匯總數字
             if ar_type == "總應收帳款":
                 # 總應收金額和總手續費
-                total_amount = df['amount'].sum()
-                total_fee = df['fee'].sum()
+                total_amount = metrics['total_amount']
+                total_fee = metrics['total_fee']
                 
                 # 顯示匯總資訊
                 if apply_date_filter:
@@ -834,9 +345,8 @@ try:
                         value=f"NT$ {total_fee:,.0f}"
                     )
             else:  # 總未收帳款
-                # 計算實際未收金額 = SUM((金額 + 手續費) - 已收金額)
-                df['unpaid_amount'] = (df['amount'].fillna(0) + df['fee'].fillna(0)) - df['received_amount'].fillna(0)
-                total_unpaid = df['unpaid_amount'].sum()
+                # 實際未收金額 = SUM((金額 + 手續費) - 已收金額)
+                total_unpaid = metrics['total_unpaid']
                 
                 # 顯示匯總資訊
                 if apply_date_filter:
@@ -850,16 +360,38 @@ try:
         
         st.divider()
         
-        # 搜尋功能
+        # 搜尋功能（已安裝 pg_trgm 時在資料庫搜尋，否則使用記憶體索引）
+        # 搜尋結果筆數有限，直接在記憶體中分頁；沒有搜尋時才使用資料庫分頁
+        df = None
+        total_records = summary['count']
         if search_term:
-            mask = df.astype(str).apply(lambda row: row.str.contains(search_term, case=False, na=False).any(), axis=1)
-            df = df[mask]
+            if use_sql_search:
+                # 最後的相關度欄位不讀取
+                df = fetch_frame(ranked_search_sql(branches), {**params, **search_params(search_term)}, columns)
+                if len(df) >= SEARCH_LIMIT:
+                    st.caption(f"僅顯示最相關的 {SEARCH_LIMIT} 筆，請輸入更精確的關鍵字")
+            else:
+                df = fetch_frame(union_sql(branches), params, columns)
+                df = df.sort_values('contract_code')
+                if ar_type in ["未出帳款", "已出帳款"]:
+                    # 未出/已出帳款來自合約資料表（以合約編號比對）
+                    mask = (
+                        ((df['contract_type'] == '租賃') & match_mask(df, 'contracts_leasing', search_term)) |
+                        ((df['contract_type'] == '買斷') & match_mask(df, 'contracts_buyout', search_term))
+                    )
+                else:
+                    # 應收帳款 id 在兩個資料表中可能重複，需同時比對類型
+                    mask = (
+                        ((df['type'] == '租賃') & match_mask(df, 'ar_leasing', search_term)) |
+                        ((df['type'] == '買斷') & match_mask(df, 'ar_buyout', search_term))
+                    )
+                df = df[mask]
+            total_records = len(df)
         
-        if len(df) == 0:
+        if total_records == 0:
             st.warning(f"🔍 找不到符合 '{search_term}' 的帳款資料")
         else:
-            # 計算總筆數和總頁數
-            total_records = len(df)
+            # 計算總頁數
             total_pages = (total_records + items_per_page - 1) // items_per_page  # 向上取整
             
             # 確保當前頁數不超過總頁數
@@ -887,7 +419,8 @@ try:
                         min_value=1,
                         max_value=total_pages,
                         value=st.session_state['current_page'],
-                        key="page_input",
+                        # 鍵含目前頁碼：按上一頁 / 下一頁後重新建立，否則沿用舊的輸入值又把頁碼改回去
+                        key=f"page_input_{st.session_state['current_page']}",
                         label_visibility="collapsed"
                     )
                     if page_num != st.session_state['current_page']:
@@ -901,10 +434,16 @@ try:
                 
                 st.divider()
             
-            # 根據當前頁數切片 DataFrame
-            start_idx = (st.session_state['current_page'] - 1) * items_per_page
-            end_idx = start_idx + items_per_page
-            df_paged = df.iloc[start_idx:end_idx].copy()
+            if df is not None:
+                # 搜尋結果：根據當前頁數切片 DataFrame
+                start_idx = (st.session_state['current_page'] - 1) * items_per_page
+                end_idx = start_idx + items_per_page
+                df_paged = df.iloc[start_idx:end_idx].copy()
+            else:
+                # 只向資料庫取當前頁（keyset 分頁，跳頁時從快取的頁面起點往後找）
+                boundaries = get_page_boundaries('account_page_boundaries', branches, params, items_per_page)
+                page_rows = fetch_page(branches, params, st.session_state['current_page'], items_per_page, boundaries)
+                df_paged = frame_from_rows(page_rows, columns)
             
             # 編輯按鈕（表格上方）
             col_edit, col_space = st.columns([1, 9])
@@ -916,11 +455,9 @@ try:
                         # 檢查是否有選擇資料
                         if 'selected_payable_idx' in st.session_state and st.session_state['selected_payable_idx'] is not None:
                             selected_idx = st.session_state['selected_payable_idx']
-                            # 調整索引：分頁後的索引 + 當前頁的起始索引
-                            actual_idx = start_idx + selected_idx
-                            if actual_idx < len(df):
-                                selected_row = df.iloc[actual_idx]
-                                edit_payable_dialog(selected_row.to_dict())
+                            if selected_idx < len(df_paged):
+                                selected_row = df_paged.iloc[selected_idx]
+                                edit_payable_dialog(frame_record(selected_row))
                             else:
                                 st.warning("⚠️ 請先點選要編輯的帳款資料")
                         else:
@@ -932,9 +469,9 @@ try:
                         if 'selected_ar_id' in st.session_state and st.session_state['selected_ar_id'] is not None:
                             selected_id = st.session_state['selected_ar_id']
                             selected_type = st.session_state['selected_ar_type']
-                            if ((df['id'] == selected_id) & (df['type'] == selected_type)).any():
-                                selected_row = df[(df['id'] == selected_id) & (df['type'] == selected_type)].iloc[0]
-                                edit_ar_dialog(selected_row.to_dict())
+                            if ((df_paged['id'] == selected_id) & (df_paged['type'] == selected_type)).any():
+                                selected_row = df_paged[(df_paged['id'] == selected_id) & (df_paged['type'] == selected_type)].iloc[0]
+                                edit_ar_dialog(frame_record(selected_row))
                             else:
                                 st.warning("⚠️ 請先點選要編輯的帳款資料")
                         else:
@@ -959,8 +496,7 @@ try:
                 })
                 
                 # 格式化日期和金額
-                display_df['日期'] = display_df['日期'].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else '-')
-                display_df['金額'] = display_df['金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
+                column_config = format_columns(display_df, money=['金額'], dates=['日期'])
                 
                 # 顯示表格
                 selection = st.dataframe(
@@ -968,6 +504,7 @@ try:
                                '付款對象', '公司代碼', '金額', '付款狀況']],
                     use_container_width=True,
                     hide_index=True,
+                    column_config=column_config,
                     on_select="rerun",
                     selection_mode="single-row",
                     key="payable_table"
@@ -983,9 +520,8 @@ try:
                 # 顯示已選擇的資料
                 if 'selected_payable_idx' in st.session_state and st.session_state['selected_payable_idx'] is not None:
                     selected_idx = st.session_state['selected_payable_idx']
-                    actual_idx = start_idx + selected_idx
-                    if actual_idx < len(df):
-                        selected_row = df.iloc[actual_idx]
+                    if selected_idx < len(df_paged):
+                        selected_row = df_paged.iloc[selected_idx]
                         st.info(f"✓ 已選擇：{selected_row['contract_code']} - {selected_row['customer_name']} ({selected_row['payable_type']})")
             
             else:
@@ -1012,13 +548,11 @@ try:
                 })
                 
                 # 格式化日期和金額
-                display_df['日期'] = display_df['日期'].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else '-')
-                display_df['結束日期'] = display_df['結束日期'].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else '-')
-                display_df['金額'] = display_df['金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['手續費'] = display_df['手續費'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['已收金額'] = display_df['已收金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['應收總額'] = display_df['應收總額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
-                display_df['未收金額'] = display_df['未收金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) else '-')
+                column_config = format_columns(
+                    display_df,
+                    money=['金額', '手續費', '已收金額', '應收總額', '未收金額'],
+                    dates=['日期', '結束日期']
+                )
                 
                 # 顯示表格
                 selection = st.dataframe(
@@ -1026,6 +560,7 @@ try:
                                '金額', '手續費', '已收金額', '繳費狀況', '應收總額', '未收金額']],
                     use_container_width=True,
                     hide_index=True,
+                    column_config=column_config,
                     on_select="rerun",
                     selection_mode="single-row",
                     key="ar_table"
@@ -1045,8 +580,8 @@ try:
                 if 'selected_ar_id' in st.session_state and st.session_state['selected_ar_id'] is not None:
                     selected_id = st.session_state['selected_ar_id']
                     selected_type = st.session_state['selected_ar_type']
-                    if ((df['id'] == selected_id) & (df['type'] == selected_type)).any():
-                        selected_row = df[(df['id'] == selected_id) & (df['type'] == selected_type)].iloc[0]
+                    if ((df_paged['id'] == selected_id) & (df_paged['type'] == selected_type)).any():
+                        selected_row = df_paged[(df_paged['id'] == selected_id) & (df_paged['type'] == selected_type)].iloc[0]
                         st.info(f"✓ 已選擇：{selected_row['contract_code']} - {selected_row['customer_name']} ({selected_row['type']})")
             
             # 分頁控制（在表格下方）
@@ -1068,7 +603,8 @@ try:
                         min_value=1,
                         max_value=total_pages,
                         value=st.session_state['current_page'],
-                        key="page_input_bottom",
+                        # 鍵含目前頁碼：按上一頁 / 下一頁後重新建立，否則沿用舊的輸入值又把頁碼改回去
+                        key=f"page_input_bottom_{st.session_state['current_page']}",
                         label_visibility="collapsed"
                     )
                     if page_num2 != st.session_state['current_page']:
@@ -1,66 +1,26 @@
 import streamlit as st
-from db_config import get_connection
+from query_panel import query_debug_panel
+from db_config import get_connection, invalidate_rows
 import pandas as pd
 from datetime import date, datetime
-from io import BytesIO
+from exports import ALL_DATES, clear_export_date_range, export_button, export_date_range, build_ledger_workbook
+from dumps import dump_button, DUMP_FORMATS
+from search import has_trgm_search, ranked_search_sql, search_params, SEARCH_LIMIT
+from search_index import filter_with_index
+from pagination import union_sql, get_page_boundaries, fetch_page
+from aggregates import ledger_metrics
+from balances import running_balances
+from display import format_columns
+from frames import fetch_frame, frame_from_rows, frame_record
+from queries import ledger_branches, date_params, LEDGER_COLUMNS
+from bank_import import (IMPORT_FIELDS, ENCODINGS, statement_kind, read_header, guess_mapping,
+                         iter_statement, import_statement)
 
 st.set_page_config(page_title="銀行帳本查詢", page_icon="🏦", layout="wide")
+query_debug_panel("銀行帳本查詢")
 
 st.title("🏦 銀行帳本查詢")
 
-# ============================================
-# 匯出 Excel 功能
-# ============================================
-def export_to_excel(from_date, to_date):
-    """匯出銀行帳本資料到 Excel"""
-    try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                if from_date and to_date:
-                    cur.execute("""
-                        SELECT txn_date, payer, expense, income, note
-                        FROM bank_ledger
-                        WHERE txn_date BETWEEN %s AND %s
-                        ORDER BY txn_date DESC
-                    """, (from_date, to_date))
-                else:
-                    cur.execute("""
-                        SELECT txn_date, payer, expense, income, note
-                        FROM bank_ledger
-                        ORDER BY txn_date DESC
-                    """)
-                data = cur.fetchall()
-        
-        if not data:
-            return None
-        
-        columns = ['日期', '匯款人', '支出金額', '收入金額', '備註']
-        df = pd.DataFrame(data, columns=columns)
-        
-        # 計算匯總
-        total_expense = df['支出金額'].sum()
-        total_income = df['收入金額'].sum()
-        net_amount = total_income - total_expense
-        
-        # 創建 Excel 檔案
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='銀行帳本', index=False)
-            
-            # 添加匯總資料
-            summary_data = {
-                '項目': ['總收入', '總支出', '淨額'],
-                '金額': [total_income, total_expense, net_amount]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='匯總', index=False)
-        
-        return output.getvalue()
-    
-    except Exception as e:
-        st.error(f"❌ 匯出失敗：{e}")
-        return None
-
 # ============================================
 # 新增帳本記錄 Dialog
 # ============================================
@@ -113,8 +73,11 @@ def add_ledger_dialog():
                                 INSERT INTO bank_ledger 
                                 (txn_date, payer, expense, income, note)
                                 VALUES (%s, %s, %s, %s, %s)
+                                RETURNING id
                             """, (txn_date, payer or None, expense, income, note or None))
+                            changed = {row[0] for row in cur.fetchall()}
                             conn.commit()
+                    invalidate_rows({'bank_ledger': changed})
                     st.success("✅ 帳本記錄新增成功！")
                     st.rerun()
                 except Exception as e:
@@ -191,8 +154,11 @@ def edit_ledger_dialog(ledger_data):
                                 UPDATE bank_ledger 
                                 SET txn_date = %s, payer = %s, expense = %s, income = %s, note = %s
                                 WHERE id = %s
+                                RETURNING id
                             """, (txn_date, payer or None, expense, income, note or None, ledger_data['id']))
+                            changed = {row[0] for row in cur.fetchall()}
                             conn.commit()
+                    invalidate_rows({'bank_ledger': changed})
                     st.success("✅ 帳本記錄更新成功！")
                     st.rerun()
                 except Exception as e:
@@ -201,6 +167,71 @@ def edit_ledger_dialog(ledger_data):
         if cancelled:
             st.rerun()
 
+# ============================================
+# 匯入對帳單 Dialog
+# ============================================
+@st.dialog("匯入銀行對帳單", width="large")
+def import_statement_dialog():
+    uploaded = st.file_uploader("對帳單（CSV / XLSX）", type=['csv', 'xlsx'], key="import_statement_file")
+    col_encoding, col_skip = st.columns(2)
+    with col_encoding:
+        encoding = st.selectbox("CSV 編碼", options=list(ENCODINGS), format_func=ENCODINGS.get, key="import_encoding")
+    with col_skip:
+        skip_rows = st.number_input("表頭前略過列數", min_value=0, max_value=50, value=0, key="import_skip_rows")
+
+    if uploaded is None:
+        st.caption("重複匯入同一份對帳單時，已存在的交易會自動略過")
+        return
+
+    try:
+        kind = statement_kind(uploaded.name)
+        header = read_header(uploaded, kind, encoding, skip_rows)
+    except Exception as e:
+        st.error(f"❌ 無法讀取對帳單：{e}")
+        return
+
+    # 欄位對應（依表頭自動猜測，可手動調整）
+    st.write("欄位對應")
+    guessed = guess_mapping(header)
+    options = [None] + list(range(len(header)))
+    mapping = {}
+    for column, (field, (label, _)) in zip(st.columns(len(IMPORT_FIELDS)), IMPORT_FIELDS.items()):
+        with column:
+            mapping[field] = st.selectbox(
+                label,
+                options=options,
+                index=options.index(guessed[field]),
+                format_func=lambda i: "（不匯入）" if i is None else (header[i] or f"第 {i + 1} 欄"),
+                key=f"import_map_{field}"
+            )
+
+    col_submit, col_cancel = st.columns([1, 5])
+    with col_submit:
+        submitted = st.button("📥 匯入", type="primary", use_container_width=True, key="import_submit")
+    with col_cancel:
+        cancelled = st.button("❌ 關閉", use_container_width=True, key="import_cancel")
+
+    if submitted:
+        progress_text = st.empty()
+        try:
+            rows = iter_statement(uploaded, kind, encoding, skip_rows)
+            next(rows, None)  # 表頭
+            with get_connection() as conn:
+                result = import_statement(conn, rows, mapping,
+                                          lambda parsed: progress_text.caption(f"已讀取 {parsed:,} 筆…"))
+            progress_text.empty()
+            invalidate_rows({'bank_ledger': set(result.ids)})
+            st.success(f"✅ 新增 {result.inserted:,} 筆，重複略過 {result.duplicates:,} 筆")
+            if result.skipped:
+                with st.expander(f"⚠️ {len(result.skipped):,} 列無法匯入"):
+                    st.dataframe(pd.DataFrame(result.skipped, columns=['列號', '原因']), hide_index=True)
+        except Exception as e:
+            progress_text.empty()
+            st.error(f"❌ 匯入失敗：{e}")
+
+    if cancelled:
+        st.rerun()
+
 # ============================================
 # 搜尋功能（最上方）
 # ============================================
@@ -239,30 +270,45 @@ with col_per_page:
         key="items_per_page"
     )
 
-# 查詢按鈕和匯出按鈕
-col_query, col_export_space = st.columns([1, 1])
+# 查詢按鈕、匯入按鈕和匯出按鈕
+col_query, col_import, col_export_space = st.columns([1, 1, 2])
 
 with col_query:
     apply_date_filter = st.button("🔍 查詢", use_container_width=True, type="primary", key="apply_date_filter")
+    if f"ledger_export_range" in st.session_state and not apply_date_filter:
+        if st.button("✖ 清除篩選", use_container_width=True, key="clear_date_filter"):
+            clear_export_date_range("ledger")
+            st.rerun()
+
+with col_import:
+    if st.button("📥 匯入對帳單", use_container_width=True, key="open_import_statement"):
+        import_statement_dialog()
 
 with col_export_space:
     st.write("")  # 空行對齊
     st.write("")  # 空行對齊
-    # 匯出 Excel 按鈕（使用當前的日期範圍，如果沒有套用日期篩選則匯出全部）
-    export_from_date = from_date if apply_date_filter else date(1900, 1, 1)
-    export_to_date = to_date if apply_date_filter else date(2100, 12, 31)
-    excel_data = export_to_excel(export_from_date, export_to_date)
-    
-    if excel_data:
-        export_filename = f"銀行帳本_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        st.download_button(
-            label="📥 匯出 Excel",
-            data=excel_data,
-            file_name=export_filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True,
-            key="download_excel"
+    # 匯出 Excel 按鈕（使用最後一次按下查詢的日期範圍，沒有套用日期篩選則匯出全部）
+    # 按下後才在背景產生檔案，相同日期範圍與資料版本的檔案會重複使用
+    export_from_date, export_to_date = export_date_range("ledger", apply_date_filter, from_date, to_date)
+    if (export_from_date, export_to_date) != ALL_DATES:
+        st.caption(f"匯出範圍：{export_from_date.strftime('%Y/%m/%d')} ~ {export_to_date.strftime('%Y/%m/%d')}")
+    export_format = st.radio(
+        "匯出格式",
+        options=["xlsx", *DUMP_FORMATS],
+        format_func=lambda fmt: DUMP_FORMATS[fmt][0] if fmt in DUMP_FORMATS else "Excel",
+        horizontal=True,
+        key="ledger_export_format"
+    )
+    if export_format == "xlsx":
+        export_button(
+            "ledger",
+            build_ledger_workbook,
+            (export_from_date, export_to_date),
+            tables=['bank_ledger'],
+            file_name=f"銀行帳本_{datetime.now().strftime('%Y%m%d')}.xlsx"
         )
+    else:
+        dump_button('bank_ledger', export_format, export_from_date, export_to_date)
 
 st.divider()
 
@@ -283,45 +329,47 @@ try:
     if apply_date_filter:
         st.session_state['current_page'] = 1
     
-    # 查詢銀行帳本資料
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            if apply_date_filter:
-                cur.execute("""
-                    SELECT id, txn_date, payer, expense, income, note
-                    FROM bank_ledger
-                    WHERE txn_date BETWEEN %s AND %s
-                    ORDER BY txn_date DESC
-                """, (from_date, to_date))
-            else:
-                cur.execute("""
-                    SELECT id, txn_date, payer, expense, income, note
-                    FROM bank_ledger
-                    ORDER BY txn_date DESC
-                """)
-            ledgers = cur.fetchall()
+    # 有搜尋字串且資料庫已安裝 pg_trgm 時，直接在資料庫搜尋（依相關度排序）
+    use_sql_search = bool(search_term) and has_trgm_search()
+    
+    # 查詢條件（帳本依日期由新到舊，日期相同時依 id）
+    params = date_params(from_date, to_date) if apply_date_filter else {}
+    branches = ledger_branches(params)
+    
+    # 總筆數與匯總金額由資料庫計算，不需載入所有資料列
+    summary = ledger_metrics(params)
     
-    if not ledgers:
+    if summary['count'] == 0:
         if apply_date_filter:
             st.info(f"📝 {from_date.strftime('%Y-%m-%d')} ~ {to_date.strftime('%Y-%m-%d')} 沒有帳本記錄")
         else:
             st.info("📝 目前沒有帳本記錄")
     else:
-        # 轉換為 DataFrame
-        columns = ['id', 'txn_date', 'payer', 'expense', 'income', 'note']
-        df = pd.DataFrame(ledgers, columns=columns)
-        
-        # 搜尋功能
+        # 搜尋功能（已安裝 pg_trgm 時在資料庫搜尋，否則使用記憶體索引）
+        # 搜尋結果筆數有限，直接在記憶體中分頁；沒有搜尋時才使用資料庫分頁
+        df = None
+        total_records = summary['count']
+        total_income, total_expense = summary['total_income'], summary['total_expense']
         if search_term:
-            mask = df.astype(str).apply(lambda row: row.str.contains(search_term, case=False, na=False).any(), axis=1)
-            df = df[mask]
+            if use_sql_search:
+                # 最後的相關度欄位不讀取
+                df = fetch_frame(ranked_search_sql(branches, descending=True), {**params, **search_params(search_term)},
+                                 LEDGER_COLUMNS)
+                # 匯總數字依全部搜尋結果計算（不受顯示筆數上限影響）
+                metrics = ledger_metrics(params, search_term)
+                total_income, total_expense = metrics['total_income'], metrics['total_expense']
+            else:
+                df = fetch_frame(union_sql(branches), params, LEDGER_COLUMNS)
+                df = df.sort_values(['txn_date', 'id'], ascending=False)
+                df = filter_with_index(df, 'bank_ledger', search_term)
+                # 記憶體搜尋時資料列已載入，匯總數字直接依搜尋結果計算
+                total_income = df['income'].sum()
+                total_expense = df['expense'].sum()
+            total_records = len(df)
         
-        if len(df) == 0:
+        if total_records == 0:
             st.warning(f"🔍 找不到符合條件的帳本記錄")
         else:
-            # 計算匯總數字（在搜尋和分頁之前）
-            total_income = df['income'].sum()
-            total_expense = df['expense'].sum()
             net_amount = total_income - total_expense
             
             # 顯示匯總資訊
@@ -355,8 +403,7 @@ try:
             
             st.divider()
             
-            # 計算總筆數和總頁數
-            total_records = len(df)
+            # 計算總頁數
             total_pages = (total_records + items_per_page - 1) // items_per_page  # 向上取整
             
             # 確保當前頁數不超過總頁數
@@ -364,6 +411,8 @@ try:
                 st.session_state['current_page'] = total_pages if total_pages > 0 else 1
             
             st.write(f"共 {total_records} 筆帳本記錄")
+            if use_sql_search and total_records >= SEARCH_LIMIT:
+                st.caption(f"僅顯示最相關的 {SEARCH_LIMIT} 筆，請輸入更精確的關鍵字")
             
             # 分頁控制（在表格上方）
             if total_pages > 1:
@@ -384,7 +433,8 @@ try:
                         min_value=1,
                         max_value=total_pages,
                         value=st.session_state['current_page'],
-                        key="page_input",
+                        # 鍵含目前頁碼：按上一頁 / 下一頁後重新建立，否則沿用舊的輸入值又把頁碼改回去
+                        key=f"page_input_{st.session_state['current_page']}",
                         label_visibility="collapsed"
                     )
                     if page_num != st.session_state['current_page']:
@@ -398,10 +448,17 @@ try:
                 
                 st.divider()
             
-            # 根據當前頁數切片 DataFrame
-            start_idx = (st.session_state['current_page'] - 1) * items_per_page
-            end_idx = start_idx + items_per_page
-            df_paged = df.iloc[start_idx:end_idx].copy()
+            if df is not None:
+                # 搜尋結果：根據當前頁數切片 DataFrame
+                start_idx = (st.session_state['current_page'] - 1) * items_per_page
+                end_idx = start_idx + items_per_page
+                df_paged = df.iloc[start_idx:end_idx].copy()
+            else:
+                # 只向資料庫取當前頁（keyset 分頁，跳頁時從快取的頁面起點往後找）
+                boundaries = get_page_boundaries('ledger_page_boundaries', branches, params, items_per_page)
+                page_rows = fetch_page(branches, params, st.session_state['current_page'], items_per_page,
+                                       boundaries, descending=True)
+                df_paged = frame_from_rows(page_rows, LEDGER_COLUMNS)
             
             # 三個按鈕在同一行（表格上方）
             col_add, col_edit, col_delete, col_space = st.columns([1, 1, 1, 7])
@@ -415,9 +472,9 @@ try:
                     # 檢查是否有選擇資料
                     if 'selected_ledger_id' in st.session_state and st.session_state['selected_ledger_id'] is not None:
                         selected_id = st.session_state['selected_ledger_id']
-                        if selected_id in df['id'].values:
-                            selected_row = df[df['id'] == selected_id].iloc[0]
-                            edit_ledger_dialog(selected_row.to_dict())
+                        if selected_id in df_paged['id'].values:
+                            selected_row = df_paged[df_paged['id'] == selected_id].iloc[0]
+                            edit_ledger_dialog(frame_record(selected_row))
                         else:
                             st.warning("⚠️ 請先點選要編輯的記錄")
                     else:
@@ -428,7 +485,7 @@ try:
                     # 檢查是否有選擇資料
                     if 'selected_ledger_id' in st.session_state and st.session_state['selected_ledger_id'] is not None:
                         selected_id = st.session_state['selected_ledger_id']
-                        if selected_id in df['id'].values:
+                        if selected_id in df_paged['id'].values:
                             st.session_state['confirm_delete_selected'] = selected_id
                         else:
                             st.warning("⚠️ 請先點選要刪除的記錄")
@@ -447,16 +504,20 @@ try:
                 'note': '備註'
             })
             
-            # 格式化日期和金額
-            display_df['日期'] = display_df['日期'].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else '-')
-            display_df['支出金額'] = display_df['支出金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) and x > 0 else '-')
-            display_df['收入金額'] = display_df['收入金額'].apply(lambda x: f"NT$ {x:,.0f}" if pd.notna(x) and x > 0 else '-')
+            # 餘額為整本帳本依 (日期, id) 累計的結果，不受日期範圍與搜尋影響
+            balances = running_balances(df_paged['id'].tolist())
+            display_df['餘額'] = df_paged['id'].map(balances)
+            
+            # 格式化日期和金額（收入 / 支出只顯示大於 0 的金額）
+            column_config = format_columns(display_df, money=['餘額'], dates=['日期'],
+                                           positive_money=['支出金額', '收入金額'])
             
             # 顯示表格
             selection = st.dataframe(
-                display_df[['日期', '匯款人', '收入金額', '支出金額', '備註']],
+                display_df[['日期', '匯款人', '收入金額', '支出金額', '餘額', '備註']],
                 use_container_width=True,
                 hide_index=True,
+                column_config=column_config,
                 on_select="rerun",
                 selection_mode="single-row",
                 key="ledger_table"
@@ -473,8 +534,8 @@ try:
             # 顯示已選擇的資料
             if 'selected_ledger_id' in st.session_state and st.session_state['selected_ledger_id'] is not None:
                 selected_id = st.session_state['selected_ledger_id']
-                if selected_id in df['id'].values:
-                    selected_row = df[df['id'] == selected_id].iloc[0]
+                if selected_id in df_paged['id'].values:
+                    selected_row = frame_record(df_paged[df_paged['id'] == selected_id].iloc[0])
                     st.info(f"✓ 已選擇：{selected_row['txn_date']} - {selected_row['payer'] or '無匯款人'}")
                     
                     # 刪除確認（二次確認）
@@ -487,8 +548,10 @@ try:
                                 try:
                                     with get_connection() as conn:
                                         with conn.cursor() as cur:
-                                            cur.execute("DELETE FROM bank_ledger WHERE id = %s", (selected_id,))
+                                            cur.execute("DELETE FROM bank_ledger WHERE id = %s RETURNING id", (selected_id,))
+                                            changed = {row[0] for row in cur.fetchall()}
                                             conn.commit()
+                                    invalidate_rows({'bank_ledger': changed})
                                     st.success("✅ 刪除成功！")
                                     if 'confirm_delete_selected' in st.session_state:
                                         del st.session_state['confirm_delete_selected']
@@ -523,7 +586,8 @@ try:
                         min_value=1,
                         max_value=total_pages,
                         value=st.session_state['current_page'],
-                        key="page_input_bottom",
+                        # 鍵含目前頁碼：按上一頁 / 下一頁後重新建立，否則沿用舊的輸入值又把頁碼改回去
+                        key=f"page_input_bottom_{st.session_state['current_page']}",
                         label_visibility="collapsed"
                     )
                     if page_num2 != st.session_state['current_page']:
@@ -0,0 +1,75 @@
+import streamlit as st
+from query_panel import query_debug_panel
+from datetime import date, datetime
+from frames import fetch_frame
+from exports import export_button
+from display import format_money
+from aging import AGING_BUCKETS, AGING_COLUMNS, AGING_GROUPS, aging_header, aging_sql, build_aging_workbook
+
+st.set_page_config(page_title="帳齡分析", page_icon="⏰", layout="wide")
+query_debug_panel("帳齡分析")
+
+st.title("⏰ 應收帳款帳齡分析")
+
+# ============================================
+# 條件
+# ============================================
+col_as_of, col_group, col_export = st.columns([1, 1, 1])
+
+with col_as_of:
+    as_of = st.date_input("基準日", value=date.today(), key="aging_as_of")
+
+with col_group:
+    group = st.selectbox(
+        "分組方式",
+        options=list(AGING_GROUPS),
+        format_func=lambda g: AGING_GROUPS[g][0],
+        key="aging_group"
+    )
+
+with col_export:
+    st.write("")  # 空行對齊
+    st.write("")  # 空行對齊
+    export_button(
+        "aging",
+        build_aging_workbook,
+        (as_of,),
+        tables=['ar_leasing', 'ar_buyout', 'contracts_leasing', 'contracts_buyout', 'companies'],
+        file_name=f"帳齡分析_{as_of.strftime('%Y%m%d')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
+    )
+
+st.divider()
+
+# ============================================
+# 帳齡分析（資料庫分組加總，依基準日快取）
+# ============================================
+try:
+    df = fetch_frame(aging_sql(group), {'as_of': as_of}, AGING_COLUMNS,
+                     kinds={column: 'money' for column, _, _ in AGING_BUCKETS})
+
+    if df.empty:
+        st.info("📝 目前沒有未收帳款")
+    else:
+        bucket_columns = [column for column, _, _ in AGING_BUCKETS]
+
+        # 各帳齡區間合計
+        st.subheader(f"📊 {as_of.strftime('%Y/%m/%d')} 未收帳款帳齡")
+        metric_columns = st.columns(len(AGING_BUCKETS) + 1)
+        for metric_column, (column, label, _) in zip(metric_columns, AGING_BUCKETS):
+            metric_column.metric(label, f"NT$ {df[column].sum():,.0f}")
+        metric_columns[-1].metric("💰 未收總額", f"NT$ {df['total'].sum():,.0f}")
+
+        st.divider()
+
+        st.write(f"共 {len(df)} 筆（{AGING_GROUPS[group][0]}），{int(df['row_count'].sum())} 筆未收帳款")
+
+        display_df = df.copy()
+        for column in bucket_columns + ['total']:
+            display_df[column] = format_money(display_df[column].to_numpy())
+        display_df[['code', 'name']] = display_df[['code', 'name']].fillna('-')
+        display_df.columns = aging_header(group)
+
+        st.dataframe(display_df, use_container_width=True, hide_index=True)
+
+except Exception as e:
+    st.error(f"❌ 載入帳齡分析失敗：{e}")
@@ -0,0 +1,100 @@
+import streamlit as st
+from query_panel import query_debug_panel
+import pandas as pd
+from datetime import date, timedelta
+from db_config import get_connection, get_cursor, invalidate_rows
+from display import format_money, DATE_FORMAT
+from reconcile import (load_deposits, load_open_items, propose_matches, apply_matches,
+                       DAYS_BEFORE, DAYS_AFTER, MIN_SIMILARITY)
+
+st.set_page_config(page_title="自動對帳", page_icon="🔗", layout="wide")
+query_debug_panel("自動對帳")
+
+st.title("🔗 銀行收入自動對帳")
+st.caption("依「金額 = 未收金額」、日期時間窗與匯款人 / 客戶名稱相似度產生配對建議，勾選後一次沖銷應收帳款")
+
+# ============================================
+# 條件
+# ============================================
+col_from, col_to, col_before, col_after, col_similarity = st.columns(5)
+
+with col_from:
+    from_date = st.date_input("收入日期（起）", value=date.today() - timedelta(days=90), key="reconcile_from")
+with col_to:
+    to_date = st.date_input("收入日期（迄）", value=date.today(), key="reconcile_to")
+with col_before:
+    days_before = st.number_input("可早於帳款日期（天）", min_value=0, max_value=365, value=DAYS_BEFORE, key="reconcile_before")
+with col_after:
+    days_after = st.number_input("可晚於帳款日期（天）", min_value=0, max_value=365, value=DAYS_AFTER, key="reconcile_after")
+with col_similarity:
+    min_similarity = st.slider("名稱相似度下限", min_value=0.0, max_value=1.0, value=MIN_SIMILARITY, step=0.05, key="reconcile_similarity")
+
+if st.button("🔍 產生配對建議", type="primary", key="reconcile_propose"):
+    try:
+        with get_cursor() as cur:
+            deposits = load_deposits(cur, from_date, to_date)
+            open_items = load_open_items(cur, deposits, days_before, days_after)
+        st.session_state['reconcile_matches'] = propose_matches(
+            deposits, open_items, days_before, days_after, min_similarity
+        )
+        st.session_state['reconcile_counts'] = (len(deposits), len(open_items))
+    except Exception as e:
+        st.error(f"❌ 產生配對建議失敗：{e}")
+
+st.divider()
+
+# ============================================
+# 配對建議
+# ============================================
+matches = st.session_state.get('reconcile_matches')
+
+if matches is None:
+    st.info("📝 請設定條件後按「產生配對建議」")
+elif not matches:
+    deposit_count, item_count = st.session_state['reconcile_counts']
+    st.info(f"📝 {deposit_count} 筆未對帳收入與 {item_count} 筆未收帳款中沒有符合條件的配對")
+else:
+    deposit_count, item_count = st.session_state['reconcile_counts']
+    st.write(f"{deposit_count} 筆未對帳收入、{item_count} 筆未收帳款，共 {len(matches)} 組配對建議")
+
+    df = pd.DataFrame({
+        '接受': [m.similarity >= 0.8 for m in matches],
+        '收入日期': [m.deposit.txn_date for m in matches],
+        '匯款人': [m.deposit.payer or '-' for m in matches],
+        '金額': format_money([m.deposit.amount for m in matches]),
+        '類型': [m.item.ar_type for m in matches],
+        '合約編號': [m.item.contract_code for m in matches],
+        '客戶名稱': [m.item.customer_name or '-' for m in matches],
+        '帳款日期': [m.item.due_date for m in matches],
+        '相似度': [round(m.similarity, 2) for m in matches],
+        '分數': [round(m.score, 2) for m in matches],
+    })
+
+    # 相似度 0.8 以上預設勾選，其餘需人工確認
+    edited = st.data_editor(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            '收入日期': st.column_config.DateColumn('收入日期', format=DATE_FORMAT),
+            '帳款日期': st.column_config.DateColumn('帳款日期', format=DATE_FORMAT),
+        },
+        disabled=[column for column in df.columns if column != '接受'],
+        key="reconcile_editor"
+    )
+
+    accepted = [match for match, keep in zip(matches, edited['接受']) if keep]
+    if st.button(f"✅ 套用已勾選的 {len(accepted)} 組配對", disabled=not accepted, key="reconcile_apply"):
+        try:
+            # 所有配對在同一個交易中處理，任何一筆失敗時全部還原
+            with get_connection() as conn:
+                updated = apply_matches(conn, accepted)
+            invalidate_rows({
+                'ar_leasing': {m.item.id for m in accepted if m.item.ar_type == '租賃'},
+                'ar_buyout': {m.item.id for m in accepted if m.item.ar_type == '買斷'},
+                'reconciliation_matches': None,
+            })
+            st.session_state['reconcile_matches'] = None
+            st.success(f"✅ 已沖銷 {updated} 筆應收帳款")
+        except Exception as e:
+            st.error(f"❌ 套用配對失敗：{e}")
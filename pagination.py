@@ -0,0 +1,118 @@
+from collections import namedtuple
+import streamlit as st
+from db_config import fetch_all
+from query_cache import get_query_cache
+
+# keyset 分頁的查詢分支：
+#   select      - 輸出欄位（各分支欄位數與型別需一致）
+#   table       - 資料表名稱
+#   where       - 篩選條件（不含分頁條件）
+#   sort_column - 排序欄位（需有索引）
+#   id_column   - 排序欄位相同時的次要排序欄位；sort_column 在分支內唯一時可為 None
+#   joins       - 接在資料表後的 JOIN（例如 CROSS JOIN LATERAL 展開欄位），可省略
+KeysetBranch = namedtuple('KeysetBranch', ['select', 'table', 'where', 'sort_column', 'id_column', 'joins'],
+                          defaults=[''])
+
+# 分頁查詢結果最後三欄為排序鍵：(排序值, 分支序號, id)
+KEY_WIDTH = 3
+
+def union_sql(branches):
+    """合併所有分支（不分頁），供筆數統計、匯出或記憶體搜尋使用"""
+    return "\nUNION ALL\n".join(
+        f"SELECT {branch.select} FROM {branch.table} {branch.joins} WHERE {branch.where}"
+        for branch in branches
+    )
+
+def summary_sql(branches, columns, aggregates="COUNT(*)"):
+    """對所有分支做彙總（總筆數、匯總金額），columns 為分支輸出欄位的名稱"""
+    return f"SELECT {aggregates} FROM ({union_sql(branches)}) AS t({', '.join(columns)})"
+
+def _cursor_condition(branch, order, cursor, descending):
+    """分支內「排在 cursor 之後」的條件；每個分支都只用到自己的 (sort_column, id_column) 索引"""
+    if cursor is None:
+        return "TRUE"
+
+    _, cursor_branch, _ = cursor
+    strict, inclusive = ('<', '<=') if descending else ('>', '>=')
+    if order == cursor_branch:
+        if branch.id_column:
+            return f"({branch.sort_column}, {branch.id_column}) {strict} (%(cursor_sort)s, %(cursor_id)s)"
+        return f"{branch.sort_column} {strict} %(cursor_sort)s"
+
+    # 排序值相同時，分支序號較後的分支排在 cursor 之後
+    comes_after = order < cursor_branch if descending else order > cursor_branch
+    return f"{branch.sort_column} {inclusive if comes_after else strict} %(cursor_sort)s"
+
+def page_sql(branches, cursor, limit, offset=0, descending=False, keys_only=False):
+    """
+    產生 keyset 分頁查詢，回傳 (sql, 參數)。
+    cursor 為上一頁最後一列的排序鍵（第一頁為 None）；各分支先各自以索引排序並 LIMIT，再合併排序。
+    keys_only=True 時只回傳排序鍵（用於跳頁時計算起點）。
+    """
+    direction = "DESC" if descending else "ASC"
+    parts = []
+    for order, branch in enumerate(branches):
+        select = "" if keys_only else f"{branch.select}, "
+        id_expr = branch.id_column or "NULL::integer"
+        order_by = f"{branch.sort_column} {direction}"
+        if branch.id_column:
+            order_by += f", {branch.id_column} {direction}"
+        parts.append(f"""(
+            SELECT {select}{branch.sort_column} AS page_sort_key, {order} AS page_branch, {id_expr} AS page_row_id
+            FROM {branch.table} {branch.joins}
+            WHERE ({branch.where}) AND {_cursor_condition(branch, order, cursor, descending)}
+            ORDER BY {order_by}
+            LIMIT %(branch_limit)s
+        )""")
+
+    # 合併結果包成子查詢再排序：只有一個分支時，括號內的 ORDER BY 不能與外層的 ORDER BY 並存
+    sql = "SELECT * FROM (\n" + "\nUNION ALL\n".join(parts) + f"""
+        ) AS page
+        ORDER BY page_sort_key {direction}, page_branch {direction}, page_row_id {direction}
+        LIMIT %(page_limit)s OFFSET %(page_offset)s
+    """
+    params = {'branch_limit': limit + offset, 'page_limit': limit, 'page_offset': offset}
+    if cursor is not None:
+        params['cursor_sort'] = cursor[0]
+        params['cursor_id'] = cursor[2]
+    return sql, params
+
+def get_page_boundaries(state_key, branches, params, page_size):
+    """
+    取得 session 中快取的各頁起點鍵（{頁碼: 上一頁最後一列的排序鍵}）。
+    查詢條件、每頁筆數或資料版本（寫入後）改變時重新開始。
+    """
+    identity = (
+        tuple(branches),
+        tuple(sorted(params.items())),
+        page_size,
+        get_query_cache().version(*{branch.table for branch in branches}),
+    )
+    if st.session_state.get(f"{state_key}_identity") != identity:
+        st.session_state[f"{state_key}_identity"] = identity
+        st.session_state[state_key] = {1: None}
+    return st.session_state[state_key]
+
+def fetch_page(branches, params, page, page_size, boundaries, descending=False):
+    """
+    取得第 page 頁（1 起算）的資料列（已去掉排序鍵欄位）。
+    跳頁時從最近的已知起點往後只讀排序鍵，並把新起點記錄在 boundaries。
+    """
+    known_page = max(p for p in boundaries if p <= page)
+    cursor = boundaries[known_page]
+
+    if known_page < page:
+        skip = (page - known_page) * page_size
+        sql, page_params = page_sql(branches, cursor, 1, offset=skip - 1,
+                                    descending=descending, keys_only=True)
+        keys = fetch_all(sql, {**params, **page_params})
+        if not keys:
+            return []
+        cursor = tuple(keys[0])
+        boundaries[page] = cursor
+
+    sql, page_params = page_sql(branches, cursor, page_size, descending=descending)
+    rows = fetch_all(sql, {**params, **page_params})
+    if rows:
+        boundaries[page + 1] = tuple(rows[-1][-KEY_WIDTH:])
+    return [row[:-KEY_WIDTH] for row in rows]
@@ -0,0 +1,123 @@
+from pagination import KeysetBranch
+from search import search_condition, search_rank, SEARCH_LIMIT
+
+# 客戶 / 公司 / 合約資料查詢的清單：資料表 → (排序欄位, 輸出欄位)
+LIST_QUERIES = {
+    'customers': ('customer_code', ['id', 'customer_code', 'name', 'contact_name', 'mobile', 'phone',
+                                    'address', 'email', 'tax_id', 'sales_rep_name', 'remark']),
+    'companies': ('company_code', ['id', 'company_code', 'name', 'contact_name', 'mobile', 'phone',
+                                   'address', 'email', 'tax_id', 'sales_rep', 'is_sales', 'is_service']),
+    'contracts_leasing': ('contract_code', ['id', 'contract_code', 'customer_code', 'customer_name', 'start_date',
+                                            'model', 'quantity', 'monthly_rent', 'payment_cycle_months',
+                                            'overprint', 'contract_months', 'sales_company_code', 'sales_amount',
+                                            'service_company_code', 'service_amount']),
+    'contracts_buyout': ('contract_code', ['id', 'contract_code', 'customer_code', 'customer_name', 'deal_date',
+                                           'deal_amount', 'sales_company_code', 'sales_amount',
+                                           'service_company_code', 'service_amount']),
+}
+
+def list_query(table, search=False):
+    """
+    清單查詢，回傳 (sql, 欄位)：全部資料依代碼排序；
+    search=True 時以 pg_trgm 搜尋並依相關度排序、限制筆數（參數為 search.search_params()）。
+    """
+    order, columns = LIST_QUERIES[table]
+    if search:
+        sql = f"""
+            SELECT {', '.join(columns)}
+            FROM {table}
+            WHERE {search_condition(table)}
+            ORDER BY {search_rank(table)} DESC, {order}
+            LIMIT {SEARCH_LIMIT}
+        """
+    else:
+        sql = f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order}"
+    return sql, columns
+
+# 帳款資料查詢 / 銀行帳本查詢 的查詢分支（分頁、筆數統計、搜尋共用同一組條件）
+AR_COLUMNS = ['id', 'type', 'contract_code', 'customer_code', 'customer_name', 'date',
+              'end_date', 'amount', 'fee', 'received_amount', 'payment_status']
+PAYABLE_COLUMNS = ['contract_code', 'contract_type', 'customer_code', 'customer_name', 'date',
+                   'payable_type', 'company_code', 'amount', 'payment_status']
+LEDGER_COLUMNS = ['id', 'txn_date', 'payer', 'expense', 'income', 'note']
+
+def date_params(from_date=None, to_date=None):
+    """日期篩選參數（未套用日期篩選時為空）"""
+    if from_date and to_date:
+        return {'from_date': from_date, 'to_date': to_date}
+    return {}
+
+def _where(*conditions):
+    return " AND ".join(condition for condition in conditions if condition) or "TRUE"
+
+def _date_condition(column, params):
+    if 'from_date' in params:
+        return f"{column} BETWEEN %(from_date)s AND %(to_date)s"
+    return None
+
+def ar_branches(ar_type, params):
+    """總應收 / 總未收帳款：租賃與買斷應收，依 (contract_code, id) 分頁"""
+    # 總未收帳款只看繳費狀況不是「已收款」的資料
+    unpaid = "payment_status != '已收款'" if ar_type == "總未收帳款" else None
+    return [
+        KeysetBranch(
+            "id, '租賃', contract_code, customer_code, customer_name, "
+            "start_date, end_date, total_rent, fee, received_amount, payment_status",
+            'ar_leasing', _where(_date_condition('start_date', params), unpaid),
+            'contract_code', 'id'
+        ),
+        KeysetBranch(
+            "id, '買斷', contract_code, customer_code, customer_name, "
+            "deal_date, NULL::date, total_amount, fee, received_amount, payment_status",
+            'ar_buyout', _where(_date_condition('deal_date', params), unpaid),
+            'contract_code', 'id'
+        ),
+    ]
+
+# 合約的業務、維護應付展開成兩列 (payable_type, company_code, amount, payment_status)
+PAYABLE_UNPIVOT = """
+    CROSS JOIN LATERAL (VALUES
+        ('業務', sales_company_code, sales_amount, sales_payment_status),
+        ('維護', service_company_code, service_amount, service_payment_status)
+    ) AS p(payable_type, company_code, amount, payment_status)
+"""
+
+def payable_branches(ar_type, params):
+    """
+    未出 / 已出帳款：租賃與買斷合約的業務、維護應付（每個合約資料表只掃描一次），
+    依 (contract_code, payable_type) 分頁。ar_type 為 None 時不限付款狀況（匯出全部應付）。
+    """
+    # 未出：付款狀況不是「已付款」；已出：付款狀況為「已付款」
+    status_op = {"未出帳款": "!=", "已出帳款": "="}.get(ar_type)
+    status = f"p.payment_status {status_op} '已付款'" if status_op else None
+    # 合約層級的相同條件，與 migrations/0003 的部分索引條件一致，分頁時可以使用索引
+    contract_status = "(" + " OR ".join(
+        f"({prefix}_payment_status {status_op} '已付款' AND {prefix}_amount > 0)"
+        for prefix in ['sales', 'service']
+    ) + ")" if status_op else None
+
+    return [
+        KeysetBranch(
+            f"contract_code, '{contract_type}', customer_code, customer_name, {date_column}, "
+            "p.payable_type, p.company_code, p.amount, p.payment_status",
+            table,
+            _where(_date_condition(date_column, params), contract_status, status, "p.amount > 0"),
+            'contract_code', 'p.payable_type', PAYABLE_UNPIVOT
+        )
+        for table, contract_type, date_column in [('contracts_leasing', '租賃', 'start_date'),
+                                                  ('contracts_buyout', '買斷', 'deal_date')]
+    ]
+
+def account_branches(ar_type, params):
+    """依帳款類型回傳查詢分支與欄位"""
+    if ar_type in ["未出帳款", "已出帳款"]:
+        return payable_branches(ar_type, params), PAYABLE_COLUMNS
+    return ar_branches(ar_type, params), AR_COLUMNS
+
+def ledger_branches(params):
+    """銀行帳本，依 (txn_date, id) 由新到舊分頁"""
+    return [KeysetBranch(
+        "id, txn_date, payer, expense, income, note",
+        'bank_ledger', _where(_date_condition('txn_date', params)),
+        'txn_date', 'id'
+    )]
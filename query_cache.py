@@ -0,0 +1,184 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict, deque
+import pandas as pd
+import streamlit as st
+
+# 快取記憶體上限預設 256 MB；可用 QUERY_CACHE_MAX_MB 環境變數覆寫
+DEFAULT_MAX_MB = 256
+
+# 估算大型結果大小時只抽樣前幾列
+SIZE_SAMPLE_ROWS = 200
+
+# 每個資料表保留最近幾次失效的異動主鍵（search_index 依此只重新讀取異動的資料列）；
+# 一次失效超過 CHANGE_LOG_MAX_ROWS 筆時只記錄「有異動」，讀取端改為全部重新載入
+CHANGE_LOG_LENGTH = 256
+CHANGE_LOG_MAX_ROWS = 10000
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+
+def extract_tables(sql):
+    """從 SQL 文字取出引用的資料表名稱（FROM / JOIN / INTO / UPDATE 之後的名稱）"""
+    return frozenset(name.lower() for name in _TABLE_PATTERN.findall(sql))
+
+def estimate_size(value):
+    """估算快取值佔用的記憶體（位元組）"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (list, tuple)):
+        size = sys.getsizeof(value)
+        if not value:
+            return size
+        sample = value[:SIZE_SAMPLE_ROWS]
+        sample_size = sum(estimate_size(item) for item in sample)
+        return size + sample_size * len(value) // len(sample)
+    return sys.getsizeof(value)
+
+def make_key(sql, params=None):
+    """以 SQL 文字與參數組成快取鍵（list 參數，例如 ANY(%(ids)s) 的 id 清單，轉成 tuple）"""
+    if isinstance(params, dict):
+        frozen = tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                              for name, value in params.items()))
+    elif params is None:
+        frozen = None
+    else:
+        frozen = tuple(params)
+    return (sql, frozen)
+
+class QueryCache:
+    """跨 session 共用的查詢結果快取（記憶體上限 + LRU 淘汰，依資料表失效）"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()   # key -> (value, size, tables)
+        self._keys_by_table = {}        # table -> set(key)
+        self._versions = {}             # table -> 版本號（每次失效 +1）
+        self._changes = {}              # table -> deque[(版本號, 異動主鍵 frozenset；不明時為 None)]
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """回傳 (是否命中, 值)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def version(self, *tables):
+        """目前資料表版本（寫入或失效後會遞增），可作為「資料版本」鍵的一部分"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in sorted(tables))
+
+    def put(self, key, value, tables, versions=None):
+        """
+        寫入快取；versions 為查詢開始前取得的 version(*tables)，
+        若查詢期間資料表已失效則不寫入，避免把舊資料放回快取
+        """
+        tables = frozenset(tables)
+        size = estimate_size(value)
+        with self._lock:
+            if versions is not None and versions != self.version(*tables):
+                return False
+            if size > self.max_bytes:
+                return False
+
+            self._remove(key)
+            self._entries[key] = (value, size, tables)
+            self.current_bytes += size
+            for table in tables:
+                self._keys_by_table.setdefault(table, set()).add(key)
+
+            # 超過上限時淘汰最久未使用的項目
+            while self.current_bytes > self.max_bytes and self._entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, *tables):
+        """讓引用指定資料表的快取全部失效（不知道哪些資料列異動）"""
+        self.invalidate_rows({table: None for table in tables})
+
+    def invalidate_rows(self, changes):
+        """
+        changes 為 {資料表: 異動的主鍵集合（不明時為 None）}。
+        查詢結果無法只清除部分資料列，仍整個資料表失效；主鍵記錄在異動記錄中供 changed_rows() 使用。
+        """
+        with self._lock:
+            for table, ids in changes.items():
+                table = table.lower()
+                version = self._versions[table] = self._versions.get(table, 0) + 1
+                for key in list(self._keys_by_table.pop(table, ())):
+                    self._remove(key)
+                self.invalidations += 1
+                if ids is not None and len(ids) > CHANGE_LOG_MAX_ROWS:
+                    ids = None
+                self._changes.setdefault(table, deque(maxlen=CHANGE_LOG_LENGTH)).append(
+                    (version, frozenset(ids) if ids is not None else None)
+                )
+
+    def changed_rows(self, table, version):
+        """
+        version（先前 version(table) 的回傳值）之後異動的主鍵集合；
+        期間有主鍵不明的失效、或異動記錄已不完整時回傳 None
+        """
+        with self._lock:
+            (since,) = version
+            current = self._versions.get(table, 0)
+            entries = [ids for v, ids in self._changes.get(table, ()) if v > since]
+            if len(entries) != current - since or any(ids is None for ids in entries):
+                return None
+            return set().union(*entries)
+
+    def clear(self):
+        """清除所有快取（所有資料表版本遞增，異動記錄一併清除）"""
+        with self._lock:
+            for table in set(self._versions) | set(self._keys_by_table):
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self._changes.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, size, tables = entry
+        self.current_bytes -= size
+        for table in tables:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table]
+
+@st.cache_resource(show_spinner=False)
+def get_query_cache():
+    """取得整個伺服器行程共用的查詢快取（所有 session 共用）"""
+    max_mb = float(os.getenv('QUERY_CACHE_MAX_MB', DEFAULT_MAX_MB))
+    return QueryCache(max_bytes=int(max_mb * 1024 * 1024))
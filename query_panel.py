@@ -0,0 +1,66 @@
+"""
+側邊欄查詢除錯面板：顯示上一次重新執行（rerun）發出的查詢數、時間與快取命中，
+用來發現「每次重新執行查詢 N 次」之類的退步。
+
+啟用方式（任一）：環境變數 QUERY_DEBUG=1、Secrets [debug] query_panel = true、網址加上 ?debug=1
+"""
+import os
+import pandas as pd
+import streamlit as st
+from db_config import get_query_stats, current_session_id, _secrets_section, SLOW_QUERY_MS
+
+# 同一個查詢在一次重新執行中出現幾次以上視為 N+1
+REPEATED_QUERY_WARNING = 5
+
+def query_debug_enabled():
+    if os.getenv('QUERY_DEBUG', '').lower() in ('1', 'true', 'yes'):
+        return True
+    debug = _secrets_section('debug')
+    if debug is not None and debug.get('query_panel', False):
+        return True
+    return st.query_params.get('debug') == '1'
+
+def query_debug_panel(page):
+    """每個頁面開頭呼叫：開始記錄這次重新執行，並在側邊欄顯示上一次的查詢"""
+    session_id = current_session_id()
+    if session_id is None:
+        return
+    previous = get_query_stats().begin_rerun(session_id, page)
+    if not query_debug_enabled():
+        return
+
+    with st.sidebar.expander("🐢 查詢除錯", expanded=True):
+        if previous is None:
+            st.caption("重新執行一次後顯示本頁的查詢")
+            return
+        queries = previous['queries']
+        total_ms = sum(q.elapsed_ms for q in queries)
+        st.caption(f"上一次重新執行：{previous['page']}")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("查詢數", len(queries))
+        col2.metric("總時間", f"{total_ms:,.0f} ms")
+        col3.metric("快取命中", previous['cache_hits'])
+        if not queries:
+            return
+
+        counts = pd.Series([q.fingerprint for q in queries]).value_counts()
+        repeated = counts[counts >= REPEATED_QUERY_WARNING]
+        for fp, count in repeated.items():
+            sql = next(q.sql for q in queries if q.fingerprint == fp)
+            st.warning(f"同一個查詢執行了 {count} 次（{fp}）：{sql[:120]}")
+        slow = sum(q.elapsed_ms >= SLOW_QUERY_MS for q in queries)
+        if slow:
+            st.error(f"{slow} 個查詢超過 {SLOW_QUERY_MS:,.0f} ms")
+
+        st.dataframe(
+            pd.DataFrame({
+                '時間 (ms)': [q.elapsed_ms for q in queries],
+                '筆數': [q.rows for q in queries],
+                '呼叫位置': [q.page for q in queries],
+                '查詢': [q.sql[:200] for q in queries],
+                '參數': [str(q.params_shape) if q.params_shape is not None else '' for q in queries],
+                '錯誤': [q.error or '' for q in queries],
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
@@ -0,0 +1,247 @@
+"""
+銀行帳本收入與應收帳款的自動對帳
+
+配對條件：收入金額 = 未收金額（金額 + 手續費 - 已收金額）、收入日期在帳款日期的時間窗內、
+匯款人與客戶名稱相似。帳款依 (金額, 正規化客戶名稱) 建立雜湊索引、同鍵的帳款依日期排序：
+每筆收入先以雜湊查詢名稱相同或互為前綴（銀行截斷匯款人名稱）的帳款，再以二分搜尋取時間窗內的候選，
+整體為 O(n log n)。只有找不到名稱相符的帳款時，才對同金額、時間窗內日期最接近的
+MAX_FUZZY_CANDIDATES 筆計算模糊相似度，不需逐筆兩兩比較。
+"""
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import repeat
+from operator import attrgetter
+
+# 帳款日期前後的時間窗（天）：收入可早於帳款日期 DAYS_BEFORE 天、晚於 DAYS_AFTER 天
+DAYS_BEFORE = 15
+DAYS_AFTER = 60
+
+# 匯款人與客戶名稱相似度下限（0～1）
+MIN_SIMILARITY = 0.5
+
+# 分數 = 相似度 × NAME_WEIGHT + 日期接近程度 × (1 - NAME_WEIGHT)
+NAME_WEIGHT = 0.8
+
+# 名稱沒有完全或前綴相符時，每筆收入最多計算幾筆（日期最接近的）帳款的模糊相似度
+MAX_FUZZY_CANDIDATES = 20
+
+Deposit = namedtuple('Deposit', ['id', 'txn_date', 'payer', 'amount'])
+OpenItem = namedtuple('OpenItem', ['ar_type', 'id', 'contract_code', 'customer_name', 'due_date', 'balance'])
+Match = namedtuple('Match', ['deposit', 'item', 'similarity', 'score'])
+
+# 尚未對帳的銀行收入
+DEPOSITS_SQL = """
+    SELECT b.id, b.txn_date, b.payer, b.income
+    FROM bank_ledger b
+    WHERE b.income > 0
+      AND NOT EXISTS (SELECT 1 FROM reconciliation_matches m WHERE m.bank_ledger_id = b.id)
+"""
+
+# 未收款的應收帳款（帳款日期：租賃為期間起始日、買斷為成交日期），只取帳款日期在收入時間窗內者
+# （走 payment_status <> '已收款' 的部分索引）
+OPEN_ITEMS_SQL = """
+    SELECT '租賃', id, contract_code, customer_name, start_date,
+           COALESCE(total_rent, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0)
+    FROM ar_leasing
+    WHERE payment_status != '已收款' AND start_date BETWEEN %(first)s AND %(last)s
+      AND COALESCE(total_rent, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0) > 0
+    UNION ALL
+    SELECT '買斷', id, contract_code, customer_name, deal_date,
+           COALESCE(total_amount, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0)
+    FROM ar_buyout
+    WHERE payment_status != '已收款' AND deal_date BETWEEN %(first)s AND %(last)s
+      AND COALESCE(total_amount, 0) + COALESCE(fee, 0) - COALESCE(received_amount, 0) > 0
+"""
+
+# 類型 → (資料表, 金額欄位)
+AR_TABLES = {'租賃': ('ar_leasing', 'total_rent'), '買斷': ('ar_buyout', 'total_amount')}
+
+def normalize_name(name):
+    """名稱正規化：去除空白、全形括號與常見公司後綴，轉小寫"""
+    text = (name or "").lower().replace('（', '(').replace('）', ')')
+    for suffix in ['股份有限公司', '有限公司', '公司']:
+        text = text.replace(suffix, '')
+    return ''.join(text.split())
+
+def name_similarity(payer, customer_name):
+    """匯款人與客戶名稱的相似度（0～1）；其中一方包含另一方時視為 1（銀行常截斷匯款人名稱）"""
+    return _similarity(normalize_name(payer), normalize_name(customer_name))
+
+@lru_cache(maxsize=65536)
+def _char_counts(name):
+    return Counter(name)
+
+def _similarity(a, b, min_similarity=0.0):
+    """
+    已正規化名稱的相似度；低於 min_similarity 時可能回傳 0。
+    先以長度與共同字元數的上限（同 SequenceMatcher 的 real_quick_ratio / quick_ratio，
+    字元計數依名稱快取）略過不可能達到下限的名稱，不必建立 SequenceMatcher
+    """
+    if not a or not b:
+        return 0.0
+    if a in b or b in a:
+        return 1.0
+    total = len(a) + len(b)
+    if 2 * min(len(a), len(b)) < min_similarity * total:
+        return 0.0
+    counts_a, counts_b = _char_counts(a), _char_counts(b)
+    common = sum(map(min, counts_a.values(), map(counts_b.get, counts_a, repeat(0))))
+    if 2 * common < min_similarity * total:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+def load_deposits(cur, from_date=None, to_date=None):
+    sql, params = DEPOSITS_SQL, {}
+    if from_date and to_date:
+        sql += " AND b.txn_date BETWEEN %(from_date)s AND %(to_date)s"
+        params = {'from_date': from_date, 'to_date': to_date}
+    cur.execute(sql + " ORDER BY b.txn_date, b.id", params)
+    return [Deposit(*row) for row in cur.fetchall()]
+
+def load_open_items(cur, deposits, days_before=DAYS_BEFORE, days_after=DAYS_AFTER):
+    """可能與 deposits 配對的未收帳款：帳款日期介於 [最早收入 - days_after, 最晚收入 + days_before]"""
+    if not deposits:
+        return []
+    dates = [deposit.txn_date for deposit in deposits]
+    cur.execute(OPEN_ITEMS_SQL, {
+        'first': min(dates) - timedelta(days=days_after),
+        'last': max(dates) + timedelta(days=days_before),
+    })
+    return [OpenItem(*row) for row in cur.fetchall()]
+
+_due_date = attrgetter('due_date')
+
+def _window(items, first, last):
+    """依帳款日期排序的 items 中，帳款日期介於 [first, last] 的部分（二分搜尋）"""
+    return items[bisect_left(items, first, key=_due_date):bisect_right(items, last, key=_due_date)]
+
+def _nearest(items, day, first, last, count):
+    """依帳款日期排序的 items 中，帳款日期介於 [first, last] 且最接近 day 的 count 筆（由 day 往兩側展開）"""
+    low = bisect_left(items, first, key=_due_date)
+    high = bisect_right(items, last, key=_due_date)
+    right = bisect_left(items, day, low, high, key=_due_date)
+    left = right - 1
+    nearest = []
+    while len(nearest) < count and (left >= low or right < high):
+        if right >= high or (left >= low and day - items[left].due_date <= items[right].due_date - day):
+            nearest.append(items[left])
+            left -= 1
+        else:
+            nearest.append(items[right])
+            right += 1
+    return nearest
+
+def propose_matches(deposits, open_items, days_before=DAYS_BEFORE, days_after=DAYS_AFTER,
+                    min_similarity=MIN_SIMILARITY):
+    """
+    產生配對建議（每筆收入、每筆帳款最多配對一次），依分數由高到低回傳 [Match]。
+    同一筆收入有多個候選時取分數最高者；分數相同時取帳款日期較早者。
+    """
+    # (金額, 正規化名稱) → 帳款、金額 → 帳款，皆依帳款日期排序（整體排序一次，分組後仍有序）；
+    # 金額 → 該金額的名稱（排序後供前綴查詢）。Decimal 的雜湊與數值相等一致，1000 與 1000.00 為同一鍵
+    normalized = {}
+    by_key = defaultdict(list)
+    by_amount = defaultdict(list)
+    for item in sorted(open_items, key=lambda item: (item.due_date, item.id)):
+        name = normalized.get(item.customer_name)
+        if name is None:
+            name = normalized[item.customer_name] = normalize_name(item.customer_name)
+        by_key[(item.balance, name)].append(item)
+        by_amount[item.balance].append(item)
+    names_by_amount = defaultdict(list)
+    for amount, name in by_key:
+        names_by_amount[amount].append(name)
+    for names in names_by_amount.values():
+        names.sort()
+
+    window = days_before + days_after
+    similarities = {}
+    candidates = []
+    for deposit in deposits:
+        names = names_by_amount.get(deposit.amount)
+        if not names:
+            continue
+        payer = normalize_name(deposit.payer)
+        if not payer:
+            continue
+        # 帳款日期介於 [收入日期 - DAYS_AFTER, 收入日期 + DAYS_BEFORE]
+        first = deposit.txn_date - timedelta(days=days_after)
+        last = deposit.txn_date + timedelta(days=days_before)
+
+        # 名稱相同、客戶名稱以匯款人開頭（匯款人被截斷）、或匯款人以客戶名稱開頭：相似度 1
+        matched = names[bisect_left(names, payer):bisect_left(names, payer + '\U0010ffff')]
+        matched += [payer[:length] for length in range(1, len(payer)) if (deposit.amount, payer[:length]) in by_key]
+        scored = [(item, 1.0) for name in matched for item in _window(by_key[(deposit.amount, name)], first, last)]
+
+        if not scored:
+            # 沒有名稱相符的帳款：只比對日期最接近的幾筆
+            for item in _nearest(by_amount[deposit.amount], deposit.txn_date, first, last, MAX_FUZZY_CANDIDATES):
+                name = normalized[item.customer_name]
+                similarity = similarities.get((payer, name))
+                if similarity is None:
+                    similarity = similarities[(payer, name)] = _similarity(payer, name, min_similarity)
+                scored.append((item, similarity))
+
+        for item, similarity in scored:
+            if similarity < min_similarity:
+                continue
+            closeness = 1 - abs((deposit.txn_date - item.due_date).days) / window if window else 1
+            score = similarity * NAME_WEIGHT + closeness * (1 - NAME_WEIGHT)
+            candidates.append(Match(deposit, item, similarity, score))
+
+    # 由分數最高的候選開始指派，已用過的收入或帳款略過
+    candidates.sort(key=lambda m: (-m.score, m.item.due_date, m.deposit.id))
+    used_deposits, used_items = set(), set()
+    matches = []
+    for match in candidates:
+        item_key = (match.item.ar_type, match.item.id)
+        if match.deposit.id in used_deposits or item_key in used_items:
+            continue
+        used_deposits.add(match.deposit.id)
+        used_items.add(item_key)
+        matches.append(match)
+    return matches
+
+def apply_matches(conn, matches):
+    """
+    在單一交易中套用配對：累加已收金額、更新繳費狀況並寫入對帳紀錄。
+    帳款的未收金額已改變或收入已被對帳時整批 ROLLBACK（避免重複沖銷）。回傳更新的帳款筆數。
+    """
+    if not matches:
+        return 0
+
+    updated = 0
+    with conn.transaction(), conn.cursor() as cur:
+        for ar_type, (table, amount_column) in AR_TABLES.items():
+            rows = [(m.item.id, m.deposit.amount) for m in matches if m.item.ar_type == ar_type]
+            if not rows:
+                continue
+            ids, amounts = map(list, zip(*rows))
+            cur.execute(f"""
+                UPDATE {table} a
+                SET received_amount = COALESCE(a.received_amount, 0) + m.amount,
+                    payment_status = CASE
+                        WHEN COALESCE(a.received_amount, 0) + m.amount
+                             >= COALESCE(a.{amount_column}, 0) + COALESCE(a.fee, 0) THEN '已收款'
+                        ELSE '部分收款'
+                    END::payment_status_enum,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM unnest(%s::int[], %s::numeric[]) AS m(id, amount)
+                WHERE a.id = m.id
+                  AND a.payment_status != '已收款'
+                  -- 未收金額需仍與配對時相同（期間未被其他人修改）
+                  AND COALESCE(a.{amount_column}, 0) + COALESCE(a.fee, 0) - COALESCE(a.received_amount, 0) = m.amount
+            """, (ids, amounts))
+            if cur.rowcount != len(rows):
+                raise RuntimeError(f"{ar_type}應收帳款有 {len(rows) - cur.rowcount} 筆已被其他人更新，請重新產生配對建議")
+            updated += cur.rowcount
+
+        cur.executemany("""
+            INSERT INTO reconciliation_matches (bank_ledger_id, ar_type, ar_id, amount, similarity)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [(m.deposit.id, m.item.ar_type, m.item.id, m.deposit.amount, round(m.similarity, 3))
+              for m in matches])
+    return updated
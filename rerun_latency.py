@@ -0,0 +1,319 @@
+"""
+頁面重新執行（rerun）延遲的回歸檢查：以 streamlit.testing.v1.AppTest 在本機資料庫上模擬常用操作
+
+每個頁面依序執行「載入、搜尋、換頁、點選資料列、開啟編輯視窗、匯出」等步驟，每一步計時一次 rerun，
+並以 db_config 的查詢記錄計算該次 rerun 由頁面發出的資料庫查詢數（快取命中不算；背景匯出的查詢不算）。
+重複多輪後計算 p50 / p95，與基準檔比較：p95 超過基準的 (1 + 容許比例) 倍加上容許毫秒數、
+或查詢數多於基準時回傳 1。
+
+    python rerun_latency.py --seed-scale small       # 載入 small 規模合成資料後執行（會清空資料表！）
+    python rerun_latency.py                          # 使用資料庫目前的資料，與 rerun_baseline.json 比較
+    python rerun_latency.py --update-baseline        # 以這次的結果更新基準檔
+    python rerun_latency.py --page 4_帳款資料查詢.py --repeat 20
+
+已提交的 rerun_baseline.json 以 small 規模合成資料（種子 0）、每頁 10 輪記錄；比較前請載入相同資料。
+"""
+import argparse
+import json
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+from streamlit.testing.v1 import AppTest
+from db_config import fetch_all, get_query_stats
+from query_cache import get_query_cache
+from aggregates import has_rollups
+from balances import has_balance_checkpoints
+from search import has_trgm_search
+from exports import _get_export_registry
+from pagination import fetch_page
+from queries import account_branches, ledger_branches
+from synthetic_data import SCALES, TABLES, load_synthetic_data, scale_counts
+
+ROOT = Path(__file__).parent
+PAGES_DIR = ROOT / 'pages'
+BASELINE_FILE = ROOT / 'rerun_baseline.json'
+
+# p95 超過基準 × (1 + TOLERANCE) + SLACK_MS 視為退步（SLACK_MS 避免幾毫秒的步驟因雜訊失敗）
+TOLERANCE = 0.25
+SLACK_MS = 50
+
+# 與帳款 / 銀行帳本頁面的預設每頁筆數相同
+PAGE_SIZE = 50
+
+# ============================================
+# 操作
+# ============================================
+def _button(at, label=None, key=None):
+    """依 key 或顯示文字找按鈕"""
+    if key is not None:
+        return at.button(key=key)
+    return next(button for button in at.button if button.label == label)
+
+def search(term=None):
+    """在頁面最上方的搜尋框輸入 term（None 為 --search 指定的關鍵字）"""
+    def action(at, ctx):
+        at.text_input[0].input(ctx['search_term'] if term is None else term)
+    return action
+
+def click(label=None, key=None):
+    def action(at, ctx):
+        _button(at, label, key).click()
+    return action
+
+def choose(key, value):
+    def action(at, ctx):
+        at.selectbox(key=key).select(value)
+    return action
+
+def select_row(selection):
+    """點選表格的第一列：資料表的 on_select 由 session_state 記錄，AppTest 無法點選表格，直接寫入相同的鍵"""
+    def action(at, ctx):
+        for name, value in ctx['selections'][selection].items():
+            at.session_state[name] = value
+    return action
+
+def edit_row(selection, label=None, key=None):
+    """點選資料列後按編輯（頁面在沒有表格選取時會清除選取記錄，所以兩者在同一次 rerun）"""
+    def action(at, ctx):
+        select_row(selection)(at, ctx)
+        _button(at, label, key).click()
+    return action
+
+def export(name):
+    def action(at, ctx):
+        _button(at, key=f"{name}_export_start").click()
+    return action
+
+# 頁面檔名 → [(步驟名稱, 操作)]；操作為 None 表示第一次載入
+SCENARIOS = {
+    '1_客戶資料查詢.py': [
+        ("載入", None),
+        ("搜尋", search()),
+        ("清除搜尋", search("")),
+        ("點選資料列", select_row('customer')),
+        ("開啟編輯視窗", edit_row('customer', label="✏️ 編輯客戶")),
+    ],
+    '2_公司資料查詢.py': [
+        ("載入", None),
+        ("搜尋", search()),
+        ("清除搜尋", search("")),
+        ("點選資料列", select_row('company')),
+        ("開啟編輯視窗", edit_row('company', label="✏️ 編輯公司")),
+    ],
+    '3_合約資料查詢.py': [
+        ("載入", None),
+        ("搜尋", search()),
+        ("清除搜尋", search("")),
+        ("點選資料列", select_row('leasing')),
+        ("開啟編輯視窗", edit_row('leasing', key="edit_leasing_btn")),
+        ("切換買斷合約", choose('contract_type_select', "買斷合約")),
+    ],
+    '4_帳款資料查詢.py': [
+        ("載入", None),
+        ("下一頁", click(key="next_page")),
+        ("上一頁", click(key="prev_page")),
+        ("點選資料列", select_row('ar')),
+        ("開啟編輯視窗", edit_row('ar', key="edit_ar_btn")),
+        ("切換未出帳款", choose('ar_type_select', "未出帳款")),
+        ("搜尋", search()),
+        ("匯出", export('accounts')),
+    ],
+    '5_銀行帳本查詢.py': [
+        ("載入", None),
+        ("下一頁", click(key="next_page")),
+        ("上一頁", click(key="prev_page")),
+        ("點選資料列", select_row('ledger')),
+        ("開啟編輯視窗", edit_row('ledger', label="✏️ 編輯記錄")),
+        ("搜尋", search()),
+        ("匯出", export('ledger')),
+    ],
+    '6_帳齡分析.py': [
+        ("載入", None),
+        ("切換業務公司", choose('aging_group', 'sales_company')),
+        ("匯出", export('aging')),
+    ],
+    '7_自動對帳.py': [
+        ("載入", None),
+        ("產生配對建議", click(key="reconcile_propose")),
+    ],
+}
+
+def _first_id(sql):
+    rows = fetch_all(sql)
+    return rows[0][0] if rows else None
+
+def _ar_selection():
+    rows = fetch_page(account_branches("總應收帳款", {})[0], {}, 1, PAGE_SIZE, {1: None})
+    return {'selected_ar_id': rows[0][0] if rows else None,
+            'selected_ar_type': rows[0][1] if rows else None}
+
+def _ledger_selection():
+    rows = fetch_page(ledger_branches({}), {}, 1, PAGE_SIZE, {1: None}, descending=True)
+    return {'selected_ledger_id': rows[0][0] if rows else None}
+
+# 選取記錄名稱 → 取得第一頁第一列的函式（回傳與頁面寫入 session_state 相同的鍵）
+SELECTIONS = {
+    'customer': lambda: {'selected_customer_id': _first_id("SELECT id FROM customers ORDER BY customer_code LIMIT 1")},
+    'company': lambda: {'selected_company_id': _first_id("SELECT id FROM companies ORDER BY company_code LIMIT 1")},
+    'leasing': lambda: {'selected_leasing_id': _first_id("SELECT id FROM contracts_leasing ORDER BY contract_code LIMIT 1")},
+    'ar': _ar_selection,
+    'ledger': _ledger_selection,
+}
+
+# 頁面檔名 → SCENARIOS 中 select_row / edit_row 使用的選取記錄
+PAGE_SELECTIONS = {
+    '1_客戶資料查詢.py': ['customer'],
+    '2_公司資料查詢.py': ['company'],
+    '3_合約資料查詢.py': ['leasing'],
+    '4_帳款資料查詢.py': ['ar'],
+    '5_銀行帳本查詢.py': ['ledger'],
+}
+
+def first_rows(pages):
+    """只查詢要測試的頁面用到的選取記錄（--page 只測一頁時不必讀取其他頁面的第一頁）"""
+    names = {name for page in pages for name in PAGE_SELECTIONS.get(page, ())}
+    return {name: SELECTIONS[name]() for name in names}
+
+def warm_capability_checks():
+    """
+    先執行每個行程快取 10 分鐘的資料庫功能檢查：否則檢查查詢會算在第一個（或快取過期後第一個）
+    呼叫的頁面，查詢數隨 --page 與執行時間改變
+    """
+    has_trgm_search()
+    has_rollups()
+    has_balance_checkpoints()
+
+def discard_exports():
+    """
+    等待產生中的匯出完成後清空匯出表，讓下一輪的匯出按鈕重新出現。
+    只供效能檢查在每一輪之間使用，正式頁面的匯出依資料版本淘汰。
+    """
+    registry = _get_export_registry()
+    with registry['lock']:
+        jobs = list(registry['jobs'].values())
+        registry['jobs'].clear()
+    for job in jobs:
+        job.wait()
+
+# ============================================
+# 執行與統計
+# ============================================
+def _page_queries(before, page):
+    """before 之後由 page 發出的查詢（QueryRecord.page 為「檔名:行號」）"""
+    stats = get_query_stats()
+    count = stats.query_count - before
+    records = list(stats.recent)[-count:] if count else []
+    return [record for record in records if record.page.startswith(f"{page}:")]
+
+def run_scenario(page, steps, ctx, timeout):
+    """執行一輪操作，回傳 {步驟名稱: (毫秒, 查詢數)}；步驟發生例外時丟出 RuntimeError"""
+    at = AppTest.from_file(str(PAGES_DIR / page), default_timeout=timeout)
+    stats = get_query_stats()
+    results = {}
+    for name, action in steps:
+        if action is not None:
+            action(at, ctx)
+        before = stats.query_count
+        started = time.perf_counter()
+        at.run()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if at.exception:
+            raise RuntimeError(f"{page}「{name}」發生例外：{at.exception[0].message}")
+        results[name] = (elapsed_ms, len(_page_queries(before, page)))
+    return results
+
+def percentile(values, fraction):
+    """最近排名法的百分位數"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+def measure(pages, ctx, repeat, timeout, cold=False):
+    """每個頁面執行 repeat 輪，回傳 {頁面: {步驟: {'p50_ms', 'p95_ms', 'queries'}}}"""
+    report = {}
+    for page in pages:
+        samples = {}
+        for _ in range(repeat):
+            if cold:
+                get_query_cache().invalidate(*TABLES)
+            discard_exports()
+            warm_capability_checks()
+            for name, sample in run_scenario(page, SCENARIOS[page], ctx, timeout).items():
+                samples.setdefault(name, []).append(sample)
+        discard_exports()
+
+        report[page] = {}
+        for name, values in samples.items():
+            times = [elapsed for elapsed, _ in values]
+            report[page][name] = {
+                'p50_ms': round(statistics.median(times), 1),
+                'p95_ms': round(percentile(times, 0.95), 1),
+                # 第一輪（快取未命中）的查詢數最多，以最大值比較
+                'queries': max(queries for _, queries in values),
+            }
+            step = report[page][name]
+            print(f"   {page:<16}{name:<12}p50 {step['p50_ms']:>8.1f} ms   p95 {step['p95_ms']:>8.1f} ms"
+                  f"   {step['queries']:>3} 次查詢")
+    return report
+
+def compare(report, baseline, tolerance=TOLERANCE, slack_ms=SLACK_MS):
+    """回傳超過基準的 [(頁面, 步驟, 說明)]"""
+    regressions = []
+    for page, steps in report.items():
+        for name, step in steps.items():
+            base = baseline.get(page, {}).get(name)
+            if base is None:
+                continue
+            limit = base['p95_ms'] * (1 + tolerance) + slack_ms
+            if step['p95_ms'] > limit:
+                regressions.append((page, name, f"p95 {step['p95_ms']:.1f} ms > 上限 {limit:.1f} ms（基準 {base['p95_ms']:.1f} ms）"))
+            if step['queries'] > base['queries']:
+                regressions.append((page, name, f"查詢數 {step['queries']} > 基準 {base['queries']}"))
+    return regressions
+
+def main(argv=None):
+    import psycopg
+    from db_config import get_database_config
+
+    parser = argparse.ArgumentParser(description="頁面重新執行延遲的回歸檢查（AppTest）")
+    parser.add_argument('--page', nargs='+', choices=SCENARIOS, default=list(SCENARIOS), help="只測試指定頁面")
+    parser.add_argument('--repeat', type=int, default=10, help="每個頁面執行的輪數（預設 10）")
+    parser.add_argument('--cold', action='store_true', help="每一輪開始前讓查詢快取失效")
+    parser.add_argument('--timeout', type=float, default=60, help="單次 rerun 的逾時秒數")
+    parser.add_argument('--search', default="宏達科技", help="搜尋步驟使用的關鍵字")
+    parser.add_argument('--seed-scale', choices=SCALES, help="先載入指定規模的合成資料（會清空資料表）")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FILE, help="基準檔（預設 rerun_baseline.json）")
+    parser.add_argument('--update-baseline', action='store_true', help="以這次的結果更新基準檔")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="p95 容許變慢的比例（預設 0.25）")
+    parser.add_argument('--output', type=Path, help="另外把結果寫成 JSON")
+    args = parser.parse_args(argv)
+
+    if args.seed_scale:
+        print(f"📦 載入 {args.seed_scale} 規模資料...")
+        with psycopg.connect(**get_database_config(), autocommit=True) as conn:
+            load_synthetic_data(conn, scale_counts(args.seed_scale))
+
+    ctx = {'search_term': args.search, 'selections': first_rows(args.page)}
+    report = measure(args.page, ctx, max(args.repeat, 1), args.timeout, args.cold)
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8')) if args.baseline.exists() else {}
+        baseline.update(report)
+        args.baseline.write_text(json.dumps(baseline, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"✅ 已更新基準檔 {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"⚠️ 沒有基準檔 {args.baseline}；請先以 --update-baseline 建立")
+        return 0
+    regressions = compare(report, json.loads(args.baseline.read_text(encoding='utf-8')), args.tolerance)
+    for page, name, message in regressions:
+        print(f"❌ {page}「{name}」：{message}")
+    print(f"{'❌' if regressions else '✅'} {len(regressions)} 項超過基準")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+每日匯總表（migrations/0004）的一致性檢查與修復
+
+    python rollups.py            # 比對匯總表與原始資料，列出不一致的日期
+    python rollups.py --repair   # 有不一致時鎖定原始資料表並重建該匯總表
+"""
+import argparse
+import sys
+
+# 匯總表 → (鍵欄位, 數值欄位, 由原始資料計算的 view, 原始資料表)
+ROLLUPS = {
+    'ar_daily_rollup': (
+        ['day', 'ar_type', 'payment_status'],
+        ['row_count', 'total_amount', 'total_fee', 'total_received'],
+        'ar_daily_rollup_source',
+        ['ar_leasing', 'ar_buyout'],
+    ),
+    'payable_daily_rollup': (
+        ['day', 'contract_type', 'payable_type', 'payment_status'],
+        ['row_count', 'total_amount'],
+        'payable_daily_rollup_source',
+        ['contracts_leasing', 'contracts_buyout'],
+    ),
+    'bank_ledger_daily_rollup': (
+        ['day'],
+        ['row_count', 'total_income', 'total_expense'],
+        'bank_ledger_daily_rollup_source',
+        ['bank_ledger'],
+    ),
+}
+
+def drift_sql(rollup):
+    """匯總表與原始資料不一致的鍵：[(鍵..., 匯總表數值..., 原始資料數值...)]（筆數為 0 的匯總列視同不存在）"""
+    keys, values, source, _ = ROLLUPS[rollup]
+    return f"""
+        SELECT {', '.join(keys)},
+               {', '.join(f'r.{v}' for v in values)},
+               {', '.join(f's.{v}' for v in values)}
+        FROM (SELECT * FROM {rollup} WHERE row_count <> 0) AS r
+        FULL JOIN {source} AS s USING ({', '.join(keys)})
+        WHERE ({', '.join(f'r.{v}' for v in values)}) IS DISTINCT FROM ({', '.join(f's.{v}' for v in values)})
+        ORDER BY {', '.join(keys)}
+    """
+
+def check_rollup(cur, rollup):
+    cur.execute(drift_sql(rollup))
+    return cur.fetchall()
+
+def repair_rollup(cur, rollup):
+    """鎖定原始資料表（只擋寫入）後重建匯總表，回傳重建後的列數"""
+    _, _, source, tables = ROLLUPS[rollup]
+    cur.execute(f"LOCK TABLE {', '.join(tables)} IN SHARE MODE")
+    cur.execute(f"DELETE FROM {rollup}")
+    cur.execute(f"INSERT INTO {rollup} SELECT * FROM {source}")
+    return cur.rowcount
+
+def check_rollups(conn, repair=False):
+    """檢查所有匯總表（每個匯總表一個交易），回傳不一致的匯總表數量"""
+    drifted = 0
+    for rollup, (keys, values, _, _) in ROLLUPS.items():
+        with conn.transaction(), conn.cursor() as cur:
+            drift = check_rollup(cur, rollup)
+            if not drift:
+                print(f"✅ {rollup}")
+                continue
+
+            drifted += 1
+            print(f"❌ {rollup}：{len(drift)} 個鍵不一致")
+            for row in drift[:20]:
+                key = row[:len(keys)]
+                rollup_values = row[len(keys):len(keys) + len(values)]
+                source_values = row[len(keys) + len(values):]
+                print(f"      {key}: 匯總表 {rollup_values} / 原始資料 {source_values}")
+
+            if repair:
+                rows = repair_rollup(cur, rollup)
+                # 重建時已鎖定原始資料表，重建後應完全一致
+                remaining = check_rollup(cur, rollup)
+                print(f"   🔧 已重建（{rows} 列）{'，仍有不一致！' if remaining else ''}")
+    return drifted
+
+def main(argv=None):
+    import psycopg
+    from db_config import get_database_config
+
+    parser = argparse.ArgumentParser(description="每日匯總表一致性檢查")
+    parser.add_argument('--repair', action='store_true', help="重建不一致的匯總表")
+    args = parser.parse_args(argv)
+
+    with psycopg.connect(**get_database_config()) as conn:
+        conn.autocommit = True
+        drifted = check_rollups(conn, repair=args.repair)
+    return 1 if drifted and not args.repair else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import streamlit as st
+from db_config import get_cursor
+
+# 搜尋結果最多回傳筆數（依相似度排序）
+SEARCH_LIMIT = 500
+
+# 資料表 → migrations/0008 中對應的搜尋文字函式（皆有 pg_trgm GIN 索引）
+SEARCH_TEXT_FUNCTIONS = {
+    'customers': 'customers_search_text',
+    'companies': 'companies_search_text',
+    'contracts_leasing': 'contracts_leasing_search_text',
+    'contracts_buyout': 'contracts_buyout_search_text',
+    'ar_leasing': 'ar_leasing_search_text',
+    'ar_buyout': 'ar_buyout_search_text',
+    'bank_ledger': 'bank_ledger_search_text',
+}
+
+@st.cache_resource(show_spinner=False, ttl=600)
+def has_trgm_search():
+    """資料庫是否已安裝 pg_trgm 與搜尋函式（每個行程檢查一次，10 分鐘後重新確認）"""
+    try:
+        with get_cursor() as cur:
+            cur.execute("""
+                SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+                   AND to_regprocedure('bank_ledger_search_text(bank_ledger)') IS NOT NULL
+            """)
+            return bool(cur.fetchone()[0])
+    except Exception:
+        return False
+
+def normalize_term(term):
+    """搜尋字串正規化（去除前後空白、轉小寫），與搜尋文字函式的 lower() 一致"""
+    return (term or "").strip().lower()
+
+def like_pattern(term):
+    """轉成 ILIKE 子字串樣式（跳脫 \\ % _）"""
+    escaped = normalize_term(term).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def search_params(term):
+    """search_condition() / search_rank() 使用的具名參數"""
+    return {'search_pattern': like_pattern(term), 'search_term': normalize_term(term)}
+
+def search_condition(table, alias=None):
+    """
+    回傳 WHERE 條件：搜尋文字 ILIKE %(search_pattern)s（可使用 GIN 三元組索引）。
+    alias 為 FROM 子句中的資料表別名。
+    """
+    return f"{SEARCH_TEXT_FUNCTIONS[table]}({alias or table}) ILIKE %(search_pattern)s"
+
+def search_rank(table, alias=None):
+    """回傳排序用的相似度運算式（數值越大越相關）"""
+    return f"word_similarity(%(search_term)s, {SEARCH_TEXT_FUNCTIONS[table]}({alias or table}))"
+
+def ranked_search_sql(branches, descending=False):
+    """
+    在各查詢分支（pagination.KeysetBranch）中搜尋，依相關度排序並限制筆數。
+    相關度相同時依第一個分支的排序欄位排序；結果最後一欄為相關度，參數需包含 search_params()。
+    """
+    parts = [
+        f"SELECT {branch.select}, {search_rank(branch.table)} AS rank "
+        f"FROM {branch.table} {branch.joins} WHERE ({branch.where}) AND {search_condition(branch.table)}"
+        for branch in branches
+    ]
+    return (" UNION ALL ".join(parts)
+            + f" ORDER BY rank DESC, {branches[0].sort_column} {'DESC' if descending else 'ASC'}"
+            + f" LIMIT {SEARCH_LIMIT}")
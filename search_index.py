@@ -0,0 +1,189 @@
+import threading
+import pandas as pd
+import streamlit as st
+from db_config import fetch_all
+from query_cache import get_query_cache
+from search import normalize_term
+
+# 欄位之間的分隔字元（避免搜尋字串跨欄位比對成功）
+FIELD_SEPARATOR = '\x1f'
+
+# 資料表 → (鍵欄位, 查詢)；查詢第一欄為主鍵 id、第二欄為鍵，其餘欄位組成搜尋文字
+# （與 migrations/0008 的 *_search_text 相同）。合約以 contract_code 為鍵，但異動通知只帶 id，
+# 因此每個查詢都取出 id，增量更新時以 id 重新讀取資料列
+INDEX_SOURCES = {
+    'customers': ('id', """
+        SELECT id, id, customer_code, name, contact_name, mobile, phone,
+               address, email, tax_id, sales_rep_name, remark
+        FROM customers
+    """),
+    'companies': ('id', """
+        SELECT id, id, company_code, name, contact_name, mobile, phone,
+               address, email, tax_id, sales_rep
+        FROM companies
+    """),
+    'contracts_leasing': ('contract_code', """
+        SELECT id, contract_code, '租賃', contract_code, customer_code, customer_name, start_date,
+               model, quantity, monthly_rent, payment_cycle_months, overprint, contract_months,
+               sales_company_code, sales_amount, service_company_code, service_amount
+        FROM contracts_leasing
+    """),
+    'contracts_buyout': ('contract_code', """
+        SELECT id, contract_code, '買斷', contract_code, customer_code, customer_name, deal_date,
+               deal_amount, sales_company_code, sales_amount, service_company_code, service_amount
+        FROM contracts_buyout
+    """),
+    'ar_leasing': ('id', """
+        SELECT id, id, '租賃', contract_code, customer_code, customer_name, start_date, end_date,
+               total_rent, fee, received_amount, payment_status
+        FROM ar_leasing
+    """),
+    'ar_buyout': ('id', """
+        SELECT id, id, '買斷', contract_code, customer_code, customer_name, deal_date,
+               total_amount, fee, received_amount, payment_status
+        FROM ar_buyout
+    """),
+    'bank_ledger': ('id', """
+        SELECT id, id, txn_date, payer, expense, income, note
+        FROM bank_ledger
+    """),
+}
+
+def index_sql(table, changed_rows=False):
+    """索引資料的查詢；changed_rows=True 時只讀取 id = ANY(%(ids)s) 的資料列"""
+    _, sql = INDEX_SOURCES[table]
+    return f"{sql} WHERE id = ANY(%(ids)s)" if changed_rows else sql
+
+def build_search_texts(rows):
+    """
+    把查詢結果轉成 (鍵 → 小寫搜尋文字, 主鍵 id → 鍵) 兩個 Series（逐欄向量化串接）。
+    rows 的第一欄為主鍵、第二欄為鍵，其餘欄位以 FIELD_SEPARATOR 串接。
+    """
+    if not rows:
+        return pd.Series([], dtype=object), pd.Series([], dtype=object)
+
+    frame = pd.DataFrame(rows)
+    parts = [frame[col].astype(str).where(frame[col].notna(), '') for col in frame.columns[2:]]
+    texts = parts[0].str.cat(parts[1:], sep=FIELD_SEPARATOR).str.lower()
+    keys = pd.Index(frame[1].values)
+    return pd.Series(texts.values, index=keys), pd.Series(keys, index=pd.Index(frame[0].values))
+
+def text_bigrams(text):
+    """取出文字中所有字元二元組（不跨欄位）"""
+    grams = set()
+    for part in text.split(FIELD_SEPARATOR):
+        grams.update(part[i:i + 2] for i in range(len(part) - 1))
+    return grams
+
+class NgramSearchIndex:
+    """記憶體內的字元二元組反向索引（鍵 → 搜尋文字，二元組 → 鍵集合）"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.texts = pd.Series([], dtype=object)
+        self.row_keys = pd.Series([], dtype=object)     # 主鍵 id → 鍵
+        self.postings = {}
+        self.version = None
+
+    def sync(self, texts, row_keys, version=None):
+        """與最新的全部搜尋文字比對，只重新索引新增、修改、刪除的資料列；回傳異動筆數"""
+        with self.lock:
+            old = self.texts
+            removed = old.index.difference(texts.index)
+            added = texts.index.difference(old.index)
+            common = texts.index.intersection(old.index)
+            changed = common[texts.loc[common].values != old.loc[common].values]
+
+            self._reindex(old.loc[removed.append(changed)], texts.loc[added.append(changed)])
+            self.texts = texts
+            self.row_keys = row_keys
+            self.version = version
+            return len(added) + len(changed) + len(removed)
+
+    def refresh_rows(self, ids, texts, row_keys, version=None):
+        """
+        只更新主鍵在 ids 中的資料列；texts / row_keys 為以這些 id 重新查詢的結果，
+        查不到的 id 視為已刪除。回傳異動筆數
+        """
+        with self.lock:
+            stale_ids = self.row_keys.index.intersection(pd.Index(list(ids)))
+            stale = self.texts.index.intersection(
+                pd.Index(self.row_keys.loc[stale_ids].values).append(texts.index))
+
+            self._reindex(self.texts.loc[stale], texts)
+            self.texts = pd.concat([self.texts.drop(stale), texts])
+            self.row_keys = pd.concat([self.row_keys.drop(stale_ids), row_keys])
+            self.version = version
+            return len(stale) + len(texts.index.difference(stale))
+
+    def _reindex(self, old_texts, new_texts):
+        """從二元組索引移除 old_texts、加入 new_texts"""
+        for key, text in old_texts.items():
+            for gram in text_bigrams(text):
+                keys = self.postings.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.postings[gram]
+
+        for key, text in new_texts.items():
+            for gram in text_bigrams(text):
+                self.postings.setdefault(gram, set()).add(key)
+
+    def search(self, term):
+        """回傳搜尋文字包含 term 的鍵（Index）"""
+        term = normalize_term(term)
+        with self.lock:
+            texts = self.texts
+            grams = text_bigrams(term)
+            if grams:
+                # 取交集（從最短的 posting list 開始），再用向量化字串比對確認
+                postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set(postings[0])
+                for keys in postings[1:]:
+                    if not candidates:
+                        break
+                    candidates &= keys
+                if not candidates:
+                    return texts.index[:0]
+                texts = texts.loc[list(candidates)]
+
+        # 單一字元無法使用二元組索引，直接比對全部文字
+        return texts.index[texts.str.contains(term, regex=False).values]
+
+@st.cache_resource(show_spinner=False)
+def _get_registry():
+    """整個伺服器行程共用的索引表（資料表 → NgramSearchIndex）"""
+    return {'lock': threading.Lock(), 'indexes': {}}
+
+def get_search_index(table):
+    """
+    取得資料表的搜尋索引；資料版本改變時（寫入後）增量更新：
+    快取異動記錄有主鍵時（其他行程寫入的 NOTIFY）只重新讀取這些資料列，否則重新讀取整個資料表比對
+    """
+    registry = _get_registry()
+    with registry['lock']:
+        index = registry['indexes'].setdefault(table, NgramSearchIndex())
+
+    with index.lock:
+        cache = get_query_cache()
+        version = cache.version(table)
+        if index.version != version:
+            ids = cache.changed_rows(table, index.version) if index.version is not None else None
+            if ids is None:
+                texts, row_keys = build_search_texts(fetch_all(index_sql(table)))
+                index.sync(texts, row_keys, version)
+            else:
+                rows = fetch_all(index_sql(table, changed_rows=True), {'ids': sorted(ids)}) if ids else []
+                texts, row_keys = build_search_texts(rows)
+                index.refresh_rows(ids, texts, row_keys, version)
+    return index
+
+def match_mask(df, table, term, key_column=None):
+    """回傳 df 中符合搜尋字串的布林遮罩（依資料表的記憶體索引比對）"""
+    matched = get_search_index(table).search(term)
+    return df[key_column or INDEX_SOURCES[table][0]].isin(matched)
+
+def filter_with_index(df, table, term, key_column=None):
+    """未安裝 pg_trgm 時的搜尋：用記憶體索引篩選 df"""
+    return df[match_mask(df, table, term, key_column)]
@@ -0,0 +1,286 @@
+"""
+效能測試用的合成資料：以 COPY 載入指定規模的客戶、公司、合約、應收帳款與銀行帳本
+
+資料庫需先以 database.sql 建立（可已套用 migrations/）。載入時會清空既有資料，只能用於本機測試資料庫。
+租賃應收帳款由 ar_schedule.leasing_ar_rows 產生（與 generate_leasing_ar 相同的排程），
+已到期的帳款大部分標記為已收款；銀行收入的匯款人與金額取自客戶與租金，讓對帳與搜尋有可比對的資料。
+
+    python synthetic_data.py --scale small --replace             # 1,000 客戶、10,000 租賃合約、20 萬筆帳本
+    python synthetic_data.py --scale large --replace             # 10,000 客戶、100,000 租賃合約、200 萬筆帳本
+    python synthetic_data.py --scale small --ledger 500000 --replace   # 覆寫個別數量
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from ar_schedule import AR_LEASING_COLUMNS, leasing_ar_rows
+from rollups import ROLLUPS, repair_rollup
+
+# 規模 → 各資料表筆數
+SCALES = {
+    'small': {'customers': 1_000, 'companies': 50, 'leasing': 10_000, 'buyout': 2_000, 'ledger': 200_000},
+    'medium': {'customers': 5_000, 'companies': 100, 'leasing': 50_000, 'buyout': 10_000, 'ledger': 1_000_000},
+    'large': {'customers': 10_000, 'companies': 200, 'leasing': 100_000, 'buyout': 20_000, 'ledger': 2_000_000},
+}
+
+# 載入時清空的資料表（reconciliation_matches 等參照這些資料表的記錄由 CASCADE 一併清除）
+TABLES = ['customers', 'companies', 'contracts_leasing', 'contracts_buyout',
+          'ar_leasing', 'ar_buyout', 'service_expense', 'bank_ledger']
+
+CUSTOMER_COLUMNS = ('customer_code', 'name', 'contact_name', 'mobile', 'phone', 'address',
+                    'email', 'tax_id', 'sales_rep_name', 'remark')
+COMPANY_COLUMNS = ('company_code', 'name', 'contact_name', 'mobile', 'phone', 'address',
+                   'email', 'tax_id', 'sales_rep', 'is_sales', 'is_service')
+LEASING_COLUMNS = ('contract_code', 'customer_code', 'customer_name', 'start_date', 'model', 'quantity',
+                   'monthly_rent', 'payment_cycle_months', 'overprint', 'contract_months',
+                   'sales_company_code', 'sales_amount', 'service_company_code', 'service_amount',
+                   'sales_payment_status', 'service_payment_status')
+BUYOUT_COLUMNS = ('contract_code', 'customer_code', 'customer_name', 'deal_date', 'deal_amount',
+                  'sales_company_code', 'sales_amount', 'service_company_code', 'service_amount',
+                  'sales_payment_status', 'service_payment_status')
+AR_BUYOUT_COLUMNS = ('contract_code', 'customer_code', 'customer_name', 'deal_date',
+                     'total_amount', 'fee', 'received_amount', 'payment_status')
+LEDGER_COLUMNS = ('txn_date', 'payer', 'expense', 'income', 'note')
+
+# 每寫入幾筆回報一次進度
+PROGRESS_ROWS = 100_000
+
+SURNAMES = "陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周徐蘇葉莊呂江何蕭羅高"
+GIVEN_NAMES = "志明俊傑家豪建宏淑芬美玲雅婷怡君宗翰冠宇承恩柏翰佳穎欣怡詩涵宜蓁"
+NAME_PREFIXES = ["宏達", "永豐", "大同", "信義", "中興", "新光", "台聯", "華南", "東元", "聯合",
+                 "國泰", "長春", "光明", "富邦", "合作", "正新", "和泰", "統一", "遠東", "建成"]
+INDUSTRIES = ["科技", "實業", "貿易", "企業", "工程", "設計", "會計師事務所", "診所", "補習班", "建設"]
+COMPANY_SUFFIXES = ["股份有限公司", "有限公司", "商行", ""]
+CITIES = ["台北市", "新北市", "桃園市", "台中市", "台南市", "高雄市", "新竹市", "基隆市"]
+ROADS = ["中山路", "中正路", "民生路", "復興路", "忠孝東路", "和平路", "建國路", "成功路"]
+MODELS = ["Ricoh IM C3000", "Ricoh IM C4500", "Canon iR-ADV C5535", "Canon iR 2625",
+          "Sharp MX-3571", "Kyocera TASKalfa 3253ci", "Fuji Apeos C3060", "Konica bizhub C300i"]
+OVERPRINTS = [None, "黑白 0.3 元/張", "彩色 3 元/張", "黑白 0.25 元、彩色 2.5 元"]
+EXPENSE_PAYEES = ["台灣電力公司", "中華電信", "房租", "薪資", "勞健保", "碳粉採購", "零件採購", "運費"]
+SALES_REPS = [surname + given for surname, given in zip("陳林黃張李王吳劉蔡楊", "志明家豪淑芬雅婷冠宇")]
+
+def _person(rng):
+    return rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES) + rng.choice(GIVEN_NAMES)
+
+def _organization(rng, number):
+    # 加上編號避免重名，名稱搜尋仍可用前綴 / 產業比對
+    return f"{rng.choice(NAME_PREFIXES)}{rng.choice(INDUSTRIES)}{number}{rng.choice(COMPANY_SUFFIXES)}"
+
+def _contact(rng):
+    mobile = f"09{rng.randint(0, 99_999_999):08d}"
+    phone = f"0{rng.randint(2, 8)}-{rng.randint(2_000_000, 89_999_999)}"
+    address = f"{rng.choice(CITIES)}{rng.choice(ROADS)}{rng.randint(1, 300)}號{rng.randint(1, 20)}樓"
+    return mobile, phone, address, f"{rng.randint(10_000_000, 99_999_999)}"
+
+def _random_date(rng, start, days):
+    return start + timedelta(days=rng.randrange(days))
+
+def customer_rows(rng, count):
+    for i in range(1, count + 1):
+        mobile, phone, address, tax_id = _contact(rng)
+        yield (f"C{i:06d}", _organization(rng, i), _person(rng), mobile, phone, address,
+               f"c{i:06d}@example.com", tax_id, rng.choice(SALES_REPS),
+               "VIP" if rng.random() < 0.05 else None)
+
+def company_rows(rng, count):
+    for i in range(1, count + 1):
+        mobile, phone, address, tax_id = _contact(rng)
+        # 前半為業務公司、後半為維護公司，約一成兩者皆是
+        is_sales = i <= count // 2 or rng.random() < 0.1
+        yield (f"M{i:04d}", _organization(rng, i), _person(rng), mobile, phone, address,
+               f"m{i:04d}@example.com", tax_id, rng.choice(SALES_REPS), is_sales, not is_sales or rng.random() < 0.2)
+
+def _payment_status(rng, settled, paid_rate=0.9):
+    """出帳狀況：已結清的合約大部分已付款"""
+    if settled and rng.random() < paid_rate:
+        return '已付款'
+    return '部分付款' if rng.random() < 0.05 else '未付款'
+
+def leasing_contract_rows(rng, count, customers, sales_companies, service_companies, start, days, today):
+    for i in range(1, count + 1):
+        customer_code, customer_name = rng.choice(customers)
+        start_date = _random_date(rng, start, days)
+        monthly_rent = Decimal(rng.randrange(1500, 12001, 500))
+        yield (f"L{i:07d}", customer_code, customer_name, start_date, rng.choice(MODELS),
+               rng.choice([1, 1, 1, 2, 3]), monthly_rent, rng.choice([1, 1, 1, 1, 2, 3, 3, 6, 12]),
+               rng.choice(OVERPRINTS), rng.choice([12, 24, 36, 36, 48, 60]),
+               rng.choice(sales_companies), Decimal(rng.randrange(0, 20001, 1000)),
+               rng.choice(service_companies), Decimal(rng.randrange(0, 5001, 500)),
+               _payment_status(rng, start_date < today - timedelta(days=60)),
+               _payment_status(rng, start_date < today - timedelta(days=60)))
+
+def buyout_contract_rows(rng, count, customers, sales_companies, service_companies, start, days, today):
+    for i in range(1, count + 1):
+        customer_code, customer_name = rng.choice(customers)
+        deal_date = _random_date(rng, start, days)
+        yield (f"B{i:07d}", customer_code, customer_name, deal_date, Decimal(rng.randrange(20000, 300001, 1000)),
+               rng.choice(sales_companies), Decimal(rng.randrange(0, 30001, 1000)),
+               rng.choice(service_companies), Decimal(rng.randrange(0, 10001, 500)),
+               _payment_status(rng, deal_date < today - timedelta(days=30)),
+               _payment_status(rng, deal_date < today - timedelta(days=30)))
+
+def _settle(rng, amount, due_date, today):
+    """(已收金額, 繳費狀況)：已到期的帳款約九成已收款、少數部分收款"""
+    if due_date < today:
+        roll = rng.random()
+        if roll < 0.9:
+            return amount, '已收款'
+        if roll < 0.95:
+            return (amount / 2).quantize(Decimal('0.01')), '部分收款'
+    return 0, '未收'
+
+def leasing_receivable_rows(rng, contracts, today):
+    """各租賃合約的應收帳款（ar_schedule.leasing_ar_rows 的排程），依到期與否標記收款"""
+    for contract in contracts:
+        (contract_code, customer_code, customer_name, start_date, _, _, monthly_rent,
+         payment_cycle_months, _, contract_months, *_) = contract
+        for row in leasing_ar_rows(contract_code, customer_code, customer_name, start_date,
+                                   monthly_rent, payment_cycle_months, contract_months):
+            received_amount, payment_status = _settle(rng, row[5], row[3], today)
+            yield (*row[:7], received_amount, payment_status)
+
+def buyout_receivable_rows(rng, contracts, today):
+    """每份買斷合約一筆應收帳款（同合約資料頁面的 generate_buyout_ar）"""
+    for contract_code, customer_code, customer_name, deal_date, deal_amount, *_ in contracts:
+        received_amount, payment_status = _settle(rng, deal_amount, deal_date + timedelta(days=30), today)
+        yield (contract_code, customer_code, customer_name, deal_date, deal_amount, 0, received_amount, payment_status)
+
+def ledger_rows(rng, count, customers, companies, rents, start, days):
+    """銀行帳本：約七成為客戶匯入的租金 / 貨款，其餘為支出"""
+    for _ in range(count):
+        txn_date = _random_date(rng, start, days)
+        if rng.random() < 0.7:
+            payer = rng.choice(customers)[1]
+            income = rng.choice(rents) if rng.random() < 0.8 else Decimal(rng.randrange(500, 100001, 100))
+            yield (txn_date, payer, 0, income, "租金" if rng.random() < 0.3 else None)
+        else:
+            if rng.random() < 0.5:
+                payer = rng.choice(EXPENSE_PAYEES)
+            else:
+                payer = rng.choice(companies)[1]
+            yield (txn_date, payer, Decimal(rng.randrange(100, 50001, 10)), 0, None)
+
+def _copy(cur, table, columns, rows, progress=None):
+    """以 COPY 寫入資料列，回傳筆數"""
+    count = 0
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            count += 1
+            if progress and count % PROGRESS_ROWS == 0:
+                progress(table, count)
+    if progress:
+        progress(table, count)
+    return count
+
+def load_synthetic_data(conn, counts, seed=0, years=5, today=None, progress=None):
+    """
+    清空資料表後載入合成資料（單一交易）；counts 為 SCALES 的格式。
+    載入期間停用資料表上的觸發器（避免逐筆通知與更新匯總），完成後重建每日匯總表、清除餘額期初值並通知各資料表異動。
+    progress(資料表, 已寫入筆數) 用於回報進度；回傳 {資料表: 筆數}。
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    days = 365 * years
+    start = today - timedelta(days=days)
+    loaded = {}
+
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+        for table in TABLES:
+            cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+
+        customers = list(customer_rows(rng, counts['customers']))
+        loaded['customers'] = _copy(cur, 'customers', CUSTOMER_COLUMNS, customers, progress)
+        companies = list(company_rows(rng, counts['companies']))
+        loaded['companies'] = _copy(cur, 'companies', COMPANY_COLUMNS, companies, progress)
+
+        customer_names = [row[:2] for row in customers]
+        sales_companies = [row[0] for row in companies if row[9]]
+        service_companies = [row[0] for row in companies if row[10]]
+        leasing = list(leasing_contract_rows(rng, counts['leasing'], customer_names, sales_companies,
+                                             service_companies, start, days, today))
+        loaded['contracts_leasing'] = _copy(cur, 'contracts_leasing', LEASING_COLUMNS, leasing, progress)
+        buyout = list(buyout_contract_rows(rng, counts['buyout'], customer_names, sales_companies,
+                                           service_companies, start, days, today))
+        loaded['contracts_buyout'] = _copy(cur, 'contracts_buyout', BUYOUT_COLUMNS, buyout, progress)
+
+        loaded['ar_leasing'] = _copy(cur, 'ar_leasing', AR_LEASING_COLUMNS,
+                                     leasing_receivable_rows(rng, leasing, today), progress)
+        loaded['ar_buyout'] = _copy(cur, 'ar_buyout', AR_BUYOUT_COLUMNS,
+                                    buyout_receivable_rows(rng, buyout, today), progress)
+
+        rents = sorted({row[6] * row[7] for row in leasing}) or [Decimal(1000)]
+        loaded['bank_ledger'] = _copy(cur, 'bank_ledger', LEDGER_COLUMNS,
+                                      ledger_rows(rng, counts['ledger'], customer_names, companies, rents, start, days),
+                                      progress)
+
+        for table in TABLES:
+            cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+
+        # 觸發器停用期間的異動：重建 migrations/0004 的匯總表、清除 0007 的期初餘額
+        for rollup in ROLLUPS:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (rollup,))
+            if cur.fetchone()[0]:
+                repair_rollup(cur, rollup)
+        cur.execute("SELECT to_regclass('bank_ledger_balance_checkpoints') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("DELETE FROM bank_ledger_balance_checkpoints")
+
+        # 觸發器停用期間沒有逐筆通知：每個資料表送出一次，讓執行中的應用程式清除查詢快取
+        for table in TABLES:
+            cur.execute("SELECT pg_notify('table_changes', json_build_object('table', %s::text, 'op', 'TRUNCATE')::text)",
+                        (table,))
+
+    conn.execute(f"ANALYZE {', '.join(TABLES)}")
+    return loaded
+
+def table_counts(conn):
+    """各資料表目前的筆數"""
+    with conn.cursor() as cur:
+        counts = {}
+        for table in TABLES:
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cur.fetchone()[0]
+        return counts
+
+def scale_counts(scale, overrides=None):
+    """規模名稱 → 各資料表筆數（overrides 中不為 None 的值覆寫預設）"""
+    counts = dict(SCALES[scale])
+    counts.update({name: value for name, value in (overrides or {}).items() if value is not None})
+    return counts
+
+def main(argv=None):
+    import psycopg
+    from db_config import get_database_config
+
+    parser = argparse.ArgumentParser(description="載入效能測試用的合成資料（會清空既有資料）")
+    parser.add_argument('--scale', choices=SCALES, default='small', help="資料規模（預設 small）")
+    for name in SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, help=f"覆寫 {name} 筆數")
+    parser.add_argument('--seed', type=int, default=0, help="隨機種子（相同種子產生相同資料）")
+    parser.add_argument('--years', type=int, default=5, help="資料涵蓋的年數（到今天為止）")
+    parser.add_argument('--replace', action='store_true', help="資料表已有資料時仍清空並載入")
+    args = parser.parse_args(argv)
+
+    counts = scale_counts(args.scale, {name: getattr(args, name) for name in SCALES['small']})
+    with psycopg.connect(**get_database_config(), autocommit=True) as conn:
+        existing = sum(table_counts(conn).values())
+        if existing and not args.replace:
+            print(f"❌ 資料表已有 {existing:,} 筆資料；確認要清空時請加上 --replace")
+            return 1
+
+        def report(table, rows):
+            print(f"\r{table}：已寫入 {rows:,} 筆", end='', flush=True)
+
+        started = time.perf_counter()
+        loaded = load_synthetic_data(conn, counts, seed=args.seed, years=args.years, progress=report)
+    print(f"\n✅ 已載入（{time.perf_counter() - started:.1f} 秒）")
+    for table, rows in loaded.items():
+        print(f"   {table}: {rows:,}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
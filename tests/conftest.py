@@ -0,0 +1,30 @@
+"""
+測試共用設定：需要資料庫的測試使用 db_config 的連線設定（DB_* 環境變數，資料庫需已套用 migrations/），
+連不上資料庫時略過。每個測試在交易中執行，結束後 rollback，不會留下任何資料。
+"""
+import sys
+from pathlib import Path
+import psycopg
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db_config import get_database_config
+
+
+@pytest.fixture(scope='session')
+def database_config():
+    config = get_database_config()
+    try:
+        psycopg.connect(**config, connect_timeout=3).close()
+    except psycopg.OperationalError as e:
+        pytest.skip(f"無法連線資料庫：{e}")
+    return config
+
+
+@pytest.fixture
+def conn(database_config):
+    """交易中的連線（測試結束後 rollback）"""
+    with psycopg.connect(**database_config) as connection:
+        yield connection
+        connection.rollback()
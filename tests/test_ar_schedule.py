@@ -0,0 +1,92 @@
+from datetime import date
+from ar_schedule import (compare_with_database, leasing_ar_rows, leasing_periods, random_cases,
+                         regenerate_leasing_ar, regenerate_leasing_ar_server, write_leasing_ar)
+
+
+def test_periods_chain_from_previous_end_date():
+    # 下一期的起始日 = 本期結束日 + 1天：月底起始的合約會逐期落在較短月份的日期
+    assert leasing_periods(date(2024, 1, 31), 100, 1, 3) == [
+        (date(2024, 1, 31), date(2024, 2, 28), 100),
+        (date(2024, 2, 29), date(2024, 3, 28), 100),
+        (date(2024, 3, 29), date(2024, 4, 28), 100),
+    ]
+
+
+def test_remaining_months_form_last_period():
+    assert leasing_periods(date(2024, 1, 1), 100, 3, 7) == [
+        (date(2024, 1, 1), date(2024, 3, 31), 300),
+        (date(2024, 4, 1), date(2024, 6, 30), 300),
+        (date(2024, 7, 1), date(2024, 7, 31), 100),
+    ]
+
+
+def test_database_function_matches(conn):
+    assert compare_with_database(conn, random_cases(2000, seed=0)) == []
+
+
+def test_write_leasing_ar_returns_changed_ids(conn):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO contracts_leasing (contract_code, start_date) VALUES ('TEST-S001', '2024-01-01')")
+        rows = leasing_ar_rows('TEST-S001', None, 'X', date(2024, 1, 1), 100, 1, 2)
+        first = write_leasing_ar(cur, 'TEST-S001', rows)
+        assert len(first) == 2
+        second = write_leasing_ar(cur, 'TEST-S001', rows[:1])
+        cur.execute("SELECT id FROM ar_leasing WHERE contract_code = 'TEST-S001'")
+        (current,) = cur.fetchall()
+        # 刪除的舊帳款與新增的帳款都要回傳，搜尋索引才會移除舊資料列
+        assert second == first | {current[0]}
+
+
+def _regenerate_fixture(cur):
+    """三期的合約：第一期已收款、第二期已對帳、第三期未收但有手續費"""
+    cur.execute("""
+        INSERT INTO contracts_leasing (contract_code, customer_name, start_date, monthly_rent,
+                                       payment_cycle_months, contract_months)
+        VALUES ('TEST-S002', 'X', '2024-01-01', 100, 1, 3)
+    """)
+    rows = leasing_ar_rows('TEST-S002', None, 'X', date(2024, 1, 1), 100, 1, 3)
+    write_leasing_ar(cur, 'TEST-S002', rows)
+    cur.execute("SELECT id FROM ar_leasing WHERE contract_code = 'TEST-S002' ORDER BY start_date")
+    first, second, third = [row[0] for row in cur.fetchall()]
+    cur.execute("UPDATE ar_leasing SET received_amount = 100, payment_status = '已收款' WHERE id = %s", (first,))
+    cur.execute("UPDATE ar_leasing SET fee = 5 WHERE id = %s", (third,))
+    cur.execute("INSERT INTO bank_ledger (txn_date, income) VALUES ('2024-02-01', 100) RETURNING id")
+    cur.execute("""
+        INSERT INTO reconciliation_matches (bank_ledger_id, ar_type, ar_id, amount, similarity)
+        VALUES (%s, '租賃', %s, 100, 1)
+    """, (cur.fetchone()[0], second))
+    # 月租金調整後重新產生
+    cur.execute("UPDATE contracts_leasing SET monthly_rent = 200 WHERE contract_code = 'TEST-S002'")
+    return first, second
+
+
+def _schedule(cur):
+    cur.execute("""
+        SELECT id, start_date, total_rent, fee, received_amount, payment_status::text
+        FROM ar_leasing WHERE contract_code = 'TEST-S002' ORDER BY start_date
+    """)
+    return cur.fetchall()
+
+
+def test_regenerate_keeps_settled_periods(conn):
+    with conn.cursor() as cur:
+        first, second = _regenerate_fixture(cur)
+        result = regenerate_leasing_ar(conn, ['TEST-S002'])
+        assert (result.contracts, result.rows, result.kept) == (1, 1, 2)
+        schedule = _schedule(cur)
+        # 已收款與已對帳的期間原樣保留（對帳紀錄的 ar_id 仍有效），未收的期間依新租金重新產生並沿用手續費
+        assert [row[0] for row in schedule[:2]] == [first, second]
+        assert schedule[0][2:] == (100, 0, 100, '已收款')
+        assert schedule[2][1:] == (date(2024, 3, 1), 200, 5, 0, '未收')
+
+
+def test_server_regenerate_matches(conn):
+    with conn.cursor() as cur:
+        _regenerate_fixture(cur)
+        assert regenerate_leasing_ar_server(conn, ['TEST-S002']) == 1
+        server = [row[1:] for row in _schedule(cur)]
+    conn.rollback()
+    with conn.cursor() as cur:
+        _regenerate_fixture(cur)
+        regenerate_leasing_ar(conn, ['TEST-S002'])
+        assert [row[1:] for row in _schedule(cur)] == server
@@ -0,0 +1,28 @@
+from datetime import date
+from decimal import Decimal
+import pytest
+from balances import CHECKPOINT_OPENING, SCAN_OPENING, balance_sql
+
+LEDGER_ROWS = [
+    (date(2024, 1, 5), Decimal('0'), Decimal('1000')),
+    (date(2024, 1, 20), Decimal('300'), Decimal('0')),
+    (date(2024, 2, 1), Decimal('0'), Decimal('500')),
+    (date(2024, 3, 15), Decimal('200'), Decimal('0')),
+    (date(2024, 3, 15), Decimal('0'), Decimal('50')),
+]
+
+
+@pytest.mark.parametrize('opening', [SCAN_OPENING, CHECKPOINT_OPENING], ids=['scan', 'checkpoint'])
+def test_running_balance(conn, opening):
+    with conn.cursor() as cur:
+        # TRUNCATE 不會觸發期初餘額失效的觸發器，已算好的期初餘額一併清除
+        cur.execute("TRUNCATE bank_ledger, bank_ledger_balance_checkpoints CASCADE")
+        ids = []
+        for txn_date, expense, income in LEDGER_ROWS:
+            cur.execute("INSERT INTO bank_ledger (txn_date, expense, income) VALUES (%s, %s, %s) RETURNING id",
+                        (txn_date, expense, income))
+            ids.append(cur.fetchone()[0])
+
+        # 只查詢後三筆：期初餘額需包含前一個月以前的記錄
+        cur.execute(balance_sql(opening), {'ids': ids[2:]})
+        assert dict(cur.fetchall()) == {ids[2]: Decimal('1200'), ids[3]: Decimal('1000'), ids[4]: Decimal('1050')}
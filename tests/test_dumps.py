@@ -0,0 +1,50 @@
+import csv
+import gzip
+import io
+from datetime import date
+from decimal import Decimal
+import pyarrow.parquet as pq
+import pytest
+from dumps import write_dump
+from exports import LEDGER_EXPORT_HEADER
+
+LEDGER_ROWS = [
+    (date(2024, 3, 1), '甲公司', Decimal('0'), Decimal('1200.50'), '三月租金'),
+    (date(2024, 3, 2), '乙公司', Decimal('350.25'), Decimal('0'), None),
+]
+
+
+@pytest.fixture
+def ledger(conn):
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE bank_ledger CASCADE")
+        cur.executemany(
+            "INSERT INTO bank_ledger (txn_date, payer, expense, income, note) VALUES (%s, %s, %s, %s, %s)",
+            LEDGER_ROWS
+        )
+    return conn
+
+
+def test_csv_round_trip(ledger):
+    output = io.BytesIO()
+    with ledger.cursor() as cur:
+        write_dump(cur, 'bank_ledger', 'csv', {}, output)
+
+    text = gzip.decompress(output.getvalue()).decode('utf-8-sig')
+    header, *rows = list(csv.reader(io.StringIO(text)))
+    assert header == list(LEDGER_EXPORT_HEADER)
+    # 由新到舊；NULL 匯出為空字串
+    assert rows == [
+        ['2024-03-02', '乙公司', '350.25', '0.00', ''],
+        ['2024-03-01', '甲公司', '0.00', '1200.50', '三月租金'],
+    ]
+
+
+def test_parquet_round_trip(ledger):
+    output = io.BytesIO()
+    with ledger.cursor() as cur:
+        write_dump(cur, 'bank_ledger', 'parquet', {}, output)
+
+    table = pq.read_table(io.BytesIO(output.getvalue()))
+    assert table.column_names == list(LEDGER_EXPORT_HEADER)
+    assert [tuple(row.values()) for row in table.to_pylist()] == list(reversed(LEDGER_ROWS))
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+from pathlib import Path
+import pytest
+from streamlit.testing.v1 import AppTest
+import exports
+
+PAGES_DIR = Path(__file__).resolve().parent.parent / 'pages'
+
+# 頁面 → 匯出名稱
+PAGES = {
+    '4_帳款資料查詢.py': 'accounts',
+    '5_銀行帳本查詢.py': 'ledger',
+}
+
+
+@pytest.fixture
+def registry():
+    jobs = exports._get_export_registry()['jobs']
+    jobs.clear()
+    yield jobs
+    for job in list(jobs.values()):
+        job.wait()
+    jobs.clear()
+
+
+def _query(page, day):
+    at = AppTest.from_file(str(PAGES_DIR / page), default_timeout=60)
+    at.run()
+    at.date_input(key='from_date_selector').set_value(day)
+    at.date_input(key='to_date_selector').set_value(day)
+    at.button(key='apply_date_filter').click()
+    at.run()
+    return at
+
+
+def _started_args(registry, name):
+    return [key[1] for key in registry if key[0] == name]
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_export_uses_queried_range(database_config, registry, page):
+    name = PAGES[page]
+    day = date.today() - timedelta(days=30)
+    at = _query(page, day)
+    # 產生 Excel 是另一次 rerun，查詢按鈕已是 False
+    at.button(key=f"{name}_export_start").click()
+    at.run()
+    assert not at.exception
+    assert _started_args(registry, name) == [(day, day)]
+
+    # 清除篩選後恢復匯出全部
+    assert f"{name}_export_range" in at.session_state
+    at.button(key='clear_date_filter').click()
+    at.run()
+    assert f"{name}_export_range" not in at.session_state
+
+
+@pytest.mark.parametrize('page, dataset', [('4_帳款資料查詢.py', 'ar_leasing'), ('5_銀行帳本查詢.py', 'bank_ledger')])
+def test_dump_uses_queried_range(database_config, registry, page, dataset):
+    name = PAGES[page]
+    day = date.today() - timedelta(days=30)
+    at = _query(page, day)
+    at.radio(key=f"{name}_export_format").set_value('csv')
+    at.run()
+    at.button(key=f"dump_{dataset}_csv_export_start").click()
+    at.run()
+    assert not at.exception
+    assert _started_args(registry, f"dump_{dataset}_csv") == [(dataset, 'csv', day, day)]
@@ -0,0 +1,49 @@
+import gc
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import exports
+from exports import ExportJob, MAX_CACHED_EXPORTS, start_export
+
+CONTENT = b'PK' + bytes(range(256)) * 4096
+
+
+def build_file(progress):
+    output = tempfile.SpooledTemporaryFile(max_size=1024)
+    output.write(CONTENT)
+    return output
+
+
+def read(job):
+    with job.open() as data:
+        return data.read()
+
+
+def test_concurrent_reads_from_disk():
+    job = ExportJob(('test', (), 0), build_file, ()).start()
+    job.wait()
+    assert os.path.getsize(job.path) == len(CONTENT)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: read(job), range(32)))
+    assert all(result == CONTENT for result in results)
+
+
+def test_file_removed_with_job():
+    job = ExportJob(('test', (), 0), build_file, ()).start()
+    job.wait()
+    path = job.path
+    del job
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+def test_evicted_job_stays_readable():
+    exports._get_export_registry()['jobs'].clear()
+    first = start_export(('test', (0,), 0), build_file, ())
+    first.wait()
+    for i in range(1, MAX_CACHED_EXPORTS + 2):
+        start_export(('test', (i,), 0), build_file, ()).wait()
+    assert ('test', (0,), 0) not in exports._get_export_registry()['jobs']
+    # 已淘汰但其他 session 仍持有的工作可以繼續下載
+    assert read(first) == CONTENT
+    exports._get_export_registry()['jobs'].clear()
@@ -0,0 +1,29 @@
+import gc
+from datetime import date
+import numpy as np
+import pandas as pd
+from frames import frame_from_rows, read_frame
+
+
+def test_frame_from_rows_types_and_nulls():
+    rows = [(1, date(2024, 1, 31), 100.5, 'a'), (None, None, None, None)]
+    frame = frame_from_rows(rows, ['id', 'date', 'amount', 'note'])
+    assert str(frame['id'].dtype) == 'Int64'
+    assert frame['date'].dtype == np.dtype('datetime64[ns]')
+    assert frame['date'].iloc[0] == pd.Timestamp('2024-01-31')
+    assert pd.isna(frame['date'].iloc[1]) and pd.isna(frame['amount'].iloc[1])
+
+
+def test_read_frame_matches_rows(conn):
+    sql = "SELECT id, txn_date, payer, expense, income FROM bank_ledger ORDER BY id LIMIT 5000"
+    columns = ['id', 'txn_date', 'payer', 'expense', 'income']
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        rows = cur.fetchall()
+    with conn.cursor() as cur:
+        frame = read_frame(cur, sql, None, columns)
+    assert gc.isenabled()
+    assert len(frame) == len(rows)
+    assert frame['id'].tolist() == [row[0] for row in rows]
+    assert [ts.date() for ts in frame['txn_date']] == [row[1] for row in rows]
+    assert frame['income'].fillna(0).tolist() == [float(row[4] or 0) for row in rows]
@@ -0,0 +1,64 @@
+from datetime import date
+from pagination import KEY_WIDTH, page_sql
+from queries import account_branches, ledger_branches
+
+
+def _walk(conn, branches, page_size, descending=False):
+    """以 keyset 逐頁讀完所有資料，回傳各頁的資料列（已去掉排序鍵）"""
+    pages, cursor = [], None
+    with conn.cursor() as cur:
+        while True:
+            sql, params = page_sql(branches, cursor, page_size, descending=descending)
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            if not rows:
+                return pages
+            pages.append([row[:-KEY_WIDTH] for row in rows])
+            cursor = tuple(rows[-1][-KEY_WIDTH:])
+
+
+def test_single_branch_page(conn):
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE bank_ledger CASCADE")
+        cur.execute("""
+            INSERT INTO bank_ledger (txn_date, payer, income)
+            SELECT d, '付款人', 100 FROM unnest(%s::date[]) AS d
+        """, ([date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 2), date(2024, 1, 3), date(2024, 1, 5)],))
+        cur.execute("SELECT id FROM bank_ledger ORDER BY txn_date DESC, id DESC")
+        expected = [row[0] for row in cur.fetchall()]
+
+    pages = _walk(conn, ledger_branches({}), 2, descending=True)
+    assert [[row[0] for row in page] for page in pages] == [expected[0:2], expected[2:4], expected[4:]]
+
+
+def test_two_branch_page(conn):
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE ar_leasing, ar_buyout CASCADE")
+        cur.execute("""
+            INSERT INTO contracts_leasing (contract_code, start_date)
+            VALUES ('TEST-C001', '2024-01-01'), ('TEST-C003', '2024-01-01')
+        """)
+        cur.execute("""
+            INSERT INTO contracts_buyout (contract_code, deal_date)
+            VALUES ('TEST-C002', '2024-02-01'), ('TEST-C003', '2024-02-01')
+        """)
+        cur.execute("""
+            INSERT INTO ar_leasing (contract_code, start_date, end_date, total_rent)
+            VALUES ('TEST-C001', '2024-01-01', '2024-03-31', 3000),
+                   ('TEST-C003', '2024-01-01', '2024-03-31', 3000),
+                   ('TEST-C003', '2024-04-01', '2024-06-30', 3000)
+        """)
+        cur.execute("""
+            INSERT INTO ar_buyout (contract_code, deal_date, total_amount)
+            VALUES ('TEST-C002', '2024-02-01', 50000),
+                   ('TEST-C003', '2024-02-01', 50000)
+        """)
+
+    branches, _ = account_branches("總應收帳款", {})
+    pages = _walk(conn, branches, 2)
+    # 依 (合約編號, 分支, id) 排序：合約編號相同時租賃（第一個分支）在前
+    assert [[(row[2], row[1], row[5]) for row in page] for page in pages] == [
+        [('TEST-C001', '租賃', date(2024, 1, 1)), ('TEST-C002', '買斷', date(2024, 2, 1))],
+        [('TEST-C003', '租賃', date(2024, 1, 1)), ('TEST-C003', '租賃', date(2024, 4, 1))],
+        [('TEST-C003', '買斷', date(2024, 2, 1))],
+    ]
@@ -0,0 +1,93 @@
+import json
+import time
+import psycopg
+from cache_listener import CacheInvalidationListener, NOTIFY_CHANNEL
+from query_cache import CHANGE_LOG_LENGTH, CHANGE_LOG_MAX_ROWS, QueryCache
+
+
+def test_changed_rows_collects_ids_since_version():
+    cache = QueryCache(max_bytes=1024 * 1024)
+    start = cache.version('customers')
+    cache.invalidate_rows({'customers': {1, 2}})
+    middle = cache.version('customers')
+    cache.invalidate_rows({'customers': {3}, 'companies': {9}})
+    assert cache.changed_rows('customers', start) == {1, 2, 3}
+    assert cache.changed_rows('customers', middle) == {3}
+    assert cache.changed_rows('customers', cache.version('customers')) == set()
+
+
+def test_changed_rows_unknown_after_table_invalidation():
+    cache = QueryCache(max_bytes=1024 * 1024)
+    start = cache.version('customers')
+    cache.invalidate_rows({'customers': {1}})
+    cache.invalidate('customers')
+    assert cache.changed_rows('customers', start) is None
+
+    start = cache.version('customers')
+    cache.invalidate_rows({'customers': set(range(CHANGE_LOG_MAX_ROWS + 1))})
+    assert cache.changed_rows('customers', start) is None
+
+    start = cache.version('customers')
+    cache.invalidate_rows({'customers': {1}})
+    cache.clear()
+    assert cache.changed_rows('customers', start) is None
+
+
+def test_changed_rows_unknown_after_log_rotation():
+    cache = QueryCache(max_bytes=1024 * 1024)
+    start = cache.version('customers')
+    for i in range(CHANGE_LOG_LENGTH + 1):
+        cache.invalidate_rows({'customers': {i}})
+    assert cache.changed_rows('customers', start) is None
+
+
+def test_listener_passes_row_ids(database_config):
+    cache = QueryCache(max_bytes=1024 * 1024)
+    listener = CacheInvalidationListener(cache, database_config)
+    listener.start()
+    try:
+        deadline = time.time() + 10
+        while not listener.connected and time.time() < deadline:
+            time.sleep(0.05)
+        assert listener.connected
+        start = cache.version('customers', 'companies')
+
+        with psycopg.connect(**database_config, autocommit=True) as conn:
+            for payload in ({'table': 'customers', 'op': 'UPDATE', 'id': 1},
+                            {'table': 'customers', 'op': 'INSERT', 'id': 2},
+                            {'table': 'companies', 'op': 'TRUNCATE'}):
+                conn.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, json.dumps(payload)))
+
+        while listener.notify_count < 3 and time.time() < deadline:
+            time.sleep(0.05)
+        assert listener.notify_count == 3
+        companies_start, customers_start = start
+        assert cache.changed_rows('customers', (customers_start,)) == {1, 2}
+        assert cache.changed_rows('companies', (companies_start,)) is None
+    finally:
+        listener.stop()
+        listener.join(timeout=5)
+
+
+def test_truncate_triggers_notify_without_id(database_config):
+    with psycopg.connect(**database_config, autocommit=True) as conn:
+        cur = conn.execute("""
+            SELECT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid
+            WHERE t.tgname LIKE '%_notify_change' AND NOT t.tgisinternal
+            EXCEPT
+            SELECT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid
+            WHERE t.tgname LIKE '%_notify_truncate' AND NOT t.tgisinternal
+        """)
+        # 有逐列通知的資料表都要有 TRUNCATE 通知
+        assert cur.fetchall() == []
+
+        conn.execute("LISTEN " + NOTIFY_CHANNEL)
+        with conn.transaction():
+            conn.execute("CREATE TEMP TABLE truncate_notify_test (id INT)")
+            conn.execute("""
+                CREATE TRIGGER truncate_notify_test_notify_truncate AFTER TRUNCATE ON truncate_notify_test
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_table_truncate()
+            """)
+            conn.execute("TRUNCATE truncate_notify_test")
+        payloads = [json.loads(notify.payload) for notify in conn.notifies(timeout=2, stop_after=1)]
+        assert payloads == [{'table': 'truncate_notify_test', 'op': 'TRUNCATE'}]
@@ -0,0 +1,187 @@
+"""
+以測試資料檢查各頁面的分頁與搜尋查詢都使用索引（EXPLAIN 中不得出現循序掃描）。
+
+在單一交易中套用尚未執行的 migration、載入測試資料並 ANALYZE，結束後 ROLLBACK，不會留下任何資料。
+"""
+import json
+from datetime import date
+import psycopg
+import pytest
+from aggregates import with_search
+from migrate import apply_migration, load_migrations, pending_migrations
+from pagination import KEY_WIDTH, page_sql, summary_sql
+from queries import account_branches, ledger_branches, list_query, date_params, LEDGER_COLUMNS
+from search import ranked_search_sql, search_params
+
+# 產生的合約數量（應收帳款為合約數 × 12、銀行帳本為合約數 × 10）
+CONTRACTS = 5000
+
+# 測試資料（代碼皆以 PLANCHECK- 開頭）；以參數執行，% 需寫成 %%
+SYNTHETIC_DATA = [
+    """
+    INSERT INTO customers (customer_code, name)
+    SELECT 'PLANCHECK-C' || lpad(g::text, 6, '0'), '測試客戶' || g FROM generate_series(1, %(contracts)s) g
+    """,
+    """
+    INSERT INTO companies (company_code, name, is_sales, is_service)
+    SELECT 'PLANCHECK-M' || lpad(g::text, 6, '0'), '測試公司' || g, TRUE, TRUE
+    FROM generate_series(1, %(contracts)s) g
+    """,
+    """
+    INSERT INTO contracts_leasing (contract_code, customer_code, customer_name, start_date,
+                                   monthly_rent, payment_cycle_months, contract_months,
+                                   sales_company_code, sales_amount, service_company_code, service_amount,
+                                   sales_payment_status, service_payment_status)
+    SELECT 'PLANCHECK-L' || lpad(g::text, 7, '0'), 'PLANCHECK-C' || lpad((1 + g %% 200)::text, 6, '0'), '測試客戶',
+           DATE '2020-01-01' + g %% 2000, 1000 + g %% 500, 1, 12,
+           'PLANCHECK-M' || lpad((1 + g %% 50)::text, 6, '0'), CASE WHEN g %% 3 = 0 THEN 0 ELSE 500 END,
+           'PLANCHECK-M' || lpad((1 + (g + 7) %% 50)::text, 6, '0'), 300,
+           CASE WHEN g %% 10 = 0 THEN '未付款' ELSE '已付款' END::buyout_payment_status_enum,
+           CASE WHEN g %% 20 = 0 THEN '未付款' ELSE '已付款' END::buyout_payment_status_enum
+    FROM generate_series(1, %(contracts)s) g
+    """,
+    """
+    INSERT INTO contracts_buyout (contract_code, customer_code, customer_name, deal_date, deal_amount,
+                                  sales_company_code, sales_amount, service_company_code, service_amount,
+                                  sales_payment_status, service_payment_status)
+    SELECT 'PLANCHECK-B' || lpad(g::text, 7, '0'), 'PLANCHECK-C' || lpad((1 + g %% 200)::text, 6, '0'), '測試客戶',
+           DATE '2020-01-01' + g %% 2000, 30000 + g %% 1000,
+           'PLANCHECK-M' || lpad((1 + g %% 50)::text, 6, '0'), 1000,
+           'PLANCHECK-M' || lpad((1 + (g + 3) %% 50)::text, 6, '0'), 500,
+           CASE WHEN g %% 10 = 0 THEN '未付款' ELSE '已付款' END::buyout_payment_status_enum,
+           CASE WHEN g %% 20 = 0 THEN '未付款' ELSE '已付款' END::buyout_payment_status_enum
+    FROM generate_series(1, %(contracts)s) g
+    """,
+    """
+    INSERT INTO ar_leasing (contract_code, customer_code, customer_name, start_date, end_date,
+                            total_rent, fee, received_amount, payment_status)
+    SELECT c.contract_code, c.customer_code, c.customer_name,
+           c.start_date + p * 30, c.start_date + p * 30 + 29, c.monthly_rent, 0,
+           CASE WHEN p < 10 THEN c.monthly_rent ELSE 0 END,
+           CASE WHEN p < 10 THEN '已收款' ELSE '未收' END::payment_status_enum
+    FROM contracts_leasing c CROSS JOIN generate_series(0, 11) p
+    WHERE c.contract_code LIKE 'PLANCHECK-%%'
+    """,
+    """
+    INSERT INTO ar_buyout (contract_code, customer_code, customer_name, deal_date,
+                           total_amount, fee, received_amount, payment_status)
+    SELECT contract_code, customer_code, customer_name, deal_date, deal_amount, 0,
+           CASE WHEN id %% 10 = 0 THEN 0 ELSE deal_amount END,
+           CASE WHEN id %% 10 = 0 THEN '未收' ELSE '已收款' END::payment_status_enum
+    FROM contracts_buyout
+    WHERE contract_code LIKE 'PLANCHECK-%%'
+    """,
+    """
+    INSERT INTO bank_ledger (txn_date, payer, expense, income, note)
+    SELECT DATE '2020-01-01' + g %% 2000, 'PLANCHECK-P' || lpad((g %% 3000)::text, 6, '0'),
+           CASE WHEN g %% 4 = 0 THEN 500 ELSE 0 END, CASE WHEN g %% 4 = 0 THEN 0 ELSE 1200 END, 'PLANCHECK'
+    FROM generate_series(1, %(contracts)s * 10) g
+    """,
+]
+
+# 各資料表的搜尋字串（只符合少數資料列）
+SEARCH_TERMS = {
+    'customers': 'planCHECK-C000123',
+    'companies': 'planCHECK-M000123',
+    'contracts_leasing': 'planCHECK-L0001234',
+    'contracts_buyout': 'planCHECK-B0001234',
+    'bank_ledger': 'planCHECK-P000123',
+}
+
+# 使用索引的掃描節點
+INDEX_SCAN_NODES = {'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan'}
+
+DATE_FILTERS = {'全部': {}, '日期篩選': date_params(date(2023, 1, 1), date(2023, 1, 31))}
+AR_TYPES = ["總應收帳款", "總未收帳款", "未出帳款", "已出帳款"]
+
+
+def _views():
+    """分頁的查詢：(名稱, 查詢分支, 由新到舊, 參數)"""
+    for label, params in DATE_FILTERS.items():
+        for ar_type in AR_TYPES:
+            yield f"{ar_type}（{label}）", account_branches(ar_type, params)[0], False, params
+        yield f"銀行帳本（{label}）", ledger_branches(params), True, params
+
+
+def _search_queries():
+    """搜尋的查詢：(名稱, SQL, 參數)"""
+    for table in ['customers', 'companies', 'contracts_leasing', 'contracts_buyout']:
+        yield f"{table} 搜尋", list_query(table, search=True)[0], search_params(SEARCH_TERMS[table])
+
+    for ar_type in AR_TYPES:
+        branches, columns = account_branches(ar_type, {})
+        term = SEARCH_TERMS['contracts_leasing']
+        yield f"{ar_type} 搜尋", ranked_search_sql(branches), search_params(term)
+        branches, params = with_search(branches, {}, term)
+        yield f"{ar_type} 搜尋匯總", summary_sql(branches, columns), params
+
+    term = SEARCH_TERMS['bank_ledger']
+    yield "銀行帳本 搜尋", ranked_search_sql(ledger_branches({}), descending=True), search_params(term)
+    branches, params = with_search(ledger_branches({}), {}, term)
+    yield "銀行帳本 搜尋匯總", summary_sql(branches, LEDGER_COLUMNS), params
+
+
+def plan_scans(plan):
+    """走訪 EXPLAIN (FORMAT JSON) 的計畫樹，回傳各資料表掃描節點 (資料表, 節點類型, 索引名稱)"""
+    if 'Relation Name' in plan:
+        yield plan['Relation Name'], plan['Node Type'], plan.get('Index Name')
+    for child in plan.get('Plans', []):
+        yield from plan_scans(child)
+
+
+def assert_index_scans(cur, sql, params):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = list(plan_scans(plan[0]['Plan']))
+    assert scans
+    bad = [scan for scan in scans if scan[1] not in INDEX_SCAN_NODES]
+    assert not bad, f"未使用索引：{bad}"
+
+
+@pytest.fixture(scope='module')
+def cur(database_config):
+    """已套用 migration 並載入測試資料的 cursor（整個模組共用一個交易，結束後 ROLLBACK）"""
+    with psycopg.connect(**database_config) as conn, conn.cursor() as cursor:
+        for migration in pending_migrations(cursor, load_migrations()):
+            apply_migration(cursor, migration)
+        for statement in SYNTHETIC_DATA:
+            cursor.execute(statement, {'contracts': CONTRACTS})
+        # 新資料列先進 GIN 索引的 pending list，列數多時規劃器會估計成比循序掃描慢；先併入索引
+        cursor.execute("""
+            SELECT gin_clean_pending_list(i.indexrelid)
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_am am ON am.oid = c.relam
+            WHERE am.amname = 'gin'
+        """)
+        cursor.execute("ANALYZE customers, companies, contracts_leasing, contracts_buyout, "
+                       "ar_leasing, ar_buyout, bank_ledger")
+        yield cursor
+        conn.rollback()
+
+
+@pytest.fixture(scope='module')
+def has_trgm(cur):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+    return cur.fetchone()[0]
+
+
+@pytest.mark.parametrize('branches, descending, params',
+                         [pytest.param(*view[1:], id=view[0]) for view in _views()])
+def test_page_uses_index(cur, branches, descending, params):
+    sql, page_params = page_sql(branches, None, 50, descending=descending)
+    assert_index_scans(cur, sql, {**params, **page_params})
+
+    # 用第一頁最後一列的排序鍵產生下一頁的查詢
+    cur.execute(sql, {**params, **page_params})
+    rows = cur.fetchall()
+    if rows:
+        sql, page_params = page_sql(branches, tuple(rows[-1][-KEY_WIDTH:]), 50, descending=descending)
+        assert_index_scans(cur, sql, {**params, **page_params})
+
+
+@pytest.mark.parametrize('sql, params', [pytest.param(*query[1:], id=query[0]) for query in _search_queries()])
+def test_search_uses_index(cur, has_trgm, sql, params):
+    if not has_trgm:
+        pytest.skip("資料庫未安裝 pg_trgm（搜尋改用記憶體索引）")
+    assert_index_scans(cur, sql, params)
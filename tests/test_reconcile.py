@@ -0,0 +1,80 @@
+from datetime import date
+from decimal import Decimal
+from reconcile import MAX_FUZZY_CANDIDATES, Deposit, Match, OpenItem, apply_matches, load_open_items, propose_matches
+
+
+def _item(id, name, day, balance='1000', ar_type='租賃'):
+    return OpenItem(ar_type, id, f"C{id}", name, date(2024, 1, day), Decimal(balance))
+
+
+def test_exact_and_prefix_names_match():
+    items = [_item(1, '大同股份有限公司', 10), _item(2, '台灣電力', 10), _item(3, '中華', 10, '2000')]
+    deposits = [
+        Deposit(1, date(2024, 1, 12), '大同', Decimal('1000.00')),
+        Deposit(2, date(2024, 1, 12), '台灣', Decimal('1000')),
+        Deposit(3, date(2024, 1, 12), '中華電信', Decimal('2000')),
+    ]
+    matches = {m.deposit.id: m for m in propose_matches(deposits, items)}
+    assert {d: (m.item.id, m.similarity) for d, m in matches.items()} == {1: (1, 1.0), 2: (2, 1.0), 3: (3, 1.0)}
+
+
+def test_exact_match_skips_fuzzy_and_date_window():
+    items = [_item(1, '大同', 1), _item(2, '大同', 28), _item(3, '大全', 12)]
+    deposits = [Deposit(1, date(2024, 1, 12), '大同', Decimal('1000'))]
+    # 1/28 超過收入日期後 DAYS_BEFORE 天；名稱相符的 1/1 優先於日期較近但名稱僅相似的 1/12
+    assert [m.item.id for m in propose_matches(deposits, items)] == [1]
+    # 時間窗內沒有名稱相符的帳款時才模糊比對
+    assert [m.item.id for m in propose_matches(deposits, items, days_after=5)] == [3]
+
+
+def test_fuzzy_candidates_are_capped_by_date():
+    # 名稱較相似但日期較遠的帳款不在日期最接近的 MAX_FUZZY_CANDIDATES 筆內，不會被比對
+    far = _item(1, '客戶999甲', 1)
+    near = [_item(100 + i, f"客戶{i:03d}", 12) for i in range(MAX_FUZZY_CANDIDATES)]
+    deposits = [Deposit(1, date(2024, 1, 12), '客戶999號', Decimal('1000'))]
+    assert propose_matches(deposits, [far], min_similarity=0.1)[0].item.id == 1
+    matches = propose_matches(deposits, [far] + near, min_similarity=0.1)
+    assert len(matches) == 1 and matches[0].item.id >= 100
+
+
+def test_each_item_and_deposit_matched_once():
+    items = [_item(1, '大同', 10), _item(2, '大同', 11)]
+    deposits = [Deposit(i, date(2024, 1, 12), '大同', Decimal('1000')) for i in (1, 2, 3)]
+    matches = propose_matches(deposits, items)
+    assert sorted(m.item.id for m in matches) == [1, 2]
+    assert len({m.deposit.id for m in matches}) == 2
+
+
+def test_load_open_items_limits_dates_and_balance(conn):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO contracts_leasing (contract_code, start_date) VALUES ('TEST-R001', '1990-01-01')")
+        cur.execute("""
+            INSERT INTO ar_leasing (contract_code, start_date, end_date, total_rent, received_amount)
+            VALUES ('TEST-R001', '1990-01-01', '1990-01-31', 1000, 0),
+                   ('TEST-R001', '1990-03-01', '1990-03-31', 1000, 0),
+                   ('TEST-R001', '1990-03-10', '1990-03-31', 1000, 1000),
+                   ('TEST-R001', '1990-06-01', '1990-06-30', 1000, 0)
+        """)
+        deposits = [Deposit(1, date(1990, 3, 20), 'X', Decimal('1000')),
+                    Deposit(2, date(1990, 4, 10), 'X', Decimal('1000'))]
+        items = [item for item in load_open_items(cur, deposits, days_before=15, days_after=60)
+                 if item.contract_code == 'TEST-R001']
+        assert [(item.due_date, item.balance) for item in items] == [(date(1990, 3, 1), 1000)]
+        assert load_open_items(cur, []) == []
+
+
+def test_apply_matches_updates_item(conn):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO contracts_leasing (contract_code, start_date) VALUES ('TEST-R002', '1990-01-01')")
+        cur.execute("""
+            INSERT INTO ar_leasing (contract_code, start_date, end_date, total_rent, received_amount, updated_at)
+            VALUES ('TEST-R002', '1990-01-01', '1990-01-31', 1000, 0, '2000-01-01') RETURNING id
+        """)
+        item_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO bank_ledger (txn_date, payer, income) VALUES ('1990-01-05', 'X', 1000) RETURNING id")
+        deposit = Deposit(cur.fetchone()[0], date(1990, 1, 5), 'X', Decimal('1000'))
+        item = OpenItem('租賃', item_id, 'TEST-R002', 'X', date(1990, 1, 1), Decimal('1000'))
+        assert apply_matches(conn, [Match(deposit, item, 1.0, 1.0)]) == 1
+        cur.execute("SELECT received_amount, payment_status, updated_at > '2000-01-01' FROM ar_leasing WHERE id = %s",
+                    (item_id,))
+        assert cur.fetchone() == (1000, '已收款', True)
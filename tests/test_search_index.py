@@ -0,0 +1,54 @@
+import search_index
+from query_cache import QueryCache
+from search_index import NgramSearchIndex, build_search_texts, get_search_index
+
+CONTRACTS = [
+    (1, 'LC-001', '租賃', 'LC-001', 'C001', '台北影印'),
+    (2, 'LC-002', '租賃', 'LC-002', 'C002', '高雄文具'),
+    (3, 'LC-003', '租賃', 'LC-003', 'C003', '台中印刷'),
+]
+
+
+def test_refresh_rows_matches_full_rebuild():
+    index = NgramSearchIndex()
+    index.sync(*build_search_texts(CONTRACTS))
+    # 修改 id 1 的合約編號、刪除 id 2、新增 id 4
+    changed = [(1, 'LC-101', '租賃', 'LC-101', 'C001', '台北影印'),
+               (4, 'LC-004', '租賃', 'LC-004', 'C004', '新竹文具')]
+    index.refresh_rows({1, 2, 4}, *build_search_texts(changed))
+
+    rebuilt = NgramSearchIndex()
+    rebuilt.sync(*build_search_texts([changed[0], CONTRACTS[2], changed[1]]))
+    assert index.texts.sort_index().equals(rebuilt.texts.sort_index())
+    assert index.row_keys.sort_index().equals(rebuilt.row_keys.sort_index())
+    assert index.postings == rebuilt.postings
+    assert list(index.search('文具')) == ['LC-004']
+    assert list(index.search('lc-001')) == []
+
+
+def test_notified_ids_refetch_only_changed_rows(monkeypatch):
+    cache = QueryCache(max_bytes=1024 * 1024)
+    registry = {'lock': search_index.threading.Lock(), 'indexes': {}}
+    calls = []
+    rows = list(CONTRACTS)
+
+    def fetch_all(sql, params=None):
+        calls.append(params)
+        if params is None:
+            return rows
+        return [row for row in rows if row[0] in params['ids']]
+
+    monkeypatch.setattr(search_index, 'get_query_cache', lambda: cache)
+    monkeypatch.setattr(search_index, '_get_registry', lambda: registry)
+    monkeypatch.setattr(search_index, 'fetch_all', fetch_all)
+
+    assert list(get_search_index('contracts_leasing').search('文具')) == ['LC-002']
+    rows[2] = (3, 'LC-003', '租賃', 'LC-003', 'C003', '台中文具')
+    cache.invalidate_rows({'contracts_leasing': {3}})
+    assert sorted(get_search_index('contracts_leasing').search('文具')) == ['LC-002', 'LC-003']
+    assert calls == [None, {'ids': [3]}]
+
+    # 不知道異動哪些資料列時重新讀取整個資料表
+    cache.invalidate('contracts_leasing')
+    get_search_index('contracts_leasing')
+    assert calls[-1] is None